@@ -0,0 +1,500 @@
+# 読み込み・スキャン・並べ替え・表示の処理時間を計測し、結果をJSONで出力する
+#
+#   python benchmarks/benchmark_pipeline.py --output result.json
+#   python benchmarks/benchmark_pipeline.py --compare before.json after.json
+#
+# Qtはoffscreenで動かし、設定とキャッシュは一時ディレクトリに置く（実際の設定には触れない）
+# 改善前のコミットとも比べられるよう、後から追加されたAPIがない場合はその計測を省くか、元の処理で代替する
+import argparse
+import inspect
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+SRC_DIR = REPO_DIR / 'src'
+
+# (形式, 幅, 高さ, 全体に占める割合)
+IMAGE_VARIANTS = [
+    ('jpg', 640, 480, 0.45),
+    ('jpg', 1920, 1080, 0.2),
+    ('jpg', 4000, 3000, 0.05),
+    ('png', 800, 600, 0.15),
+    ('png', 2560, 1440, 0.05),
+    ('gif', 320, 240, 0.1),
+]
+TREE_FANOUT = 4
+TREE_DEPTH = 3
+DISPLAY_SIZES = [(1280, 800), (1920, 1080), (800, 600)]
+DISPLAY_SAMPLE = 60
+GIF_FRAMES = 4
+
+
+def _prepare_environment(work_dir: Path):
+    # SettingsManagerはホームディレクトリの下に設定を作るため、一時ディレクトリに向ける
+    home = work_dir / 'home'
+    home.mkdir(parents=True, exist_ok=True)
+    os.environ['HOME'] = str(home)
+    os.environ['USERPROFILE'] = str(home)
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    sys.path.insert(0, str(SRC_DIR))
+
+
+def _summarize(samples: List[float], extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    ordered = sorted(samples)
+    result = {
+        'unit': 'ms',
+        'runs': [round(s, 3) for s in samples],
+        'min': round(ordered[0], 3),
+        'median': round(statistics.median(ordered), 3),
+        'mean': round(statistics.mean(ordered), 3),
+        'p95': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+    }
+    if extra:
+        result.update(extra)
+    return result
+
+
+def _time_ms(function: Callable[[], Any]) -> float:
+    start = time.perf_counter()
+    function()
+    return (time.perf_counter() - start) * 1000
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(['git', '-C', str(REPO_DIR), 'rev-parse', '--short', 'HEAD'],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def _encode_gif(width: int, height: int, frames: int) -> bytes:
+    # QtはGIFを書き出せないため、4色のアニメーションGIFを直接組み立てる
+    # 2画素ごとにクリアコードを入れ、LZWの符号長を3ビットのまま保つ
+    out = bytearray(b'GIF89a' + struct.pack('<HHBBB', width, height, 0xF1, 0, 0))
+    out += bytes([0, 0, 0, 255, 64, 64, 64, 255, 64, 64, 64, 255])
+    out += b'!\xff\x0bNETSCAPE2.0\x03\x01\x00\x00\x00'
+    for frame in range(frames):
+        out += b'!\xf9\x04\x00' + struct.pack('<H', 10) + b'\x00\x00'
+        out += b',' + struct.pack('<HHHHB', 0, 0, width, height, 0)
+        row = [((x + frame * 8) // 8) % 4 for x in range(width)]
+        bits = 0
+        count = 0
+        data = bytearray()
+        for y in range(height):
+            pixels = row[y % 8:] + row[:y % 8]
+            for i in range(0, width, 2):
+                for code in [4] + pixels[i:i + 2]:
+                    bits |= code << count
+                    count += 3
+                    if count >= 8:
+                        data.append(bits & 0xff)
+                        bits >>= 8
+                        count -= 8
+        bits |= 5 << count
+        count += 3
+        while count > 0:
+            data.append(bits & 0xff)
+            bits >>= 8
+            count -= 8
+        out.append(2)
+        for i in range(0, len(data), 255):
+            chunk = data[i:i + 255]
+            out += bytes([len(chunk)]) + chunk
+        out += b'\x00'
+    out += b';'
+    return bytes(out)
+
+
+class Corpus:
+    # 同じ形式・解像度の画像は一度だけエンコードし、バイト列を複製して大量のファイルを作る
+    def __init__(self, root: Path, image_count: int, seed: int = 0):
+        self.root = root
+        self.image_count = image_count
+        self.files: List[Path] = []
+        self.directories: List[Path] = []
+        self._random = random.Random(seed)
+
+    def generate(self):
+        from PyQt6.QtCore import Qt, QBuffer, QIODevice, QPointF
+        from PyQt6.QtGui import QImage, QPainter, QLinearGradient, QColor
+
+        templates: List[Tuple[str, bytes]] = []
+        weights = []
+        for image_format, width, height, weight in IMAGE_VARIANTS:
+            weights.append(weight)
+            if image_format == 'gif':
+                templates.append((image_format, _encode_gif(width, height, GIF_FRAMES)))
+                continue
+            image = QImage(width, height, QImage.Format.Format_RGB32)
+            painter = QPainter(image)
+            gradient = QLinearGradient(QPointF(0, 0), QPointF(width, height))
+            gradient.setColorAt(0, QColor(self._random.randrange(256), 64, 160))
+            gradient.setColorAt(1, QColor(32, self._random.randrange(256), 96))
+            painter.fillRect(image.rect(), gradient)
+            painter.setPen(Qt.GlobalColor.white)
+            for _ in range(200):
+                painter.drawLine(self._random.randrange(width), self._random.randrange(height),
+                                 self._random.randrange(width), self._random.randrange(height))
+            painter.end()
+
+            buffer = QBuffer()
+            buffer.open(QIODevice.OpenModeFlag.WriteOnly)
+            image.save(buffer, image_format.upper())
+            templates.append((image_format, bytes(buffer.data())))
+
+        self.directories = self._make_tree()
+        for i in range(self.image_count):
+            image_format, data = self._random.choices(templates, weights)[0]
+            directory = self.directories[i % len(self.directories)]
+            path = directory / f'img-{i}.{image_format}'
+            path.write_bytes(data)
+            self.files.append(path)
+
+    def _make_tree(self) -> List[Path]:
+        directories = [self.root]
+        level = [self.root]
+        for depth in range(TREE_DEPTH):
+            next_level = []
+            for parent in level:
+                for i in range(TREE_FANOUT):
+                    child = parent / f'dir-{depth}-{i}'
+                    child.mkdir(parents=True)
+                    next_level.append(child)
+            directories.extend(next_level)
+            level = next_level
+        return directories
+
+
+def make_synthetic_paths(count: int, root: str = os.sep) -> List[str]:
+    # 既定では実在しないパスの一覧（ソートと一覧の保持だけを計測する）
+    paths = []
+    per_directory = 1000
+    for i in range(count):
+        d = i // per_directory
+        paths.append(os.path.join(root, 'data', f'shoot-{d // 100}', f'roll {d % 100}',
+                                  f'IMG_{i % per_directory:04d}-v{i % 7}.jpg'))
+    return paths
+
+
+def create_empty_files(paths: List[str]):
+    # set_image_filesは存在しないファイルを除くため、中身のないファイルとして実際に作る
+    directories = set()
+    for path in paths:
+        directory = os.path.dirname(path)
+        if directory not in directories:
+            os.makedirs(directory, exist_ok=True)
+            directories.add(directory)
+        os.close(os.open(path, os.O_WRONLY | os.O_CREAT, 0o644))
+
+
+def _wait_for(app, condition: Callable[[], bool], timeout: float = 600.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError('benchmark step timed out')
+        app.processEvents()
+        time.sleep(0.001)
+
+
+def bench_scan(app, corpus: Corpus, work_dir: Path, repeat: int) -> Dict[str, Any]:
+    # main()と同じDirectoryScannerで、一覧が揃うまでの時間を計る（初回はインデックスなし）
+    try:
+        from directory_scanner import DirectoryScanner
+    except ImportError:
+        return _bench_scan_glob(corpus, repeat)
+
+    results = {}
+    index_file = work_dir / 'bench_index.db'
+    for label in ('cold', 'warm'):
+        samples = []
+        found = 0
+        runs = 1 if label == 'cold' else repeat
+        for _ in range(runs):
+            if label == 'cold' and index_file.exists():
+                index_file.unlink()
+            scanner = DirectoryScanner(index_file)
+            finished = []
+            scanner.scan_finished.connect(finished.append)
+            start = time.perf_counter()
+            scanner.start([corpus.root], True)
+            _wait_for(app, lambda: bool(finished))
+            samples.append((time.perf_counter() - start) * 1000)
+            found = finished[0]
+            scanner.shutdown()
+        results[f'scan_recursive_{label}'] = _summarize(samples, {'files': found})
+    return results
+
+
+def _bench_scan_glob(corpus: Corpus, repeat: int) -> Dict[str, Any]:
+    # DirectoryScannerがない版では、ディレクトリを開いたときと同じくglobしてから一覧に渡す
+    from file_dialog_manager import FileDialogManager
+    from image_list_manager import ImageListManager
+
+    results = {}
+    for label in ('cold', 'warm'):
+        samples = []
+        found = 0
+        for _ in range(1 if label == 'cold' else repeat):
+            manager = ImageListManager()
+            start = time.perf_counter()
+            manager.set_image_files(FileDialogManager.get_directory_files(corpus.root, True))
+            samples.append((time.perf_counter() - start) * 1000)
+            found = len(manager.get_image_files())
+        results[f'scan_recursive_{label}'] = _summarize(samples, {'files': found})
+    return results
+
+
+def bench_list_manager(corpus: Corpus, synthetic_paths: List[str], existing_paths: List[str],
+                       repeat: int) -> Dict[str, Any]:
+    from image_list_manager import ImageListManager
+    from natural_sort import natural_path_sort_key
+
+    results = {}
+    shuffled = list(corpus.files)
+    random.Random(1).shuffle(shuffled)
+    results['set_image_files'] = _summarize(
+        [_time_ms(lambda: ImageListManager().set_image_files(shuffled)) for _ in range(repeat)],
+        {'files': len(shuffled)}
+    )
+
+    # 前回の一覧を復元するときと同じく、大量のパスを順不同のまま渡す
+    unsorted_files = list(existing_paths)
+    random.Random(4).shuffle(unsorted_files)
+    managers = []
+
+    def set_large():
+        manager = ImageListManager()
+        manager.set_image_files(unsorted_files)
+        managers.append(manager)
+
+    results['set_image_files_paths'] = _summarize(
+        [_time_ms(set_large) for _ in range(repeat)], {'paths': len(unsorted_files)}
+    )
+    assert len(managers[-1].get_image_files()) == len(unsorted_files)
+    managers.clear()
+
+    unsorted_paths = list(synthetic_paths)
+    random.Random(2).shuffle(unsorted_paths)
+    results['natural_sort'] = _summarize(
+        [_time_ms(lambda: sorted(unsorted_paths, key=natural_path_sort_key)) for _ in range(repeat)],
+        {'paths': len(unsorted_paths)}
+    )
+
+    if not hasattr(ImageListManager, 'add_scanned_files'):
+        return results
+
+    # スキャン中と同じく、自然順のバッチを順に追加する
+    def add_in_batches():
+        manager = ImageListManager()
+        for i in range(0, len(synthetic_paths), 5000):
+            manager.add_scanned_files(synthetic_paths[i:i + 5000])
+        return manager
+
+    results['add_scanned_batches'] = _summarize(
+        [_time_ms(add_in_batches) for _ in range(repeat)], {'paths': len(synthetic_paths)}
+    )
+
+    manager = add_in_batches()
+    step = max(1, len(synthetic_paths) // 1000)
+    extra = [p.replace('.jpg', '-extra.jpg') for p in synthetic_paths[::step]]
+    results['add_files_interleaved'] = _summarize(
+        [_time_ms(lambda: manager.add_scanned_files(list(extra)))],
+        {'paths': len(synthetic_paths), 'added': len(extra)}
+    )
+    return results
+
+
+def bench_display(app, corpus: Corpus) -> Dict[str, Any]:
+    from image_display_manager import ImageDisplayManager
+    try:
+        from image_canvas import ImageCanvas
+    except ImportError:
+        # ImageCanvasがない版はQLabelに表示する
+        from PyQt6.QtWidgets import QLabel as ImageCanvas
+
+    canvas = ImageCanvas()
+    canvas.resize(*DISPLAY_SIZES[0])
+    canvas.show()
+    app.processEvents()
+    display_manager = ImageDisplayManager(canvas)
+    stop_animation = getattr(display_manager, 'stop_animation', lambda: None)
+
+    # 描画はイベントループで行われるため、計測ではその場で描画させる
+    def displayed(function: Callable[[], Any]) -> Callable[[], None]:
+        def run():
+            function()
+            canvas.repaint()
+        return run
+
+    sample = random.Random(3).sample(corpus.files, min(DISPLAY_SAMPLE, len(corpus.files)))
+    results = {}
+    by_format: Dict[str, List[float]] = {}
+    uncached = []
+    for path in sample:
+        elapsed = _time_ms(displayed(lambda: display_manager.load_and_display_image(path)))
+        uncached.append(elapsed)
+        by_format.setdefault(path.suffix[1:], []).append(elapsed)
+        stop_animation()
+    results['load_and_display_uncached'] = _summarize(uncached, {'images': len(sample)})
+    for image_format, samples in sorted(by_format.items()):
+        results[f'load_and_display_uncached_{image_format}'] = _summarize(samples)
+
+    if hasattr(display_manager, 'display_cached_image'):
+        cached = []
+        for path in sample:
+            cached.append(_time_ms(displayed(lambda: display_manager.display_cached_image(path))))
+            stop_animation()
+        results['display_cached'] = _summarize(cached, {'images': len(sample)})
+
+    # リサイズ中の仮描画と、止まった後の描き直し、左右反転の切り替え
+    has_fast = 'fast' in inspect.signature(display_manager.refresh_display).parameters
+    fast, settled, flip = [], [], []
+    for path in sample[:20]:
+        display_manager.load_and_display_image(path)
+        for width, height in DISPLAY_SIZES:
+            canvas.resize(width, height)
+            if has_fast:
+                fast.append(_time_ms(displayed(lambda: display_manager.refresh_display(fast=True))))
+            settled.append(_time_ms(displayed(display_manager.refresh_display)))
+            flip.append(_time_ms(displayed(display_manager.toggle_h_flip)))
+        stop_animation()
+    if fast:
+        results['resize_refresh_fast'] = _summarize(fast)
+    results['resize_refresh_settled'] = _summarize(settled)
+    results['h_flip_toggle'] = _summarize(flip)
+
+    if hasattr(display_manager, 'shutdown'):
+        display_manager.shutdown()
+    canvas.close()
+    return results
+
+
+def bench_settings(synthetic_paths: List[str], repeat: int) -> Dict[str, Any]:
+    from settings_manager import SettingsManager
+
+    results = {}
+    # 改善前のsave_recent_filesはPathを受け取る
+    paths = [Path(p) for p in synthetic_paths[:100_000]]
+
+    def save():
+        settings_manager = SettingsManager()
+        settings_manager.save_recent_files(paths, len(paths) // 2)
+        settings_manager.save_window_geometry(10, 20, 1280, 800)
+
+    def load():
+        settings_manager = SettingsManager()
+        settings_manager.get_window_geometry()
+        files = settings_manager.get_recent_files()
+        assert len(files) == len(paths)
+
+    results['settings_save'] = _summarize([_time_ms(save) for _ in range(repeat)], {'files': len(paths)})
+    results['settings_load'] = _summarize([_time_ms(load) for _ in range(repeat)], {'files': len(paths)})
+    return results
+
+
+BENCHMARK_GROUPS = ('scan', 'list', 'display', 'settings')
+
+
+def run(args) -> Dict[str, Any]:
+    work_dir = Path(args.work_dir) if args.work_dir else Path(tempfile.mkdtemp(prefix='image-view-bench-'))
+    _prepare_environment(work_dir)
+
+    from PyQt6.QtCore import PYQT_VERSION_STR, QT_VERSION_STR
+    from PyQt6.QtWidgets import QApplication
+
+    app = QApplication.instance() or QApplication([])
+    groups = args.only.split(',') if args.only else list(BENCHMARK_GROUPS)
+    results: Dict[str, Any] = {}
+    try:
+        corpus = Corpus(work_dir / 'corpus', args.images)
+        generate_ms = _time_ms(corpus.generate)
+        print(f"corpus: {len(corpus.files)} files in {len(corpus.directories)} directories "
+              f"({generate_ms:.0f} ms)", file=sys.stderr)
+        synthetic_paths = make_synthetic_paths(args.paths)
+
+        if 'scan' in groups:
+            results.update(bench_scan(app, corpus, work_dir, args.repeat))
+        if 'list' in groups:
+            existing_paths = make_synthetic_paths(args.paths, str(work_dir / 'paths'))
+            create_ms = _time_ms(lambda: create_empty_files(existing_paths))
+            print(f"paths: {len(existing_paths)} empty files ({create_ms:.0f} ms)", file=sys.stderr)
+            results.update(bench_list_manager(corpus, synthetic_paths, existing_paths, args.repeat))
+        if 'display' in groups:
+            results.update(bench_display(app, corpus))
+        if 'settings' in groups:
+            results.update(bench_settings(synthetic_paths, args.repeat))
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        'meta': {
+            'commit': _git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'pyqt': PYQT_VERSION_STR,
+            'qt': QT_VERSION_STR,
+            'platform': platform.platform(),
+            'qpa': os.environ.get('QT_QPA_PLATFORM', ''),
+            'images': args.images,
+            'paths': args.paths,
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+
+
+def compare(before_file: str, after_file: str):
+    # 中央値の変化を表示する（+は遅くなった）
+    with open(before_file, 'r', encoding='utf-8') as f:
+        before = json.load(f)
+    with open(after_file, 'r', encoding='utf-8') as f:
+        after = json.load(f)
+    print(f"{'benchmark':36} {before['meta'].get('commit', ''):>12} {after['meta'].get('commit', ''):>12}  change")
+    for name, result in after['results'].items():
+        old = before['results'].get(name)
+        if old is None:
+            print(f"{name:36} {'-':>12} {result['median']:>12.2f}")
+            continue
+        change = (result['median'] - old['median']) / old['median'] * 100 if old['median'] else 0.0
+        print(f"{name:36} {old['median']:>12.2f} {result['median']:>12.2f}  {change:+6.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Image viewer pipeline benchmarks')
+    parser.add_argument('--output', help='write the JSON result to this file (default: stdout).')
+    parser.add_argument('--images', type=int, default=3000, help='number of image files to generate.')
+    parser.add_argument('--paths', type=int, default=1_000_000, help='number of synthetic paths for list benchmarks.')
+    parser.add_argument('--repeat', type=int, default=3, help='number of runs per benchmark.')
+    parser.add_argument('--only', help=f'comma separated groups to run ({",".join(BENCHMARK_GROUPS)}).')
+    parser.add_argument('--work-dir', help='generate the corpus here and keep it (default: temporary).')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help='compare two JSON results.')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    result = run(args)
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,234 @@
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+from PyQt6.QtCore import Qt, QObject, QSize, QThread, QTimer, pyqtSignal
+from PyQt6.QtGui import QImage, QPixmap
+
+from image_loader import open_image_reader
+
+
+ANIMATED_EXTENSIONS = {'.gif', '.webp'}
+DEFAULT_ANIMATION_CACHE_BYTES = 64 * 1024 * 1024
+STREAM_AHEAD_FRAMES = 8
+# 表示時間が極端に短いフレームはブラウザと同様に既定値で表示する
+MIN_FRAME_DELAY_MS = 20
+DEFAULT_FRAME_DELAY_MS = 100
+
+
+def is_animation_candidate(image_path: Path) -> bool:
+    # ファイルを開かずに拡張子だけで判定し、実際にアニメーションかはデコードスレッドで確かめる
+    return image_path.suffix.lower() in ANIMATED_EXTENSIONS
+
+
+class _FrameDecodeThread(QThread):
+    # (フレーム数, ループ回数, 全フレームをキャッシュするか)
+    animation_started = pyqtSignal(int, int, bool)
+    # (通し番号, 表示サイズに縮小したフレーム, 表示時間ms)
+    frame_decoded = pyqtSignal(int, QImage, int)
+
+    def __init__(self, image_path: Path, target_size: QSize, cache_bytes: int, parent=None):
+        super().__init__(parent)
+        self._image_path = image_path
+        self._target_size = target_size
+        self._cache_bytes = cache_bytes
+        self._cancelled = False
+        self._played = -1
+        self._condition = threading.Condition()
+
+    def cancel(self):
+        with self._condition:
+            self._cancelled = True
+            self._condition.notify_all()
+
+    def set_played(self, sequence: int):
+        with self._condition:
+            self._played = sequence
+            self._condition.notify_all()
+
+    def run(self):
+        reader = open_image_reader(self._image_path)
+        if not reader.supportsAnimation():
+            return
+        frame_count = reader.imageCount()
+        if frame_count == 1:
+            return
+
+        frame_size = reader.size().scaled(self._target_size, Qt.AspectRatioMode.KeepAspectRatio)
+        frame_bytes = max(1, frame_size.width() * frame_size.height() * 4)
+        # 全フレームが予算内に収まれば一度だけデコードし、収まらなければ少し先まで読みながら流す
+        cache_all = 0 < frame_count * frame_bytes <= self._cache_bytes
+        self.animation_started.emit(frame_count, reader.loopCount(), cache_all)
+
+        sequence = 0
+        frames_in_pass = 0
+        while not self._cancelled:
+            if not cache_all and not self._wait_for_playback(sequence):
+                return
+
+            image = reader.read()
+            if image.isNull():
+                if cache_all or frames_in_pass == 0:
+                    return
+                # 末尾まで読んだら先頭から読み直す
+                reader = open_image_reader(self._image_path)
+                frames_in_pass = 0
+                continue
+
+            if image.size() != frame_size and not frame_size.isEmpty():
+                image = image.scaled(frame_size, Qt.AspectRatioMode.IgnoreAspectRatio,
+                                     Qt.TransformationMode.SmoothTransformation)
+            self.frame_decoded.emit(sequence, image, reader.nextImageDelay())
+            sequence += 1
+            frames_in_pass += 1
+
+    def _wait_for_playback(self, sequence: int) -> bool:
+        # 再生位置よりSTREAM_AHEAD_FRAMES以上先には進まない
+        with self._condition:
+            while not self._cancelled and sequence - self._played > STREAM_AHEAD_FRAMES:
+                self._condition.wait()
+            return not self._cancelled
+
+
+class AnimationPlayer(QObject):
+    frame_ready = pyqtSignal()
+
+    def __init__(self, cache_bytes: int = DEFAULT_ANIMATION_CACHE_BYTES, parent=None):
+        super().__init__(parent)
+        self._cache_bytes = cache_bytes
+        self._image_path: Optional[Path] = None
+        self._target_size = QSize()
+        self._thread: Optional[_FrameDecodeThread] = None
+
+        # キーはフレームの通し番号（全フレームをキャッシュする場合はファイル内の番号と同じ）
+        self._frames: Dict[int, QPixmap] = {}
+        self._delays: Dict[int, int] = {}
+        self._frame_count = 0
+        self._loop_count = -1
+        self._cache_all = False
+        self._decoding_done = False
+        self._position = -1
+        self._loops_played = 0
+        self._waiting = False
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._advance)
+
+    def start(self, image_path: Path, target_size: QSize):
+        # 同じ画像・同じサイズで再生中なら何もしない
+        if image_path == self._image_path and target_size == self._target_size:
+            return
+
+        self.stop()
+        self._image_path = image_path
+        self._target_size = QSize(target_size)
+        thread = _FrameDecodeThread(image_path, target_size, self._cache_bytes, self)
+        thread.animation_started.connect(
+            lambda count, loops, cache_all, t=thread: self._on_animation_started(t, count, loops, cache_all))
+        thread.frame_decoded.connect(
+            lambda sequence, image, delay, t=thread: self._on_frame_decoded(t, sequence, image, delay))
+        thread.finished.connect(lambda t=thread: self._on_thread_finished(t))
+        self._thread = thread
+        thread.start()
+
+    def stop(self):
+        self._timer.stop()
+        if self._thread is not None:
+            self._thread.cancel()
+            self._thread = None
+        self._image_path = None
+        self._frames = {}
+        self._delays = {}
+        self._frame_count = 0
+        self._loop_count = -1
+        self._cache_all = False
+        self._decoding_done = False
+        self._position = -1
+        self._loops_played = 0
+        self._waiting = False
+
+    def get_image_path(self) -> Optional[Path]:
+        return self._image_path
+
+    def get_current_frame(self) -> Optional[QPixmap]:
+        return self._frames.get(self._position)
+
+    def shutdown(self):
+        self.stop()
+        for thread in self.findChildren(_FrameDecodeThread):
+            thread.cancel()
+            thread.wait()
+
+    def _on_animation_started(self, thread: _FrameDecodeThread, frame_count: int,
+                              loop_count: int, cache_all: bool):
+        if thread is not self._thread:
+            return
+        self._frame_count = frame_count
+        self._loop_count = loop_count
+        self._cache_all = cache_all
+
+    def _on_frame_decoded(self, thread: _FrameDecodeThread, sequence: int, image: QImage, delay: int):
+        if thread is not self._thread:
+            return
+        # QPixmapはGUIスレッドでのみ生成できる
+        self._frames[sequence] = QPixmap.fromImage(image)
+        self._delays[sequence] = delay
+        if self._position < 0 or (self._waiting and sequence == self._next_position()):
+            self._show(sequence)
+
+    def _on_thread_finished(self, thread: _FrameDecodeThread):
+        thread.deleteLater()
+        if thread is not self._thread:
+            return
+        self._thread = None
+        self._decoding_done = True
+        if self._cache_all and self._frames:
+            self._frame_count = len(self._frames)
+        if self._waiting:
+            self._advance()
+
+    def _show(self, sequence: int):
+        self._waiting = False
+        self._position = sequence
+        if not self._cache_all:
+            # 流して再生する場合、表示済みのフレームは捨てる
+            for old in [s for s in self._frames if s < sequence]:
+                del self._frames[old]
+                del self._delays[old]
+            if self._thread is not None:
+                self._thread.set_played(sequence)
+
+        self.frame_ready.emit()
+        delay = self._delays[sequence]
+        self._timer.start(delay if delay >= MIN_FRAME_DELAY_MS else DEFAULT_FRAME_DELAY_MS)
+
+    def _next_position(self) -> int:
+        next_position = self._position + 1
+        if self._cache_all and self._decoding_done:
+            return next_position % max(1, self._frame_count)
+        return next_position
+
+    def _is_loop_finished(self, next_position: int) -> bool:
+        # loopCount()は無限なら-1、繰り返さない場合は0
+        if self._loop_count < 0 or self._frame_count <= 0:
+            return False
+        wrapped = (next_position == 0 if self._cache_all else next_position % self._frame_count == 0)
+        return wrapped and self._loops_played >= self._loop_count
+
+    def _advance(self):
+        next_position = self._next_position()
+        if self._is_loop_finished(next_position):
+            # 最後のフレームを表示したまま止める
+            if self._thread is not None:
+                self._thread.cancel()
+            return
+        if next_position not in self._frames:
+            # デコードが追いついていなければ、届いた時点で表示する
+            self._waiting = not (self._decoding_done and self._cache_all)
+            return
+
+        if next_position == 0 or (not self._cache_all and self._frame_count > 0
+                                  and next_position % self._frame_count == 0):
+            self._loops_played += 1
+        self._show(next_position)
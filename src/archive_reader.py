@@ -0,0 +1,293 @@
+import contextlib
+import mmap
+import os
+import posixpath
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple, Union
+
+
+# 圧縮されたtar（.tar.gzなど）は途中から読めないため対象外
+ARCHIVE_EXTENSIONS = {'.zip', '.cbz', '.tar', '.cbt'}
+MAX_OPEN_ARCHIVES = 8
+
+# ZIPのローカルファイルヘッダー（固定長30バイト）
+_LOCAL_HEADER = struct.Struct('<4s5H3L2H')
+_LOCAL_HEADER_SIGNATURE = b'PK\x03\x04'
+
+
+class _ArchiveClosedError(OSError):
+    # プールから追い出されて閉じたアーカイブを読もうとした場合
+    pass
+
+
+@dataclass
+class ArchiveMember:
+    # アーカイブ内のパス（区切りは'/'）
+    name: str
+    size: int
+    mtime_ns: int
+    # 無圧縮で格納されたデータの開始位置（圧縮されていれば-1）
+    offset: int = -1
+
+
+class _OpenArchive:
+    # 開いたアーカイブのファイル・メモリマップ・メンバー一覧をまとめて保持する
+    def __init__(self, archive_path: str):
+        # zipfileとtarfileは起動時には使わないため、アーカイブを開くときに読み込む
+        import tarfile
+        import zipfile
+
+        stat = os.stat(archive_path)
+        self.stat_key = (stat.st_mtime_ns, stat.st_size)
+        self.members: Dict[str, ArchiveMember] = {}
+        self._mmap = None
+        self._zip: Optional[zipfile.ZipFile] = None
+        self._zip_infos: Dict[str, zipfile.ZipInfo] = {}
+        # 読み込み中のスレッドの数。閉じるのは最後の読み込みが終わってから
+        self._lock = threading.Lock()
+        self._readers = 0
+        self._close_requested = False
+        self._closed = False
+        # 途中で失敗した場合は、どの例外でもメモリマップとファイルを閉じる
+        with contextlib.ExitStack() as stack:
+            self._file = stack.enter_context(open(archive_path, 'rb'))
+            if stat.st_size > 0:
+                self._mmap = stack.enter_context(mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ))
+            try:
+                if zipfile.is_zipfile(self._file):
+                    self._load_zip()
+                    stack.callback(self._zip.close)
+                else:
+                    self._file.seek(0)
+                    self._load_tar()
+            except (zipfile.BadZipFile, tarfile.TarError, ValueError) as e:
+                raise OSError(f"{archive_path}: {e}") from e
+            stack.pop_all()
+
+    def read(self, name: str, limit: Optional[int] = None) -> bytes:
+        member = self.members.get(name)
+        if member is None:
+            raise FileNotFoundError(name)
+
+        with self._lock:
+            if self._closed:
+                raise _ArchiveClosedError(name)
+            self._readers += 1
+        try:
+            return self._read_member(name, member, limit)
+        finally:
+            with self._lock:
+                self._readers -= 1
+                if self._close_requested and self._readers == 0:
+                    self._close_files()
+
+    def close(self):
+        # 他のスレッドが読み込み中なら、その読み込みが終わった時点で閉じる
+        with self._lock:
+            self._close_requested = True
+            if self._readers == 0:
+                self._close_files()
+
+    def _close_files(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._zip is not None:
+            self._zip.close()
+        if self._mmap is not None:
+            self._mmap.close()
+        self._file.close()
+
+    def _read_member(self, name: str, member: ArchiveMember, limit: Optional[int]) -> bytes:
+        length = member.size if limit is None else min(limit, member.size)
+        if member.offset >= 0 and self._mmap is not None:
+            # 無圧縮のメンバーはメモリマップから直接切り出す（シークや読み込みの呼び出しが要らない）
+            return self._mmap[member.offset:member.offset + length]
+
+        import zipfile
+        try:
+            with self._zip.open(self._zip_infos[name]) as f:
+                return f.read(length)
+        except (zipfile.BadZipFile, zlib.error, RuntimeError, EOFError) as e:
+            raise OSError(f"{name}: {e}") from e
+
+    def _load_zip(self):
+        # 中央ディレクトリだけを読み、メンバーのデータには触れない
+        import zipfile
+
+        self._zip = zipfile.ZipFile(self._file)
+        for info in self._zip.infolist():
+            if info.is_dir() or info.flag_bits & 0x1:
+                # ディレクトリと暗号化されたメンバーは除く
+                continue
+            name = _normalize_member_name(info.filename)
+            if name is None:
+                continue
+            offset = -1
+            if info.compress_type == zipfile.ZIP_STORED:
+                offset = self._stored_data_offset(info)
+            mtime_ns = int(_zip_time(info.date_time) * 1_000_000_000)
+            self.members[name] = ArchiveMember(name, info.file_size, mtime_ns, offset)
+            self._zip_infos[name] = info
+
+    def _stored_data_offset(self, info: 'zipfile.ZipInfo') -> int:
+        # 拡張フィールドの長さは中央ディレクトリとローカルヘッダーで異なることがあるため、ローカルヘッダーを読む
+        if self._mmap is None:
+            return -1
+        header = self._mmap[info.header_offset:info.header_offset + _LOCAL_HEADER.size]
+        if len(header) < _LOCAL_HEADER.size:
+            return -1
+        fields = _LOCAL_HEADER.unpack(header)
+        if fields[0] != _LOCAL_HEADER_SIGNATURE:
+            return -1
+        name_length, extra_length = fields[-2], fields[-1]
+        return info.header_offset + _LOCAL_HEADER.size + name_length + extra_length
+
+    def _load_tar(self):
+        # tarはヘッダーを順にたどるだけで、データ部分は読み飛ばす（メンバーはすべて無圧縮）
+        import tarfile
+
+        with tarfile.open(fileobj=self._file, mode='r:') as tar:
+            for info in tar:
+                name = _normalize_member_name(info.name)
+                if info.isfile() and name is not None:
+                    self.members[name] = ArchiveMember(
+                        name, info.size, int(info.mtime * 1_000_000_000), info.offset_data
+                    )
+
+
+def _normalize_member_name(name: str) -> Optional[str]:
+    # './a/b.jpg'や'/a/b.jpg'を'a/b.jpg'にそろえ、アーカイブの外を指す名前は除く
+    name = posixpath.normpath(name.replace('\\', '/')).lstrip('/')
+    if name in ('', '.') or name == '..' or name.startswith('../'):
+        return None
+    return name
+
+
+def _zip_time(date_time: Tuple[int, int, int, int, int, int]) -> float:
+    try:
+        return time.mktime(date_time + (0, 0, -1))
+    except (OverflowError, ValueError):
+        return 0.0
+
+
+class ArchivePool:
+    # 開いたアーカイブを使い回し、画像を移動するたびに開き直さないようにする
+    # ワーカースレッドからも呼び出される
+    def __init__(self, max_open: int = MAX_OPEN_ARCHIVES):
+        self._archives: 'OrderedDict[str, _OpenArchive]' = OrderedDict()
+        self._max_open = max_open
+        self._lock = threading.Lock()
+
+    def get(self, archive_path: str) -> _OpenArchive:
+        stat = os.stat(archive_path)
+        with self._lock:
+            archive = self._archives.get(archive_path)
+            if archive is not None and archive.stat_key == (stat.st_mtime_ns, stat.st_size):
+                self._archives.move_to_end(archive_path)
+                return archive
+
+        # 一覧の読み込みは時間がかかることがあるため、ロックの外で開く
+        archive = _OpenArchive(archive_path)
+        evicted = []
+        with self._lock:
+            replaced = self._archives.get(archive_path)
+            if replaced is not None and replaced is not archive:
+                evicted.append(replaced)
+            self._archives[archive_path] = archive
+            self._archives.move_to_end(archive_path)
+            while len(self._archives) > self._max_open:
+                evicted.append(self._archives.popitem(last=False)[1])
+        # 追い出したアーカイブは明示的に閉じる（読み込み中のスレッドがあれば、その完了後に閉じられる）
+        for evicted_archive in evicted:
+            evicted_archive.close()
+        return archive
+
+    def read(self, archive_path: str, name: str, limit: Optional[int] = None) -> bytes:
+        # 取り出した直後に別のスレッドが追い出して閉じた場合は、開き直して読む
+        try:
+            return self.get(archive_path).read(name, limit)
+        except _ArchiveClosedError:
+            return self.get(archive_path).read(name, limit)
+
+    def clear(self):
+        with self._lock:
+            archives = list(self._archives.values())
+            self._archives.clear()
+        for archive in archives:
+            archive.close()
+
+
+_pool = ArchivePool()
+
+
+def is_archive_file(path: Union[str, os.PathLike]) -> bool:
+    return os.path.splitext(path)[1].lower() in ARCHIVE_EXTENSIONS
+
+
+def split_archive_path(path: Union[str, os.PathLike]) -> Optional[Tuple[str, str]]:
+    # '/dir/set.zip/sub/001.jpg' -> ('/dir/set.zip', 'sub/001.jpg')
+    path = os.fspath(path)
+    lower = path.lower()
+    for extension in ARCHIVE_EXTENSIONS:
+        marker = extension + os.sep
+        position = lower.find(marker)
+        while position >= 0:
+            archive_path = path[:position + len(extension)]
+            if os.path.isfile(archive_path):
+                return archive_path, path[position + len(marker):].replace(os.sep, '/')
+            position = lower.find(marker, position + 1)
+    return None
+
+
+def get_member_path(archive_path: str, member_name: str) -> str:
+    return os.path.join(archive_path, *member_name.split('/'))
+
+
+def list_archive_members(archive_path: Union[str, os.PathLike]) -> List[ArchiveMember]:
+    return list(_pool.get(os.fspath(archive_path)).members.values())
+
+
+def stat_image(image_path: Union[str, os.PathLike]) -> Optional[Tuple[int, int]]:
+    # (サイズ, 更新日時ns)。アーカイブ内の画像はメンバーの値を返す
+    try:
+        stat = os.stat(image_path)
+        return stat.st_size, stat.st_mtime_ns
+    except OSError:
+        pass
+
+    location = split_archive_path(image_path)
+    if location is None:
+        return None
+    try:
+        member = _pool.get(location[0]).members.get(location[1])
+    except OSError:
+        return None
+    if member is None:
+        return None
+    return member.size, member.mtime_ns
+
+
+def read_image_bytes(image_path: Union[str, os.PathLike], limit: Optional[int] = None) -> bytes:
+    # アーカイブ内の画像も通常のファイルと同じように読む（limitを指定すると先頭だけ）
+    location = None
+    if not os.path.isfile(image_path):
+        location = split_archive_path(image_path)
+    if location is None:
+        with open(image_path, 'rb') as f:
+            return f.read() if limit is None else f.read(limit)
+    return _pool.read(location[0], location[1], limit)
+
+
+def is_archive_member(image_path: Union[str, os.PathLike]) -> bool:
+    return not os.path.exists(image_path) and split_archive_path(image_path) is not None
+
+
+def image_exists(image_path: Union[str, os.PathLike]) -> bool:
+    return os.path.exists(image_path) or split_archive_path(image_path) is not None
+
@@ -2,41 +2,114 @@ from pathlib import Path
 from typing import Optional
 
 from PyQt6.QtWidgets import QApplication
-from PyQt6.QtCore import QMimeData
-from PyQt6.QtGui import QImage, QPixmap, QColorSpace
+from PyQt6.QtCore import QObject, QMimeData, QRunnable, QThreadPool, pyqtSignal
+from PyQt6.QtGui import QImage, QColorSpace
 
+from archive_reader import read_image_bytes
+from image_loader import open_image_reader
+
+
+# QImageReaderの形式名から、エンコード済みデータをそのまま渡すときのMIMEタイプへの対応
+ENCODED_MIME_TYPES = {
+    'jpeg': 'image/jpeg',
+    'jpg': 'image/jpeg',
+    'png': 'image/png',
+    'gif': 'image/gif',
+    'bmp': 'image/bmp',
+}
+
+
+class _ClipboardJob(QRunnable):
+    def __init__(self, clipboard_manager: 'ClipboardManager', request_id: int, image_path: Path,
+                 image: Optional[QImage], include_encoded_data: bool):
+        super().__init__()
+        self._clipboard_manager = clipboard_manager
+        self._request_id = request_id
+        self._image_path = image_path
+        self._image = image
+        self._include_encoded_data = include_encoded_data
+
+    def run(self):
+        try:
+            if not self._clipboard_manager.is_current_request(self._request_id):
+                return
+
+            # ファイルは一度だけ読み、同じ内容をデコードとクリップボードの両方に使う
+            data = None
+            if self._include_encoded_data:
+                try:
+                    data = read_image_bytes(self._image_path)
+                except OSError as e:
+                    print(f"クリップボードコピーエラー: {e}")
+            reader = open_image_reader(self._image_path, data)
+
+            mime_type = None
+            if data is not None:
+                image_format = bytes(reader.format()).decode('ascii', 'ignore')
+                mime_type = ENCODED_MIME_TYPES.get(image_format.lower())
+
+            image = self._image
+            if image is None:
+                image = reader.read()
+                if not image.isNull():
+                    image.setColorSpace(QColorSpace())
+
+            self._clipboard_manager.image_prepared.emit(
+                self._request_id, image, mime_type or '', data if mime_type else b''
+            )
+        except RuntimeError:
+            # 終了処理でマネージャーが先に破棄された場合
+            pass
+
+
+class ClipboardManager(QObject):
+    # ワーカースレッドから発行され、GUIスレッドで受け取る
+    image_prepared = pyqtSignal(int, QImage, str, bytes)
+
+    def __init__(self, include_encoded_data: bool = True, parent=None):
+        super().__init__(parent)
+        self._include_encoded_data = include_encoded_data
+        self._request_id = 0
+
+        self._thread_pool = QThreadPool(self)
+        self._thread_pool.setMaxThreadCount(1)
+        self.image_prepared.connect(self._on_image_prepared)
 
-class ClipboardManager:
     @staticmethod
     def copy_image_path(image_path: Optional[Path]):
         if image_path is None:
             return
-            
+
         clipboard = QApplication.clipboard()
         clipboard.setText(str(image_path.absolute()))
 
-    @staticmethod
-    def copy_image_to_clipboard(image_path: Optional[Path]):
+    def copy_image_to_clipboard(self, image_path: Optional[Path], image: Optional[QImage] = None):
+        # デコード済みの画像があればそれを使い、なければバックグラウンドでデコードしてから公開する
         if image_path is None:
             return
 
-        try:
-            image = QImage(str(image_path))
-            if image.isNull():
-                return
-                
-            image.setColorSpace(QColorSpace())
-            pixmap = QPixmap.fromImage(image)
+        # 後から出された要求だけを公開する
+        self._request_id += 1
+        self._thread_pool.clear()
+        if image is not None and not self._include_encoded_data:
+            self.copy_image_data_to_clipboard(image)
+            return
 
-            clipboard = QApplication.clipboard()
-            mime_data = QMimeData()
-            mime_data.setImageData(pixmap.toImage())
-            clipboard.setMimeData(mime_data)
-        except Exception as e:
-            print(f"クリップボードコピーエラー: {e}")
+        self._thread_pool.start(_ClipboardJob(
+            self, self._request_id, image_path, image, self._include_encoded_data
+        ))
+
+    def is_current_request(self, request_id: int) -> bool:
+        return request_id == self._request_id
+
+    def shutdown(self):
+        self._request_id += 1
+        self._thread_pool.clear()
+        self._thread_pool.waitForDone()
 
     @staticmethod
-    def copy_image_data_to_clipboard(image: Optional[QImage]):
+    def copy_image_data_to_clipboard(image: Optional[QImage], mime_type: str = '',
+                                     encoded_data: bytes = b''):
         if image is None or image.isNull():
             return
 
@@ -44,6 +117,17 @@ class ClipboardManager:
             clipboard = QApplication.clipboard()
             mime_data = QMimeData()
             mime_data.setImageData(image)
+            if mime_type and encoded_data:
+                # 貼り付け先が対応していれば、再エンコードせずに元のファイルの内容を渡せる
+                mime_data.setData(mime_type, encoded_data)
             clipboard.setMimeData(mime_data)
         except Exception as e:
-            print(f"クリップボードコピーエラー: {e}")
\ No newline at end of file
+            print(f"クリップボードコピーエラー: {e}")
+
+    def _on_image_prepared(self, request_id: int, image: QImage, mime_type: str, encoded_data: bytes):
+        if not self.is_current_request(request_id):
+            return
+        if image.isNull():
+            print("クリップボードコピーエラー: 画像を読み込めませんでした")
+            return
+        self.copy_image_data_to_clipboard(image, mime_type, encoded_data)
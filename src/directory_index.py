@@ -0,0 +1,218 @@
+import os
+import sqlite3
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+from natural_sort import natural_sort_key_component
+
+
+SCHEMA_VERSION = 3
+
+# ファイル単位で記録し、ファイルやディレクトリが消えたら一緒に消すテーブル
+_FILE_TABLES = ('image_metadata', 'file_formats')
+
+
+@dataclass
+class DirectoryEntry:
+    name: str
+    is_dir: bool
+    size: int = 0
+    mtime_ns: int = 0
+
+
+@dataclass
+class ImageMetadata:
+    size: int
+    mtime_ns: int
+    width: int = 0
+    height: int = 0
+    # EXIFの撮影日時をYYYYMMDDhhmmssの整数で表したもの（不明なら0）
+    capture_time: int = 0
+
+
+def scan_directory_entries(directory: str, with_stat: bool = False) -> List[DirectoryEntry]:
+    entries = []
+    with os.scandir(directory) as it:
+        for entry in it:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    entries.append(DirectoryEntry(entry.name, True))
+                elif entry.is_file():
+                    if with_stat:
+                        stat = entry.stat()
+                        entries.append(DirectoryEntry(entry.name, False, stat.st_size, stat.st_mtime_ns))
+                    else:
+                        entries.append(DirectoryEntry(entry.name, False))
+            except OSError:
+                continue
+
+    # ディレクトリ内を自然順に並べておけば、深さ優先でたどるだけでパス全体の自然順になる
+    entries.sort(key=lambda e: natural_sort_key_component(e.name))
+    return entries
+
+
+class DirectoryIndex:
+    def __init__(self, index_file: Path):
+        self._connection = sqlite3.connect(str(index_file), timeout=5)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._ensure_schema()
+        self._stats: Dict[str, int] = {'hits': 0, 'rescans': 0}
+
+    def _ensure_schema(self):
+        version = self._connection.execute('PRAGMA user_version').fetchone()[0]
+        if version != SCHEMA_VERSION:
+            self._connection.executescript("""
+                DROP TABLE IF EXISTS directories;
+                DROP TABLE IF EXISTS entries;
+                DROP TABLE IF EXISTS image_metadata;
+                DROP TABLE IF EXISTS file_formats;
+            """)
+        self._connection.executescript(f"""
+            CREATE TABLE IF NOT EXISTS directories (
+                path TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS entries (
+                directory TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                is_dir INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                PRIMARY KEY (directory, position)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS image_metadata (
+                directory TEXT NOT NULL,
+                name TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                width INTEGER NOT NULL,
+                height INTEGER NOT NULL,
+                capture_time INTEGER NOT NULL,
+                PRIMARY KEY (directory, name)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS file_formats (
+                directory TEXT NOT NULL,
+                name TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                format TEXT NOT NULL,
+                PRIMARY KEY (directory, name)
+            ) WITHOUT ROWID;
+            PRAGMA user_version = {SCHEMA_VERSION};
+        """)
+        self._connection.commit()
+
+    def list_directory(self, directory: str) -> List[DirectoryEntry]:
+        # ディレクトリのmtimeが変わっていなければ、保存済みの一覧をそのまま使う
+        mtime_ns = os.stat(directory).st_mtime_ns
+        row = self._connection.execute(
+            'SELECT mtime_ns FROM directories WHERE path = ?', (directory,)
+        ).fetchone()
+        if row is not None and row[0] == mtime_ns:
+            self._stats['hits'] += 1
+            return self._load_entries(directory)
+
+        self._stats['rescans'] += 1
+        entries = scan_directory_entries(directory, with_stat=True)
+        self._store_entries(directory, mtime_ns, entries)
+        return entries
+
+    def get_stored_entries(self, directory: str) -> List[DirectoryEntry]:
+        # 前回読み込んだときの一覧を返す（ディレクトリが変わる前のサイズと更新日時の比較に使う）
+        return self._load_entries(directory)
+
+    def get_image_metadata(self, directory: str) -> Dict[str, ImageMetadata]:
+        rows = self._connection.execute(
+            'SELECT name, size, mtime_ns, width, height, capture_time FROM image_metadata WHERE directory = ?',
+            (directory,)
+        )
+        return {name: ImageMetadata(size, mtime_ns, width, height, capture_time)
+                for name, size, mtime_ns, width, height, capture_time in rows}
+
+    def store_image_metadata(self, directory: str, items: Iterable[Tuple[str, ImageMetadata]]):
+        self._connection.executemany(
+            'INSERT OR REPLACE INTO image_metadata '
+            '(directory, name, size, mtime_ns, width, height, capture_time) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            ((directory, name, m.size, m.mtime_ns, m.width, m.height, m.capture_time)
+             for name, m in items)
+        )
+
+    def get_file_formats(self, directory: str) -> Dict[str, Tuple[int, int, str]]:
+        # ファイル名 -> (サイズ, 更新日時, 形式名)。画像でないと判定したファイルの形式名は空文字
+        rows = self._connection.execute(
+            'SELECT name, size, mtime_ns, format FROM file_formats WHERE directory = ?', (directory,)
+        )
+        return {name: (size, mtime_ns, image_format) for name, size, mtime_ns, image_format in rows}
+
+    def store_file_formats(self, directory: str, items: Iterable[Tuple[str, int, int, str]]):
+        self._connection.executemany(
+            'INSERT OR REPLACE INTO file_formats (directory, name, size, mtime_ns, format) VALUES (?, ?, ?, ?, ?)',
+            ((directory, name, size, mtime_ns, image_format) for name, size, mtime_ns, image_format in items)
+        )
+
+    def get_stats(self) -> Dict[str, int]:
+        return dict(self._stats)
+
+    def commit(self):
+        self._connection.commit()
+
+    def close(self):
+        self._connection.commit()
+        self._connection.close()
+
+    def _load_entries(self, directory: str) -> List[DirectoryEntry]:
+        rows = self._connection.execute(
+            'SELECT name, is_dir, size, mtime_ns FROM entries WHERE directory = ? ORDER BY position',
+            (directory,)
+        )
+        return [DirectoryEntry(name, bool(is_dir), size, mtime_ns)
+                for name, is_dir, size, mtime_ns in rows]
+
+    def _store_entries(self, directory: str, mtime_ns: int, entries: List[DirectoryEntry]):
+        old_subdirs = {
+            name for (name,) in self._connection.execute(
+                'SELECT name FROM entries WHERE directory = ? AND is_dir = 1', (directory,)
+            )
+        }
+        new_subdirs = {e.name for e in entries if e.is_dir}
+        for name in old_subdirs - new_subdirs:
+            self._remove_tree(os.path.join(directory, name))
+
+        self._connection.execute('DELETE FROM entries WHERE directory = ?', (directory,))
+        self._connection.executemany(
+            'INSERT INTO entries (directory, position, name, is_dir, size, mtime_ns) VALUES (?, ?, ?, ?, ?, ?)',
+            ((directory, position, e.name, int(e.is_dir), e.size, e.mtime_ns)
+             for position, e in enumerate(entries))
+        )
+        self._connection.execute(
+            'INSERT OR REPLACE INTO directories (path, mtime_ns) VALUES (?, ?)',
+            (directory, mtime_ns)
+        )
+        # 削除されたファイルのメタデータと形式判定結果も消す
+        for table in _FILE_TABLES:
+            self._connection.execute(
+                f'DELETE FROM {table} WHERE directory = ? '
+                'AND name NOT IN (SELECT name FROM entries WHERE directory = ?)',
+                (directory, directory)
+            )
+
+    def _remove_tree(self, directory: str):
+        # 削除されたサブディレクトリ以下の記録をまとめて消す
+        prefix = directory + os.sep
+        upper = directory + chr(ord(os.sep) + 1)
+        self._connection.execute(
+            'DELETE FROM entries WHERE directory = ? OR (directory >= ? AND directory < ?)',
+            (directory, prefix, upper)
+        )
+        self._connection.execute(
+            'DELETE FROM directories WHERE path = ? OR (path >= ? AND path < ?)',
+            (directory, prefix, upper)
+        )
+        for table in _FILE_TABLES:
+            self._connection.execute(
+                f'DELETE FROM {table} WHERE directory = ? OR (directory >= ? AND directory < ?)',
+                (directory, prefix, upper)
+            )
@@ -0,0 +1,250 @@
+import os
+import sqlite3
+import time
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+from PyQt6.QtCore import QObject, QThread, pyqtSignal
+
+import perf_trace
+from archive_reader import is_archive_file, list_archive_members
+from directory_index import DirectoryIndex, DirectoryEntry, scan_directory_entries
+from image_formats import FormatSniffer, has_image_extension
+from natural_sort import natural_path_sort_key
+
+
+def _list_directory(directory: str, directory_index: Optional[DirectoryIndex]) -> List[DirectoryEntry]:
+    if directory_index is not None:
+        try:
+            return directory_index.list_directory(directory)
+        except sqlite3.Error as e:
+            print(f"ディレクトリインデックスの読み込みエラー: {e}")
+    return scan_directory_entries(directory)
+
+
+def _open_directory(directory: Path, directory_index: Optional[DirectoryIndex],
+                    listed_directories: Optional[List[Tuple[Path, int]]]) -> Iterator[DirectoryEntry]:
+    # listed_directoriesには、読み込めたディレクトリと一覧を読む前の更新日時を追加する
+    # （監視を始めるまでに変わったディレクトリを見つけるのに使う）
+    if listed_directories is None:
+        return iter(_list_directory(str(directory), directory_index))
+    mtime_ns = os.stat(directory).st_mtime_ns
+    entries = iter(_list_directory(str(directory), directory_index))
+    listed_directories.append((directory, mtime_ns))
+    return entries
+
+
+def _iter_file_entries(directories: List[Path], recursive: bool = False,
+                       directory_index: Optional[DirectoryIndex] = None,
+                       cancelled=lambda: False,
+                       listed_directories: Optional[List[Tuple[Path, int]]] = None
+                       ) -> Iterator[Tuple[Path, DirectoryEntry]]:
+    # 各ディレクトリの一覧は自然順に並んでいるため、深さ優先でたどると全体も自然順になる
+    for directory in directories:
+        stack = []
+        try:
+            stack.append((directory, _open_directory(directory, directory_index, listed_directories)))
+        except OSError as e:
+            print(f"ディレクトリの読み込みエラー: {e}")
+
+        while stack and not cancelled():
+            current_dir, entries = stack[-1]
+            entry = next(entries, None)
+            if entry is None:
+                stack.pop()
+                continue
+
+            if entry.is_dir:
+                if recursive:
+                    path = current_dir / entry.name
+                    try:
+                        stack.append((path, _open_directory(path, directory_index, listed_directories)))
+                    except OSError as e:
+                        print(f"ディレクトリの読み込みエラー: {e}")
+            elif is_archive_file(entry.name):
+                # アーカイブはディレクトリと同じように扱い、中の画像を並べる
+                yield from iter_archive_entries(current_dir / entry.name)
+            else:
+                yield current_dir, entry
+
+
+def iter_archive_entries(archive_path: Path) -> Iterator[Tuple[Path, DirectoryEntry]]:
+    # 中央ディレクトリ（tarはヘッダー）だけを読み、メンバーのデータは読まない
+    try:
+        members = list_archive_members(archive_path)
+    except OSError as e:
+        print(f"アーカイブの読み込みエラー: {e}")
+        return
+    members.sort(key=lambda m: natural_path_sort_key(m.name.replace('/', os.sep)))
+    for member in members:
+        name = member.name.replace('/', os.sep)
+        yield archive_path, DirectoryEntry(name, False, member.size, member.mtime_ns)
+
+
+def iter_image_files(directories: List[Path], recursive: bool = False,
+                     directory_index: Optional[DirectoryIndex] = None,
+                     cancelled=lambda: False) -> Iterator[Path]:
+    # 拡張子だけで判定する（ファイルの中身は読まない）
+    for directory, entry in _iter_file_entries(directories, recursive, directory_index, cancelled):
+        if has_image_extension(entry.name):
+            yield directory / entry.name
+
+
+def iter_image_file_batches(directories: List[Path], recursive: bool = False,
+                            directory_index: Optional[DirectoryIndex] = None,
+                            batch_size: int = 5000, batch_interval: float = 0.1,
+                            cancelled=lambda: False,
+                            sniffer: Optional[FormatSniffer] = None,
+                            listed_directories: Optional[List[Tuple[Path, int]]] = None
+                            ) -> Iterator[List[Path]]:
+    # snifferを渡すと、拡張子で選んだ候補をまとめて先頭のバイト列で判定し、
+    # 中身が対応形式と確認できたものだけを返す（壊れたファイルや拡張子と中身が合わないものを除く）
+    candidates: List[Tuple[Path, DirectoryEntry]] = []
+    found_any = False
+    last_flush = time.monotonic()
+
+    for directory, entry in _iter_file_entries(directories, recursive, directory_index, cancelled,
+                                               listed_directories):
+        if not has_image_extension(entry.name):
+            continue
+        candidates.append((directory, entry))
+
+        # 最初の画像はすぐに表示できるよう、見つかった時点で送る
+        now = time.monotonic()
+        if not found_any or len(candidates) >= batch_size or now - last_flush >= batch_interval:
+            batch = _resolve_candidates(candidates, sniffer)
+            candidates = []
+            last_flush = now
+            if batch:
+                yield batch
+                found_any = True
+
+    if candidates and not cancelled():
+        batch = _resolve_candidates(candidates, sniffer)
+        if batch:
+            yield batch
+
+
+def _resolve_candidates(candidates: List[Tuple[Path, DirectoryEntry]],
+                        sniffer: Optional[FormatSniffer]) -> List[Path]:
+    if sniffer is None:
+        return [directory / entry.name for directory, entry in candidates]
+    return sniffer.filter_images(candidates)
+
+
+class _ScanThread(QThread):
+    batch_found = pyqtSignal(list)
+    directories_listed = pyqtSignal(list)
+
+    def __init__(self, directories: List[Path], recursive: bool,
+                 index_file: Optional[Path] = None, parent=None):
+        super().__init__(parent)
+        self._directories = directories
+        self._recursive = recursive
+        self._index_file = index_file
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def is_cancelled(self) -> bool:
+        return self._cancelled
+
+    def run(self):
+        # SQLiteの接続はスレッドをまたげないため、スキャンするスレッドで開く
+        directory_index = None
+        if self._index_file is not None:
+            try:
+                directory_index = DirectoryIndex(self._index_file)
+            except sqlite3.Error as e:
+                print(f"ディレクトリインデックスのオープンエラー: {e}")
+
+        # ファイルの先頭を読む処理はI/O待ちが主なので、複数のスレッドで並行して行う
+        sniffer = FormatSniffer(directory_index)
+        listed_directories: List[Tuple[Path, int]] = []
+        scan_start = batch_start = time.perf_counter()
+        try:
+            for batch in iter_image_file_batches(self._directories, self._recursive,
+                                                 directory_index, cancelled=self.is_cancelled,
+                                                 sniffer=sniffer, listed_directories=listed_directories):
+                if self._cancelled:
+                    return
+                perf_trace.record('scan_batch', (time.perf_counter() - batch_start) * 1000, detail=str(len(batch)))
+                self.batch_found.emit(batch)
+                batch_start = time.perf_counter()
+            if not self._cancelled:
+                perf_trace.record('scan', (time.perf_counter() - scan_start) * 1000,
+                                  detail=f'{len(listed_directories)} directories')
+                self.directories_listed.emit(listed_directories)
+        finally:
+            sniffer.close()
+            if directory_index is not None:
+                try:
+                    directory_index.close()
+                except sqlite3.Error as e:
+                    print(f"ディレクトリインデックスの保存エラー: {e}")
+
+
+class DirectoryScanner(QObject):
+    batch_found = pyqtSignal(list)
+    progress_changed = pyqtSignal(int)
+    scan_finished = pyqtSignal(int)
+
+    def __init__(self, index_file: Optional[Path] = None, parent=None):
+        super().__init__(parent)
+        self._index_file = index_file
+        self._thread: Optional[_ScanThread] = None
+        self._found_count = 0
+        self._listed_directories: List[Tuple[Path, int]] = []
+
+    def start(self, directories: List[Path], recursive: bool = False):
+        self.cancel()
+
+        self._found_count = 0
+        self._listed_directories = []
+        thread = _ScanThread(directories, recursive, self._index_file, self)
+        thread.batch_found.connect(lambda batch, t=thread: self._on_batch_found(t, batch))
+        thread.directories_listed.connect(lambda listed, t=thread: self._on_directories_listed(t, listed))
+        thread.finished.connect(lambda t=thread: self._on_thread_finished(t))
+        self._thread = thread
+        thread.start()
+
+    def cancel(self):
+        # 古いスレッドは中断させ、以降の結果は無視する
+        if self._thread is not None:
+            self._thread.cancel()
+            self._thread = None
+
+    def is_scanning(self) -> bool:
+        return self._thread is not None
+
+    def get_found_count(self) -> int:
+        return self._found_count
+
+    def get_listed_directories(self) -> List[Tuple[Path, int]]:
+        # 直前のスキャンで読み込んだディレクトリと、その時点の更新日時（スキャンが最後まで終わった場合のみ）
+        return list(self._listed_directories)
+
+    def shutdown(self):
+        self.cancel()
+        for thread in self.findChildren(_ScanThread):
+            thread.cancel()
+            thread.wait()
+
+    def _on_batch_found(self, thread: _ScanThread, batch: List[Path]):
+        if thread is not self._thread:
+            return
+        self._found_count += len(batch)
+        self.batch_found.emit(batch)
+        self.progress_changed.emit(self._found_count)
+
+    def _on_directories_listed(self, thread: _ScanThread, listed_directories: List[Tuple[Path, int]]):
+        if thread is self._thread:
+            self._listed_directories = listed_directories
+
+    def _on_thread_finished(self, thread: _ScanThread):
+        thread.deleteLater()
+        if thread is not self._thread:
+            return
+        self._thread = None
+        self.scan_finished.emit(self._found_count)
@@ -0,0 +1,312 @@
+import os
+import sqlite3
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from PyQt6.QtCore import QObject, QThread, QTimer, QFileSystemWatcher, pyqtSignal
+
+from archive_reader import is_archive_file
+from directory_index import DirectoryIndex, DirectoryEntry, scan_directory_entries
+from directory_scanner import iter_archive_entries, iter_image_file_batches
+from image_formats import FormatSniffer, has_image_extension
+from image_list_manager import ImageListManager
+from natural_sort import natural_path_sort_key
+
+
+# 書き込みが続く間（コピー中など）の通知はまとめ、落ち着いてから一覧を読み直す
+WATCH_SETTLE_MS = 500
+# inotifyの監視数にはユーザーごとの上限があるため、監視するディレクトリ数を抑える
+MAX_WATCHED_DIRECTORIES = 4096
+
+
+@dataclass
+class DirectoryChanges:
+    added: List[Path] = field(default_factory=list)
+    removed: List[Path] = field(default_factory=list)
+    # 同じ名前のまま中身が置き換わったファイル
+    modified: List[Path] = field(default_factory=list)
+    renamed: List[Tuple[Path, Path]] = field(default_factory=list)
+    # 削除されたディレクトリやアーカイブ（以下のファイルをまとめて除く）
+    removed_directories: List[Path] = field(default_factory=list)
+    # 新しく見つかった監視対象のディレクトリ
+    added_directories: List[Path] = field(default_factory=list)
+
+    def is_empty(self) -> bool:
+        return not (self.added or self.removed or self.modified or self.renamed
+                    or self.removed_directories or self.added_directories)
+
+
+# (ディレクトリ, 一覧に入っているファイル名, 把握しているサブディレクトリ)
+_CheckRequest = Tuple[str, Set[str], Set[str]]
+
+
+class _CheckThread(QThread):
+    changes_found = pyqtSignal(object)
+    directories_changed = pyqtSignal(list)
+
+    def __init__(self, requests: List[_CheckRequest], recursive: bool,
+                 index_file: Optional[Path] = None,
+                 listed_mtimes: Optional[List[Tuple[str, int]]] = None, parent=None):
+        super().__init__(parent)
+        self._requests = requests
+        self._recursive = recursive
+        self._index_file = index_file
+        # 指定した場合は、スキャン時から更新日時が変わったディレクトリを探すだけを行う
+        self._listed_mtimes = listed_mtimes
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def is_cancelled(self) -> bool:
+        return self._cancelled
+
+    def run(self):
+        if self._listed_mtimes is not None:
+            self._find_changed_directories()
+            return
+
+        directory_index = None
+        if self._index_file is not None:
+            try:
+                directory_index = DirectoryIndex(self._index_file)
+            except sqlite3.Error as e:
+                print(f"ディレクトリインデックスのオープンエラー: {e}")
+
+        sniffer = FormatSniffer(directory_index)
+        changes = DirectoryChanges()
+        try:
+            for directory, known_names, known_subdirectories in self._requests:
+                if self._cancelled:
+                    return
+                self._check_directory(directory, known_names, known_subdirectories,
+                                      directory_index, sniffer, changes)
+        finally:
+            sniffer.close()
+            if directory_index is not None:
+                try:
+                    directory_index.close()
+                except sqlite3.Error as e:
+                    print(f"ディレクトリインデックスの保存エラー: {e}")
+
+        if not self._cancelled and not changes.is_empty():
+            self.changes_found.emit(changes)
+
+    def _find_changed_directories(self):
+        changed = []
+        for directory, mtime_ns in self._listed_mtimes:
+            if self._cancelled:
+                return
+            try:
+                if os.stat(directory).st_mtime_ns == mtime_ns:
+                    continue
+            except OSError:
+                pass
+            changed.append(directory)
+        if changed:
+            self.directories_changed.emit(changed)
+
+    def _check_directory(self, directory: str, known_names: Set[str], known_subdirectories: Set[str],
+                         directory_index: Optional[DirectoryIndex], sniffer: FormatSniffer,
+                         changes: DirectoryChanges):
+        # 追加と削除は一覧の中身と比べ、中身の置き換えは前回記録したサイズと更新日時と比べる
+        previous: Dict[str, DirectoryEntry] = {}
+        try:
+            if directory_index is not None:
+                try:
+                    previous = {e.name: e for e in directory_index.get_stored_entries(directory)}
+                    entries = directory_index.list_directory(directory)
+                except sqlite3.Error as e:
+                    print(f"ディレクトリインデックスの読み込みエラー: {e}")
+                    entries = scan_directory_entries(directory, with_stat=True)
+            else:
+                entries = scan_directory_entries(directory, with_stat=True)
+        except OSError:
+            changes.removed_directories.append(Path(directory))
+            return
+
+        directory_path = Path(directory)
+        files = {e.name: e for e in entries if not e.is_dir}
+        candidates: List[Tuple[Path, DirectoryEntry]] = []
+        replaced: List[Tuple[Path, DirectoryEntry]] = []
+        for name, entry in files.items():
+            is_archive = is_archive_file(name)
+            if not is_archive and not has_image_extension(name):
+                continue
+            old_entry = previous.get(name)
+            changed = old_entry is not None and (old_entry.size, old_entry.mtime_ns) != (entry.size, entry.mtime_ns)
+            if name in known_names and not changed:
+                continue
+            if is_archive:
+                # 置き換わったアーカイブは中の画像をすべて入れ替える
+                if name in known_names:
+                    changes.removed_directories.append(directory_path / name)
+                candidates.extend(iter_archive_entries(directory_path / name))
+            elif name in known_names:
+                replaced.append((directory_path, entry))
+            else:
+                candidates.append((directory_path, entry))
+
+        added = sniffer.filter_images(candidates)
+        still_images = set(sniffer.filter_images(replaced))
+        for _, entry in replaced:
+            path = directory_path / entry.name
+            (changes.modified if path in still_images else changes.removed).append(path)
+
+        # 消えたファイルと同じサイズ・更新日時で現れたファイルは、名前が変わったものとみなす
+        added_by_stat: Dict[Tuple[int, int], List[Path]] = {}
+        for path in added:
+            entry = files.get(path.name)
+            if path.parent == directory_path and entry is not None:
+                added_by_stat.setdefault((entry.size, entry.mtime_ns), []).append(path)
+        renamed_to = set()
+        for name in sorted(known_names - files.keys(), key=natural_path_sort_key):
+            if is_archive_file(name):
+                changes.removed_directories.append(directory_path / name)
+                continue
+            old_entry = previous.get(name)
+            matches = added_by_stat.get((old_entry.size, old_entry.mtime_ns)) if old_entry else None
+            if matches:
+                new_path = matches.pop(0)
+                renamed_to.add(new_path)
+                changes.renamed.append((directory_path / name, new_path))
+            else:
+                changes.removed.append(directory_path / name)
+        changes.added.extend(path for path in added if path not in renamed_to)
+
+        if not self._recursive:
+            return
+        subdirectories = {os.path.join(directory, e.name) for e in entries if e.is_dir}
+        for subdirectory in sorted(known_subdirectories - subdirectories, key=natural_path_sort_key):
+            changes.removed_directories.append(Path(subdirectory))
+        new_subdirectories = sorted(subdirectories - known_subdirectories, key=natural_path_sort_key)
+        if new_subdirectories:
+            # 新しいサブディレクトリは、スキャンと同じ手順で中をすべて読む
+            listed_directories: List[Tuple[Path, int]] = []
+            for batch in iter_image_file_batches(list(map(Path, new_subdirectories)), True, directory_index,
+                                                 cancelled=self.is_cancelled, sniffer=sniffer,
+                                                 listed_directories=listed_directories):
+                changes.added.extend(batch)
+            changes.added_directories.extend(path for path, _ in listed_directories)
+
+
+class DirectoryWatcher(QObject):
+    changes_found = pyqtSignal(object)
+
+    def __init__(self, image_list_manager: ImageListManager, index_file: Optional[Path] = None,
+                 parent=None):
+        super().__init__(parent)
+        self._image_list_manager = image_list_manager
+        self._index_file = index_file
+        self._recursive = False
+        # スキャンで読み込んだディレクトリ（監視の上限を超えた分も含む）
+        self._directories: Set[str] = set()
+        self._dirty: Set[str] = set()
+        self._thread: Optional[_CheckThread] = None
+
+        self._watcher = QFileSystemWatcher(self)
+        self._watcher.directoryChanged.connect(self._on_directory_changed)
+
+        self._settle_timer = QTimer(self)
+        self._settle_timer.setSingleShot(True)
+        self._settle_timer.setInterval(WATCH_SETTLE_MS)
+        self._settle_timer.timeout.connect(self._start_check)
+
+    def start(self, listed_directories: List[Tuple[Path, int]], recursive: bool):
+        self.stop()
+        self._recursive = recursive
+        self._add_directories([path for path, _ in listed_directories])
+
+        # スキャンから監視を始めるまでの間に変わったディレクトリを探す
+        listed_mtimes = [(str(path), mtime_ns) for path, mtime_ns in listed_directories]
+        if listed_mtimes:
+            self._run_thread(_CheckThread([], recursive, listed_mtimes=listed_mtimes, parent=self))
+
+    def stop(self):
+        self._settle_timer.stop()
+        self._dirty.clear()
+        self._directories.clear()
+        watched = self._watcher.directories()
+        if watched:
+            self._watcher.removePaths(watched)
+        if self._thread is not None:
+            self._thread.cancel()
+            self._thread = None
+
+    def is_watching(self) -> bool:
+        return bool(self._directories)
+
+    def shutdown(self):
+        self.stop()
+        for thread in self.findChildren(_CheckThread):
+            thread.cancel()
+            thread.wait()
+
+    def _add_directories(self, directories: List[Path]):
+        paths = [str(d) for d in directories if str(d) not in self._directories]
+        self._directories.update(paths)
+        available = MAX_WATCHED_DIRECTORIES - len(self._watcher.directories())
+        if len(paths) > available:
+            print(f"監視するディレクトリが多すぎるため、{len(paths) - max(available, 0)}個は変更を監視しません")
+            paths = paths[:max(available, 0)]
+        if paths:
+            self._watcher.addPaths(paths)
+
+    def _remove_directories(self, directories: List[Path]):
+        removed = set()
+        for directory in map(str, directories):
+            prefix = os.path.join(directory, '')
+            removed.update(d for d in self._directories if d == directory or d.startswith(prefix))
+        self._directories -= removed
+        self._dirty -= removed
+        watched = [d for d in self._watcher.directories() if d in removed]
+        if watched:
+            self._watcher.removePaths(watched)
+
+    def _on_directory_changed(self, directory: str):
+        if directory not in self._directories:
+            return
+        self._dirty.add(directory)
+        if self._thread is None:
+            self._settle_timer.start()
+
+    def _start_check(self):
+        if self._thread is not None or not self._dirty:
+            return
+        requests = []
+        for directory in sorted(self._dirty, key=natural_path_sort_key):
+            prefix = os.path.join(directory, '')
+            subdirectories = {d for d in self._directories
+                              if d.startswith(prefix) and os.sep not in d[len(prefix):]}
+            requests.append((directory, self._image_list_manager.get_directory_file_names(directory),
+                             subdirectories))
+        self._dirty.clear()
+        self._run_thread(_CheckThread(requests, self._recursive, self._index_file, parent=self))
+
+    def _run_thread(self, thread: _CheckThread):
+        thread.changes_found.connect(lambda changes, t=thread: self._on_changes_found(t, changes))
+        thread.directories_changed.connect(lambda changed, t=thread: self._on_directories_changed(t, changed))
+        thread.finished.connect(lambda t=thread: self._on_thread_finished(t))
+        self._thread = thread
+        thread.start()
+
+    def _on_changes_found(self, thread: _CheckThread, changes: DirectoryChanges):
+        if thread is not self._thread:
+            return
+        self._remove_directories(changes.removed_directories)
+        self._add_directories(changes.added_directories)
+        self.changes_found.emit(changes)
+
+    def _on_directories_changed(self, thread: _CheckThread, changed: List[str]):
+        if thread is self._thread:
+            self._dirty.update(d for d in changed if d in self._directories)
+
+    def _on_thread_finished(self, thread: _CheckThread):
+        thread.deleteLater()
+        if thread is not self._thread:
+            return
+        self._thread = None
+        # 確認中に届いた変更は、続けてまとめて確認する
+        if self._dirty:
+            self._settle_timer.start()
@@ -4,6 +4,7 @@ from typing import List, Optional
 from PyQt6.QtWidgets import QFileDialog
 
 from open_dir_dialog import DialogResult, CustomDirectoryDialog
+from directory_scanner import iter_image_files
 
 
 class FileDialogManager:
@@ -31,7 +32,4 @@ class FileDialogManager:
         if not directory.is_dir():
             return []
 
-        if include_subdirs:
-            return list(directory.glob('**/*'))
-        else:
-            return list(directory.glob('*'))
\ No newline at end of file
+        return list(iter_image_files([directory], include_subdirs))
\ No newline at end of file
@@ -0,0 +1,137 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from PyQt6.QtCore import Qt, QSize
+from PyQt6.QtGui import QPixmap
+
+from archive_reader import stat_image
+
+
+# (パス, mtime_ns, サイズ) でファイルの内容を識別する
+CacheKey = Tuple[str, int, int]
+
+DEFAULT_CACHE_BYTES = 512 * 1024 * 1024
+
+
+@dataclass
+class CacheEntry:
+    pixmap: QPixmap
+    full_size: QSize
+
+    def is_full_resolution(self) -> bool:
+        return (self.pixmap.width() >= self.full_size.width()
+                and self.pixmap.height() >= self.full_size.height())
+
+    def covers(self, target_size: Optional[QSize]) -> bool:
+        # 縮小デコードされた画像は、表示サイズを満たす場合のみ使える
+        if self.is_full_resolution():
+            return True
+        if target_size is None:
+            return False
+        needed = self.full_size.scaled(target_size, Qt.AspectRatioMode.KeepAspectRatio)
+        return (self.pixmap.width() >= needed.width()
+                and self.pixmap.height() >= needed.height())
+
+
+class ImageCache:
+    def __init__(self, max_bytes: int = DEFAULT_CACHE_BYTES):
+        self._entries: 'OrderedDict[CacheKey, CacheEntry]' = OrderedDict()
+        self._keys_by_path: Dict[str, CacheKey] = {}
+        self._max_bytes = max_bytes
+        self._total_bytes = 0
+        self._hits = 0
+        self._misses = 0
+
+    @staticmethod
+    def make_key(image_path: Path) -> Optional[CacheKey]:
+        # アーカイブ内の画像はメンバーのサイズと更新日時を使う
+        stat = stat_image(image_path)
+        if stat is None:
+            return None
+        size, mtime_ns = stat
+        return (str(image_path), mtime_ns, size)
+
+    @staticmethod
+    def pixmap_bytes(pixmap: QPixmap) -> int:
+        return pixmap.width() * pixmap.height() * max(pixmap.depth(), 8) // 8
+
+    def get(self, key: CacheKey, target_size: Optional[QSize] = None) -> Optional[CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is not None and entry.covers(target_size):
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry
+        self._misses += 1
+        return None
+
+    def put(self, key: CacheKey, pixmap: QPixmap, full_size: Optional[QSize] = None) -> Optional[CacheEntry]:
+        if pixmap.isNull():
+            return None
+        if full_size is None or not full_size.isValid():
+            full_size = pixmap.size()
+
+        # 同じパスの古い内容（更新前のファイル）は破棄する
+        old_key = self._keys_by_path.get(key[0])
+        if old_key is not None:
+            self._remove(old_key)
+
+        entry = CacheEntry(pixmap, full_size)
+        size = self.pixmap_bytes(pixmap)
+        if size > self._max_bytes:
+            return entry
+
+        self._entries[key] = entry
+        self._keys_by_path[key[0]] = key
+        self._total_bytes += size
+        self._evict()
+        return entry
+
+    def contains(self, key: CacheKey, target_size: Optional[QSize] = None) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and entry.covers(target_size)
+
+    def invalidate_path(self, image_path: Path):
+        key = self._keys_by_path.get(str(image_path))
+        if key is not None:
+            self._remove(key)
+
+    def clear(self):
+        self._entries.clear()
+        self._keys_by_path.clear()
+        self._total_bytes = 0
+
+    def set_max_bytes(self, max_bytes: int):
+        self._max_bytes = max_bytes
+        self._evict()
+
+    def get_max_bytes(self) -> int:
+        return self._max_bytes
+
+    def get_total_bytes(self) -> int:
+        return self._total_bytes
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            'hits': self._hits,
+            'misses': self._misses,
+            'entries': len(self._entries),
+            'bytes': self._total_bytes,
+        }
+
+    def reset_stats(self):
+        self._hits = 0
+        self._misses = 0
+
+    def _remove(self, key: CacheKey):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._total_bytes -= self.pixmap_bytes(entry.pixmap)
+        if self._keys_by_path.get(key[0]) == key:
+            del self._keys_by_path[key[0]]
+
+    def _evict(self):
+        while self._total_bytes > self._max_bytes and self._entries:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
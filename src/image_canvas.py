@@ -0,0 +1,80 @@
+from typing import Optional, Tuple
+
+from PyQt6.QtCore import Qt, QRectF, QSize, QSizeF
+from PyQt6.QtGui import QPainter, QPixmap
+from PyQt6.QtWidgets import QWidget
+
+import perf_trace
+
+
+# 描画時の縮小がこの倍率を超える場合だけ、縮小した画像を作って使う
+# （バイリニア補間では間引かれる画素が出て、細部がちらつくため）
+MAX_PAINT_REDUCTION = 2.0
+
+
+class ImageCanvas(QWidget):
+    # 画像を中央に、縦横比を保って表示サイズに合わせて描画する
+    # 拡縮と左右反転は描画時の座標変換で行い、表示用の画像を別に作らない
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setAttribute(Qt.WidgetAttribute.WA_OpaquePaintEvent)
+        self.setMinimumSize(0, 0)
+        self._pixmap: Optional[QPixmap] = None
+        self._h_flip = False
+        self._fast = False
+        # (元画像のキー, 表示サイズ, 縮小した画像)
+        self._reduced: Optional[Tuple[int, QSize, QPixmap]] = None
+
+    def set_pixmap(self, pixmap: Optional[QPixmap], h_flip: bool = False, fast: bool = False):
+        # fast=Trueはリサイズ中の仮描画で、補間せずに描画する
+        if pixmap is not None and pixmap.isNull():
+            pixmap = None
+        if self._pixmap is None or pixmap is None or pixmap.cacheKey() != self._pixmap.cacheKey():
+            self._reduced = None
+        self._pixmap = pixmap
+        self._h_flip = h_flip
+        self._fast = fast
+        self.update()
+
+    def get_pixmap(self) -> Optional[QPixmap]:
+        return self._pixmap
+
+    def has_pixmap(self) -> bool:
+        return self._pixmap is not None
+
+    def set_h_flip(self, enabled: bool):
+        if enabled != self._h_flip:
+            self._h_flip = enabled
+            self.update()
+
+    def paintEvent(self, event):
+        with perf_trace.measure('paint') as timer:
+            painter = QPainter(self)
+            painter.fillRect(self.rect(), Qt.GlobalColor.black)
+            if self._pixmap is not None:
+                timer.detail = 'fast' if self._fast else 'smooth'
+                pixmap = self._pixmap if self._fast else self._get_paint_pixmap()
+                size = QSizeF(pixmap.size()).scaled(QSizeF(self.size()), Qt.AspectRatioMode.KeepAspectRatio)
+                if not self._fast:
+                    painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
+                painter.translate(self.width() / 2, self.height() / 2)
+                if self._h_flip:
+                    painter.scale(-1, 1)
+                painter.drawPixmap(QRectF(-size.width() / 2, -size.height() / 2, size.width(), size.height()),
+                                   pixmap, QRectF(pixmap.rect()))
+            painter.end()
+
+    def _get_paint_pixmap(self) -> QPixmap:
+        # 通常は表示サイズの2倍以内にデコードされているため、元の画像をそのまま描画する
+        pixmap = self._pixmap
+        target_size = (QSizeF(self.size()) * self.devicePixelRatioF()).toSize()
+        fitted = pixmap.size().scaled(target_size, Qt.AspectRatioMode.KeepAspectRatio)
+        if (fitted.isEmpty() or (pixmap.width() <= fitted.width() * MAX_PAINT_REDUCTION
+                                 and pixmap.height() <= fitted.height() * MAX_PAINT_REDUCTION)):
+            return pixmap
+
+        if self._reduced is None or self._reduced[0] != pixmap.cacheKey() or self._reduced[1] != fitted:
+            reduced = pixmap.scaled(fitted, Qt.AspectRatioMode.IgnoreAspectRatio,
+                                    Qt.TransformationMode.SmoothTransformation)
+            self._reduced = (pixmap.cacheKey(), fitted, reduced)
+        return self._reduced[2]
@@ -1,22 +1,37 @@
 from pathlib import Path
-from typing import Optional
+from typing import Optional, Tuple
 
-from PyQt6.QtCore import Qt, QSize
-from PyQt6.QtWidgets import QLabel
-from PyQt6.QtGui import QPixmap, QImage, QTransform, QColorSpace
+from PyQt6.QtCore import QSize
+from PyQt6.QtGui import QPixmap, QImage, QColorSpace
+
+import perf_trace
+from animation_player import AnimationPlayer, is_animation_candidate
+from archive_reader import is_archive_member, read_image_bytes
+from image_cache import ImageCache, CacheEntry, DEFAULT_CACHE_BYTES
+from image_canvas import ImageCanvas
+from image_loader import decode_image
 
 
 class ImageDisplayManager:
-    def __init__(self, image_label: QLabel):
-        self.image_label = image_label
+    def __init__(self, image_canvas: ImageCanvas, cache_bytes: int = DEFAULT_CACHE_BYTES):
+        self.image_canvas = image_canvas
         self.h_flip = False
         self._current_image_path: Optional[Path] = None
+        self._source_entry: Optional[CacheEntry] = None
+        self._is_preview = False
+        self._image_cache = ImageCache(cache_bytes)
+
+        # アニメーションは先頭フレームを静止画として表示した後、デコードできたフレームから差し替える
+        self._animation_player = AnimationPlayer(parent=image_canvas)
+        self._animation_player.frame_ready.connect(self._render)
 
     def set_h_flip(self, enabled: bool):
+        # 反転は描画時に行うため、画像を作り直さずに描き直すだけで済む
         self.h_flip = enabled
+        self.image_canvas.set_h_flip(enabled)
 
     def toggle_h_flip(self):
-        self.h_flip = not self.h_flip
+        self.set_h_flip(not self.h_flip)
 
     def is_h_flip_enabled(self) -> bool:
         return self.h_flip
@@ -32,53 +47,161 @@ class ImageDisplayManager:
             return self._current_image_path.name
         return None
 
-    def create_blank_image(self) -> QPixmap:
-        width = self.image_label.width()
-        height = self.image_label.height()
-        image = QImage(width, height, QImage.Format.Format_RGB32)
-        image.fill(Qt.GlobalColor.black)
-        return QPixmap.fromImage(image)
+    def get_image_cache(self) -> ImageCache:
+        return self._image_cache
+
+    def get_target_size(self) -> QSize:
+        # 高DPI環境でも鮮明になるよう、デバイスピクセル単位のサイズを返す
+        # 表示前はレイアウトが確定していないため、ウィンドウサイズを上限として使う
+        if self.image_canvas.isVisible():
+            size = self.image_canvas.size()
+        else:
+            size = self.image_canvas.window().size()
+        return size * self.image_canvas.devicePixelRatioF()
 
     def load_and_display_image(self, image_path: Optional[Path] = None):
         if image_path is not None:
             self._current_image_path = image_path
 
-        if self._current_image_path is None:
-            pixmap = self.create_blank_image()
-        else:
-            pixmap = QPixmap(str(self._current_image_path))
-            if pixmap.isNull():
-                pixmap = self.create_blank_image()
+        with perf_trace.measure('display', perf_trace.image_format_of(self._current_image_path)):
+            self._source_entry = self._load_source_entry(self._current_image_path)
+            self._is_preview = False
+            self._render()
+            self._update_animation()
+
+    def display_cached_image(self, image_path: Path) -> bool:
+        # キャッシュに表示サイズを満たす画像があるときだけ表示し、ディスクは読まない
+        key = ImageCache.make_key(image_path)
+        if key is None:
+            return False
+        with perf_trace.measure('cache', perf_trace.image_format_of(image_path)) as timer:
+            entry = self._image_cache.get(key, self.get_target_size())
+            timer.detail = 'hit' if entry is not None else 'miss'
+        if entry is None:
+            return False
+
+        with perf_trace.measure('display', perf_trace.image_format_of(image_path)) as timer:
+            timer.detail = 'cached'
+            self._current_image_path = image_path
+            self._source_entry = entry
+            self._is_preview = False
+            self._render()
+            self._update_animation()
+        return True
+
+    def display_preview(self, image_path: Path, preview: Optional[QImage]):
+        # 高速移動中は縮小画像（サムネイル）で代用し、なければ直前の画像を残す
+        self._current_image_path = image_path
+        self._is_preview = True
+        self._animation_player.stop()
+        if preview is not None and not preview.isNull():
+            self._source_entry = CacheEntry(QPixmap.fromImage(preview), preview.size())
+            self._render()
+
+    def get_source_pixmap(self) -> Optional[QPixmap]:
+        if self._source_entry is None:
+            return None
+        return self._source_entry.pixmap
+
+    def is_preview(self) -> bool:
+        return self._is_preview
+
+    def refresh_display(self, fast: bool = False):
+        # デコード済みの画像を描き直す
+        # fast=Trueはリサイズ中の仮描画で、ディスクは読まずに手元の画像を補間せずに拡縮する
+        if self._is_preview or fast:
+            self._render(fast)
+            return
+
+        # 縮小デコードした画像が新しい表示サイズに足りない場合のみ読み直す
+        if self._current_image_path is not None and (
+                self._source_entry is None
+                or not self._source_entry.covers(self.get_target_size())):
+            self._source_entry = self._load_source_entry(self._current_image_path)
+        self._render()
+        self._update_animation()
+
+    def reload_image(self):
+        if self._current_image_path is not None:
+            self._image_cache.invalidate_path(self._current_image_path)
+        self._animation_player.stop()
+        self.load_and_display_image()
 
-        scaled_pixmap = self._scale_image_to_fit(pixmap)
-        final_pixmap = self._apply_transformations(scaled_pixmap)
-        
-        self.image_label.setPixmap(final_pixmap)
+    def stop_animation(self):
+        # 画像が隠れている間（サムネイル一覧や拡大表示）はデコードを止める
+        self._animation_player.stop()
 
-    def refresh_display(self):
-        self.load_and_display_image()
+    def shutdown(self):
+        self._animation_player.shutdown()
 
-    def _scale_image_to_fit(self, pixmap: QPixmap) -> QPixmap:
-        return pixmap.scaled(
-            self.image_label.size(),
-            Qt.AspectRatioMode.KeepAspectRatio,
-            Qt.TransformationMode.SmoothTransformation
-        )
+    def _update_animation(self):
+        image_path = self._current_image_path
+        if image_path is None or self._source_entry is None or not is_animation_candidate(image_path):
+            self._animation_player.stop()
+            return
+        # フレームは表示サイズに合わせて一度だけ縮小するため、サイズが変わったら読み直す
+        self._animation_player.start(image_path, self.get_target_size())
 
-    def _apply_transformations(self, pixmap: QPixmap) -> QPixmap:
-        if self.h_flip:
-            transform = QTransform()
-            transform.scale(-1, 1)
-            return pixmap.transformed(transform)
-        return pixmap
+    def _load_source_entry(self, image_path: Optional[Path],
+                           full_resolution: bool = False) -> Optional[CacheEntry]:
+        if image_path is None:
+            return None
 
-    def get_current_image_for_clipboard(self) -> Optional[QImage]:
-        if self._current_image_path is None:
+        # ファイルが変更されていればキーが変わり、ディスクから読み直す
+        key = ImageCache.make_key(image_path)
+        if key is None:
             return None
-        
-        image = QImage(str(self._current_image_path))
-        if image.isNull():
+
+        image_format = perf_trace.image_format_of(image_path)
+        target_size = None if full_resolution else self.get_target_size()
+        with perf_trace.measure('cache', image_format) as timer:
+            entry = self._image_cache.get(key, target_size)
+            timer.detail = 'hit' if entry is not None else 'miss'
+        if entry is None:
+            image, full_size = self._decode(image_path, target_size, image_format)
+            if image.isNull():
+                return None
+            with perf_trace.measure('upload', image_format):
+                pixmap = QPixmap.fromImage(image)
+            entry = self._image_cache.put(key, pixmap, full_size)
+        return entry
+
+    def _decode(self, image_path: Path, target_size: Optional[QSize], image_format: str) -> Tuple[QImage, QSize]:
+        if not perf_trace.is_enabled():
+            return decode_image(image_path, target_size)
+
+        # 計測中はファイルの読み込みとデコードを分けるため、先に内容をすべて読む
+        data = None
+        with perf_trace.measure('read', image_format):
+            try:
+                data = read_image_bytes(image_path) if is_archive_member(image_path) else image_path.read_bytes()
+            except OSError:
+                pass
+        with perf_trace.measure('decode', image_format):
+            return decode_image(image_path, target_size, data)
+
+    def _render(self, fast: bool = False):
+        frame = None
+        if self._animation_player.get_image_path() == self._current_image_path:
+            frame = self._animation_player.get_current_frame()
+
+        if frame is not None:
+            pixmap = frame
+        elif self._source_entry is not None:
+            pixmap = self._source_entry.pixmap
+        else:
+            pixmap = None
+
+        # 拡縮と反転は描画時に行う（画像がなければ背景だけを描く）
+        self.image_canvas.set_pixmap(pixmap, self.h_flip, fast)
+
+    def get_current_image_for_clipboard(self) -> Optional[QImage]:
+        # 表示中の画像が元の解像度でデコード済みのときだけ返す
+        # なければ呼び出し側がバックグラウンドでデコードする
+        entry = self._source_entry
+        if entry is None or self._is_preview or not entry.is_full_resolution():
             return None
-            
+
+        image = entry.pixmap.toImage()
         image.setColorSpace(QColorSpace())
         return image
\ No newline at end of file
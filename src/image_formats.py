@@ -0,0 +1,166 @@
+import os
+import sqlite3
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from PyQt6.QtGui import QImageReader
+
+from archive_reader import read_image_bytes
+from directory_index import DirectoryIndex, DirectoryEntry
+from image_loader import open_image_reader
+
+
+SNIFF_BYTES = 32
+SNIFF_WORKERS = 8
+
+# 画像として一覧に出さない形式（文書など）
+_EXCLUDED_FORMATS = {'pdf'}
+
+# ISO BMFF（AVIF/HEIF）のブランドと形式名の対応
+_FTYP_BRANDS = {
+    b'avif': 'avif', b'avis': 'avif',
+    b'heic': 'heic', b'heix': 'heic', b'heim': 'heic', b'heis': 'heic',
+    b'hevc': 'heic', b'hevx': 'heic', b'mif1': 'heif', b'msf1': 'heif',
+}
+
+# (先頭のバイト列, 形式名)
+_SIGNATURES = [
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+    (b'BM', 'bmp'),
+    (b'II*\x00', 'tiff'),
+    (b'MM\x00*', 'tiff'),
+    (b'\x00\x00\x01\x00', 'ico'),
+    (b'\x00\x00\x02\x00', 'cur'),
+    (b'icns', 'icns'),
+    (b'\x00\x00\x00\x0cjP  \r\n\x87\n', 'jp2'),
+    (b'P1', 'pbm'), (b'P4', 'pbm'),
+    (b'P2', 'pgm'), (b'P5', 'pgm'),
+    (b'P3', 'ppm'), (b'P6', 'ppm'),
+]
+
+
+@lru_cache(maxsize=None)
+def supported_image_formats() -> FrozenSet[str]:
+    # インストールされているQtの画像プラグインで読める形式
+    formats = {bytes(f).decode('ascii', 'ignore').lower() for f in QImageReader.supportedImageFormats()}
+    return frozenset(formats - _EXCLUDED_FORMATS)
+
+
+@lru_cache(maxsize=None)
+def supported_image_extensions() -> FrozenSet[str]:
+    # Qtの形式名はそのまま拡張子として使われている（jpg/jpeg、tif/tiffなども個別に並ぶ）
+    return frozenset('.' + f for f in supported_image_formats())
+
+
+def has_image_extension(name: str) -> bool:
+    dot = name.rfind('.')
+    return dot > 0 and name[dot:].lower() in supported_image_extensions()
+
+
+def sniff_image_format(header: bytes) -> Optional[str]:
+    # ファイル先頭のバイト列から形式名を返す（判定できなければNone）
+    for signature, image_format in _SIGNATURES:
+        if header.startswith(signature):
+            return image_format
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'webp'
+    if header[4:8] == b'ftyp':
+        return _FTYP_BRANDS.get(header[8:12])
+    return None
+
+
+def detect_image_format(image_path: str) -> str:
+    # 読めない・対応していないファイルは空文字を返す
+    try:
+        header = read_image_bytes(image_path, SNIFF_BYTES)
+    except OSError:
+        return ''
+    if not header:
+        return ''
+
+    image_format = sniff_image_format(header)
+    if image_format is None:
+        # SVGやXPMなど、固定のシグネチャを持たない形式はQtのプラグインに判定させる
+        image_format = bytes(open_image_reader(Path(image_path)).format()).decode('ascii', 'ignore').lower()
+    return image_format if image_format in supported_image_formats() else ''
+
+
+def _has_stat(entry: DirectoryEntry) -> bool:
+    # アーカイブのメンバーは、更新日時が記録されていなくてもサイズで判定結果を引ける
+    return bool(entry.mtime_ns or entry.size)
+
+
+class FormatSniffer:
+    # 候補のファイルをまとめてワーカースレッドで判定し、結果はサイズと更新日時つきでインデックスに残す
+    # 比べるサイズと更新日時はディレクトリ一覧（アーカイブはメンバー一覧）の値で、ファイルごとにstatはしない
+    # （中身だけ書き換えられたファイルは、ディレクトリの監視で見つけて判定し直す）
+    # インデックスへのアクセスは呼び出し元のスレッドだけで行う
+    def __init__(self, directory_index: Optional[DirectoryIndex] = None, max_workers: int = SNIFF_WORKERS):
+        # concurrent.futuresは読み込みに時間がかかるため、スキャンを始めるときに読み込む
+        from concurrent.futures import ThreadPoolExecutor
+
+        self._directory_index = directory_index
+        self._executor = ThreadPoolExecutor(max_workers)
+        self._cached_directory: Optional[str] = None
+        self._cached_formats: Dict[str, Tuple[int, int, str]] = {}
+
+    def filter_images(self, candidates: List[Tuple[Path, DirectoryEntry]]) -> List[Path]:
+        verdicts: List[Optional[str]] = []
+        unknown: List[int] = []
+        for i, (directory, entry) in enumerate(candidates):
+            image_format = self._get_cached_format(str(directory), entry)
+            verdicts.append(image_format)
+            if image_format is None:
+                unknown.append(i)
+
+        if unknown:
+            paths = [os.path.join(candidates[i][0], candidates[i][1].name) for i in unknown]
+            updated: Dict[str, List[Tuple[str, int, int, str]]] = {}
+            for i, image_format in zip(unknown, self._executor.map(detect_image_format, paths)):
+                verdicts[i] = image_format
+                directory, entry = candidates[i]
+                if _has_stat(entry):
+                    updated.setdefault(str(directory), []).append(
+                        (entry.name, entry.size, entry.mtime_ns, image_format)
+                    )
+            self._store_formats(updated)
+
+        return [directory / entry.name
+                for (directory, entry), image_format in zip(candidates, verdicts) if image_format]
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def _get_cached_format(self, directory: str, entry: DirectoryEntry) -> Optional[str]:
+        # ディレクトリインデックスがない場合やサイズと更新日時が不明な場合は毎回判定する
+        if self._directory_index is None or not _has_stat(entry):
+            return None
+        if directory != self._cached_directory:
+            try:
+                self._cached_formats = self._directory_index.get_file_formats(directory)
+            except sqlite3.Error as e:
+                print(f"形式判定結果の読み込みエラー: {e}")
+                self._cached_formats = {}
+            self._cached_directory = directory
+
+        cached = self._cached_formats.get(entry.name)
+        if cached is None or cached[:2] != (entry.size, entry.mtime_ns):
+            return None
+        return cached[2]
+
+    def _store_formats(self, updated: Dict[str, List[Tuple[str, int, int, str]]]):
+        if self._directory_index is None:
+            return
+        for directory, items in updated.items():
+            try:
+                self._directory_index.store_file_formats(directory, items)
+            except sqlite3.Error as e:
+                print(f"形式判定結果の保存エラー: {e}")
+                continue
+            if directory == self._cached_directory:
+                for name, size, mtime_ns, image_format in items:
+                    self._cached_formats[name] = (size, mtime_ns, image_format)
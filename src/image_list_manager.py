@@ -1,29 +1,53 @@
+import heapq
+import os
 import random
+from array import array
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
+import perf_trace
+from archive_reader import get_member_path, image_exists, is_archive_file, list_archive_members
+from directory_index import ImageMetadata
+from image_formats import has_image_extension, supported_image_extensions
+from image_list_store import ImageListStore, ImageListView, PathLike
+from metadata_index import MetadataTable, MetadataRequest, SORT_BY_NAME, SORT_MODES
 from natural_sort import natural_path_sort_key
 
 
 class ImageListManager:
     def __init__(self):
-        self._image_files: List[Path] = []
+        self._image_files = ImageListStore()
         self._current_index = 0
         self._shuffle = False
-        self._shuffle_table: List[int] = []
+        self._shuffle_table = array('I')
 
-    def set_image_files(self, files: List[Path], current_index: int = 0):
-        self._image_files = self._filter_image_files(files)
+        # 名前順以外の並び順は、名前順のインデックスを並べた配列と、その逆引きで表す
+        self._sort_mode = SORT_BY_NAME
+        self._sort_order: Optional[array] = None
+        self._sort_positions: Optional[array] = None
+        self._metadata = MetadataTable()
+        self._generation = 0
+
+    def set_image_files(self, files: Iterable[PathLike], current_index: int = 0):
+        with perf_trace.measure('list_filter'):
+            files = self._filter_image_files(files)
+        sorted_files, sorted_keys = self._sort_image_files(files)
+        self._image_files = ImageListStore(sorted_files, sorted_keys)
+        self._metadata = MetadataTable()
+        self._generation += 1
+        self._rebuild_sort_order()
         self._current_index = min(current_index, len(self._image_files) - 1) if self._image_files else 0
         self._generate_shuffle_table()
 
-    def get_image_files(self) -> List[Path]:
-        return self._image_files.copy()
+    def get_image_files(self) -> ImageListView:
+        return ImageListView(self._image_files)
+
+    def iter_image_path_strings(self) -> Iterator[str]:
+        # Pathオブジェクトを作らずに一覧を書き出すときに使う
+        return self._image_files.iter_path_strings()
 
     def get_current_index(self) -> int:
-        if self._shuffle and self._shuffle_table:
-            return self._shuffle_table[self._current_index]
-        return self._current_index
+        return self._to_actual_index(self._current_index)
 
     def get_raw_current_index(self) -> int:
         return self._current_index
@@ -41,6 +65,90 @@ class ImageListManager:
             return self._image_files[actual_index]
         return None
 
+    def get_image_path(self, index: int) -> Optional[Path]:
+        if 0 <= index < len(self._image_files):
+            return self._image_files[index]
+        return None
+
+    def set_current_image_index(self, index: int):
+        # 名前順でのインデックスを指定し、シャッフル中や並べ替え中はその位置に移動する
+        if not 0 <= index < len(self._image_files):
+            return
+        if self._shuffle and self._shuffle_table:
+            self._current_index = self._shuffle_table.index(index)
+        else:
+            self._current_index = self.get_sorted_position(index)
+
+    def get_sorted_index(self, position: int) -> int:
+        # 現在の並び順での位置から、名前順でのインデックスを返す
+        if self._sort_order is not None and position < len(self._sort_order):
+            return self._sort_order[position]
+        return position
+
+    def get_sorted_position(self, index: int) -> int:
+        if self._sort_positions is not None and index < len(self._sort_positions):
+            return self._sort_positions[index]
+        return index
+
+    def get_sort_mode(self) -> str:
+        return self._sort_mode
+
+    def set_sort_mode(self, sort_mode: str):
+        if sort_mode not in SORT_MODES or sort_mode == self._sort_mode:
+            return
+        # 表示中の画像はそのままにして、並び順だけを切り替える
+        actual_index = self.get_current_index()
+        self._sort_mode = sort_mode
+        self._rebuild_sort_order()
+        if not self._shuffle and self._image_files:
+            self._current_index = self.get_sorted_position(actual_index)
+
+    def get_generation(self) -> int:
+        # 一覧を入れ替えるたびに変わり、バックグラウンドの結果が古いかどうかの判定に使う
+        return self._generation
+
+    def get_metadata_requests(self) -> List[MetadataRequest]:
+        return [(file_id, directory, name)
+                for file_id, directory, name in self._image_files.iter_entries()
+                if not self._metadata.has_metadata(file_id)]
+
+    def apply_metadata(self, generation: int, items: List[Tuple[int, ImageMetadata]]):
+        if generation != self._generation:
+            return
+        for file_id, metadata in items:
+            self._metadata.set_metadata(file_id, metadata)
+
+    def refresh_sort_order(self):
+        # メタデータが揃った後などに、表示中の画像を保ったまま並べ直す
+        if self._sort_mode == SORT_BY_NAME:
+            return
+        actual_index = self.get_current_index()
+        self._rebuild_sort_order()
+        if not self._shuffle and self._image_files:
+            self._current_index = self.get_sorted_position(actual_index)
+
+    def get_neighbor_paths(self, next_count: int, prev_count: int) -> List[Path]:
+        # 表示順（シャッフル時はシャッフル順）で近い順に並べる
+        n_images = len(self._image_files)
+        if n_images <= 1:
+            return []
+
+        offsets = []
+        for step in range(1, max(next_count, prev_count) + 1):
+            if step <= next_count:
+                offsets.append(step)
+            if step <= prev_count:
+                offsets.append(-step)
+
+        neighbors = []
+        seen = {self.get_current_index()}
+        for offset in offsets:
+            actual_index = self._to_actual_index((self._current_index + offset) % n_images)
+            if actual_index not in seen:
+                seen.add(actual_index)
+                neighbors.append(self._image_files[actual_index])
+        return neighbors
+
     def has_images(self) -> bool:
         return len(self._image_files) > 0
 
@@ -62,38 +170,298 @@ class ImageListManager:
         if enabled != self._shuffle:
             if self._shuffle and not enabled:
                 actual_index = self._shuffle_table[self._current_index]
-                self._current_index = actual_index
+                self._current_index = self.get_sorted_position(actual_index)
             
             self._shuffle = enabled
 
     def toggle_shuffle(self):
         self.set_shuffle(not self._shuffle)
 
-    def _filter_image_files(self, files: List[Path]) -> List[Path]:
+    def _filter_image_files(self, files: Iterable[PathLike]) -> List[PathLike]:
         valid_files = []
-        supported_extensions = {'.jpg', '.jpeg', '.png', '.bmp', '.gif'}
-        
+
         for f in files:
-            if not isinstance(f, Path):
-                f = Path(f)
-            if f.exists() and f.suffix.lower() in supported_extensions:
+            if is_archive_file(f) and os.path.isfile(f):
+                # 開いたアーカイブは中の画像に展開する
+                valid_files.extend(self._list_archive_images(f))
+            elif self._is_supported(f) and image_exists(f):
                 valid_files.append(f)
         
-        return sorted(valid_files, key=natural_path_sort_key)
+        return valid_files
+
+    @staticmethod
+    def _list_archive_images(archive_path: PathLike) -> List[str]:
+        try:
+            members = list_archive_members(archive_path)
+        except OSError as e:
+            print(f"アーカイブの読み込みエラー: {e}")
+            return []
+        archive_path = os.fspath(archive_path)
+        return [get_member_path(archive_path, m.name) for m in members if has_image_extension(m.name)]
+
+    @staticmethod
+    def _is_supported(path: PathLike) -> bool:
+        return os.path.splitext(path)[1].lower() in supported_image_extensions()
+
+    def _sort_image_files(self, files: List[PathLike]) -> Tuple[List[PathLike], List[str]]:
+        # キーはファイルごとに一度だけ計算する
+        with perf_trace.measure('list_sort') as timer:
+            keys = list(map(natural_path_sort_key, files))
+            order = sorted(range(len(files)), key=keys.__getitem__)
+            timer.detail = str(len(files))
+            return [files[i] for i in order], [keys[i] for i in order]
+
+    def _sort_key_at(self, index: int) -> str:
+        return self._image_files.get_sort_key(index)
+
+    def _bisect_right(self, key: str, prefix_only: bool = False) -> int:
+        # prefix_onlyを指定すると、keyで始まるキーの範囲の終端を返す
+        low, high = 0, len(self._image_files)
+        while low < high:
+            middle = (low + high) // 2
+            middle_key = self._sort_key_at(middle)
+            if prefix_only:
+                middle_key = middle_key[:len(key)]
+            if key < middle_key:
+                high = middle
+            else:
+                low = middle + 1
+        return low
+
+    def _bisect_left(self, key: str) -> int:
+        low, high = 0, len(self._image_files)
+        while low < high:
+            middle = (low + high) // 2
+            if self._sort_key_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _to_actual_index(self, raw_index: int) -> int:
+        if self._shuffle and self._shuffle_table:
+            return self._shuffle_table[raw_index]
+        return self.get_sorted_index(raw_index)
+
+    def _rebuild_sort_order(self):
+        if self._sort_mode == SORT_BY_NAME:
+            self._sort_order = None
+            self._sort_positions = None
+            return
+
+        # 値はファイル番号ごとの配列から引くだけのため、再度statやヘッダーの読み込みは行わない
+        # 値が同じ画像は名前順のまま並ぶ
+        with perf_trace.measure('sort_order') as timer:
+            timer.detail = self._sort_mode
+            column = self._metadata.get_column(self._sort_mode, self._image_files.get_file_id_limit())
+            values = [column[file_id] for file_id in self._image_files.get_file_ids()]
+            order = array('I', sorted(range(len(values)), key=values.__getitem__))
+            positions = array('I', bytes(order.itemsize * len(order)))
+            for position, index in enumerate(order):
+                positions[index] = position
+            self._sort_order = order
+            self._sort_positions = positions
 
     def _generate_shuffle_table(self):
-        if not self._image_files:
-            self._shuffle_table = []
+        sequence = array('I', range(len(self._image_files)))
+        random.shuffle(sequence)
+        self._shuffle_table = sequence
+
+    def add_scanned_files(self, files: List[PathLike]):
+        # スキャン結果は存在と形式を確認済みのため、そのままソート済みリストにマージする
+        self._insert_files(list(map(os.fspath, files)))
+
+    def add_files(self, files: List[PathLike]):
+        self._insert_files(self._filter_image_files(files))
+
+    def _insert_files(self, files: List[PathLike]):
+        if not files:
             return
 
-        n_images = len(self._image_files)
-        if n_images > 0:
-            sequence = list(range(n_images))
-            random.shuffle(sequence)
-            self._shuffle_table = sequence
+        new_files, new_keys = self._sort_image_files(files)
+        old_count = len(self._image_files)
+        actual_index = self.get_current_index() if old_count else 0
+        with perf_trace.measure('list_merge') as timer:
+            timer.detail = f'{len(new_files)} into {old_count}'
+            new_position = self._merge_sorted(new_files, new_keys)
+        self._rebuild_sort_order()
+
+        if old_count == 0:
+            self._current_index = 0
+            self._generate_shuffle_table()
+            return
+
+        if new_position is None:
+            added_indices = range(old_count, old_count + len(new_files))
         else:
-            self._shuffle_table = []
+            # 表示中の画像とシャッフル位置が変わらないよう、インデックスを付け替える
+            self._shuffle_table = array('I', map(new_position.__getitem__, self._shuffle_table))
+            actual_index = new_position[actual_index]
+            added_indices = new_position[old_count:]
+        if not self._shuffle:
+            self._current_index = self.get_sorted_position(actual_index)
+
+        # 新しいファイルはシャッフル順の未表示部分に混ぜる
+        # 未表示部分は既にランダムな順のため、追加分だけを1つずつランダムな位置と入れ替えれば一様になる
+        first = self._current_index + 1 if self._shuffle else 0
+        table = self._shuffle_table
+        table.extend(added_indices)
+        for i in range(len(table) - len(new_files), len(table)):
+            j = random.randint(first, i)
+            table[i], table[j] = table[j], table[i]
+
+    def find_image_index(self, path: PathLike) -> Optional[int]:
+        # 名前順でのインデックスを返す（一覧になければNone）
+        # 大文字小文字や先頭の0だけが違う名前は同じキーになるため、キーが等しい範囲を文字列で確かめる
+        path = os.fspath(path)
+        key = natural_path_sort_key(path)
+        index = self._bisect_right(key) - 1
+        while index >= 0 and self._sort_key_at(index) == key:
+            if self._image_files.get_path_string(index) == path:
+                return index
+            index -= 1
+        return None
+
+    def get_directory_file_names(self, directory: str) -> Set[str]:
+        # ディレクトリ直下で一覧に入っているファイル名を返す
+        # アーカイブ内の画像は、アーカイブのファイル名として数える
+        start, end = self._get_range_under(directory)
+        prefix = os.path.join(directory, '')
+        first_components: Dict[str, Optional[str]] = {}
+        names = set()
+        for index in range(start, end):
+            entry_directory = self._image_files.get_directory(index)
+            if entry_directory == directory:
+                names.add(self._image_files.get_name(index))
+                continue
+            if entry_directory not in first_components:
+                first_component = None
+                if entry_directory.startswith(prefix):
+                    first_component = entry_directory[len(prefix):].split(os.sep, 1)[0]
+                    if not is_archive_file(first_component):
+                        first_component = None
+                first_components[entry_directory] = first_component
+            if first_components[entry_directory] is not None:
+                names.add(first_components[entry_directory])
+        return names
+
+    def remove_files(self, paths: Iterable[PathLike], directories: Iterable[PathLike] = ()) -> List[Path]:
+        # 指定したファイルと、ディレクトリ（アーカイブ）以下のファイルを一覧から除き、除いたパスを返す
+        indices = set()
+        for path in paths:
+            index = self.find_image_index(path)
+            if index is not None:
+                indices.add(index)
+        for directory in directories:
+            directory = os.fspath(directory)
+            prefix = os.path.join(directory, '')
+            start, end = self._get_range_under(directory)
+            indices.update(i for i in range(start, end)
+                           if self._image_files.get_path_string(i).startswith(prefix))
+
+        removed = [self._image_files[i] for i in sorted(indices)]
+        self._remove_indices(indices)
+        return removed
+
+    def rename_files(self, renames: List[Tuple[PathLike, PathLike]]):
+        # 名前が変わったファイルは、表示中であればそのまま表示を続け、シャッフル順での位置も引き継ぐ
+        new_paths = [new_path for old_path, new_path in renames
+                     if self._is_supported(new_path) and self.find_image_index(new_path) is None]
+        self._insert_files(list(map(os.fspath, new_paths)))
+
+        replacements = {}
+        removed = set()
+        for old_path, new_path in renames:
+            old_index = self.find_image_index(old_path)
+            if old_index is None:
+                continue
+            removed.add(old_index)
+            new_index = self.find_image_index(new_path)
+            if new_index is not None:
+                replacements[old_index] = new_index
+        self._remove_indices(removed, replacements)
+
+    def _get_range_under(self, directory: PathLike) -> Tuple[int, int]:
+        # ディレクトリ以下のファイルはキーの先頭が共通になるため、名前順で連続した範囲に並ぶ
+        # （大文字小文字だけが違うディレクトリも含まれるので、呼び出し元でパスを確かめる）
+        prefix = natural_path_sort_key(directory) + '\x00'
+        return self._bisect_left(prefix), self._bisect_right(prefix, prefix_only=True)
+
+    def _remove_indices(self, indices: Set[int], replacements: Optional[Dict[int, int]] = None):
+        # replacementsは、削除するインデックスからシャッフル順での位置を引き継ぐインデックスへの対応
+        if not indices:
+            return
+        replacements = replacements or {}
+        old_count = len(self._image_files)
+
+        # 表示中の画像が消える場合は、表示順で次に残っている画像に移る
+        raw_index = self._current_index
+        survivor = None
+        for step in range(old_count):
+            actual_index = self._to_actual_index((raw_index + step) % old_count)
+            actual_index = replacements.get(actual_index, actual_index)
+            if actual_index not in indices:
+                survivor = actual_index
+                break
+
+        # 削除位置より前は動かさず、それ以降だけを詰め直す
+        start = min(indices)
+        tail_files = list(self._image_files.iter_path_strings(start))
+        tail_keys = list(self._image_files.iter_sort_keys(start))
+        tail_ids = self._image_files.get_file_ids()[start:]
+        new_position = array('q', range(start))
+        self._image_files.truncate(start)
+        for index, (path, file_id, key) in enumerate(zip(tail_files, tail_ids, tail_keys), start):
+            if index in indices:
+                new_position.append(-1)
+            else:
+                new_position.append(len(self._image_files))
+                self._image_files.append(path, file_id, key)
+        self._rebuild_sort_order()
+
+        targets = set(replacements.values())
+        table = array('I')
+        for actual_index in self._shuffle_table:
+            if actual_index in indices:
+                actual_index = replacements.get(actual_index)
+                if actual_index is None:
+                    continue
+            elif actual_index in targets:
+                continue
+            table.append(new_position[actual_index])
+        self._shuffle_table = table
+
+        self._current_index = 0
+        if survivor is not None:
+            self.set_current_image_index(new_position[survivor])
+
+    def _merge_sorted(self, new_files: List[PathLike], new_keys: List[str]) -> Optional[array]:
+        # ソート済みの追加分をマージし、旧インデックス（追加分は旧件数以降）から新しい位置への対応を返す
+        # 末尾に追加しただけで既存の位置が変わらない場合はNoneを返す
+        old_count = len(self._image_files)
+
+        # 追加分より前に並ぶ部分は動かさず、それ以降だけをマージする
+        start = self._bisect_right(new_keys[0])
+        if start == old_count:
+            # スキャン中のように末尾への追加であれば、そのまま連結するだけで済む
+            self._image_files.extend(new_files, sort_keys=new_keys)
+            return None
+
+        tail_files = list(self._image_files.iter_path_strings(start))
+        tail_keys = list(self._image_files.iter_sort_keys(start))
+        tail_ids = self._image_files.get_file_ids()[start:]
+        merged = heapq.merge(
+            zip(tail_keys, range(start, old_count)),
+            ((key, old_count + i) for i, key in enumerate(new_keys)),
+        )
 
-    def add_files(self, files: List[Path]):
-        all_files = self._image_files + files
-        self.set_image_files(all_files, self._current_index)
+        new_position = array('I', range(start))
+        new_position.extend(range(old_count - start + len(new_files)))
+        self._image_files.truncate(start)
+        for position, (key, source_index) in enumerate(merged, start):
+            new_position[source_index] = position
+            if source_index < old_count:
+                self._image_files.append(tail_files[source_index - start], tail_ids[source_index - start], key)
+            else:
+                self._image_files.append(new_files[source_index - old_count], sort_key=key)
+        return new_position
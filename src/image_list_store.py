@@ -0,0 +1,192 @@
+import itertools
+import os
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from natural_sort import natural_directory_sort_prefix, natural_sort_key_component
+from session_store import FS_ENCODING, FS_ERRORS
+
+
+PathLike = Union[str, Path]
+
+
+class ImageListStore:
+    # 1ファイルあたり、ディレクトリ番号・名前の終端位置・エンコード済みの名前だけを保持する
+    # Pathオブジェクトは参照されたときに初めて作る
+    # 各ファイルには並べ替えても変わらない番号を振り、メタデータなどの参照に使う
+    # 自然順のキーもディレクトリ部分とファイル名部分に分けて保持し、探索やマージで計算し直さない
+    def __init__(self, paths: Iterable[PathLike] = (), sort_keys: Optional[Iterable[str]] = None):
+        self._directories: List[str] = []
+        self._directory_keys: List[str] = []
+        self._directory_ids: Dict[str, int] = {}
+        self._directory_paths: List[Optional[Path]] = []
+        self._file_ids = array('I')
+        self._next_file_id = 0
+        self._file_directories = array('I')
+        self._name_ends = array('Q')
+        self._names = bytearray()
+        self._key_ends = array('Q')
+        self._keys = bytearray()
+        self.extend(paths, sort_keys=sort_keys)
+
+    def __len__(self) -> int:
+        return len(self._file_directories)
+
+    def __getitem__(self, index: int) -> Path:
+        directory_path = self._get_directory_path(self._file_directories[index])
+        return directory_path / self.get_name(index)
+
+    def __iter__(self) -> Iterator[Path]:
+        for index in range(len(self)):
+            yield self[index]
+
+    def get_name(self, index: int) -> str:
+        if index < 0:
+            index += len(self)
+        end = self._name_ends[index]
+        start = self._name_ends[index - 1] if index > 0 else 0
+        return self._names[start:end].decode(FS_ENCODING, FS_ERRORS)
+
+    def get_sort_key(self, index: int) -> str:
+        # natural_path_sort_key(パス)と同じキーを返す
+        end = self._key_ends[index]
+        start = self._key_ends[index - 1] if index > 0 else 0
+        return (self._directory_keys[self._file_directories[index]]
+                + self._keys[start:end].decode('utf-8', 'surrogatepass'))
+
+    def iter_sort_keys(self, start: int = 0) -> Iterator[str]:
+        directory_keys = self._directory_keys
+        file_directories = self._file_directories
+        key_ends = self._key_ends
+        keys = self._keys
+        key_start = key_ends[start - 1] if start > 0 else 0
+        for index in range(start, len(self)):
+            key_end = key_ends[index]
+            yield directory_keys[file_directories[index]] + keys[key_start:key_end].decode('utf-8', 'surrogatepass')
+            key_start = key_end
+
+    def get_file_id(self, index: int) -> int:
+        return self._file_ids[index]
+
+    def get_file_ids(self) -> array:
+        return self._file_ids
+
+    def get_file_id_limit(self) -> int:
+        # 振られたファイル番号はすべてこの値より小さい
+        return self._next_file_id
+
+    def iter_entries(self, start: int = 0) -> Iterator[Tuple[int, str, str]]:
+        # (ファイル番号, ディレクトリ, ファイル名)を順に返す
+        for index in range(start, len(self)):
+            yield self._file_ids[index], self.get_directory(index), self.get_name(index)
+
+    def get_directory(self, index: int) -> str:
+        return self._directories[self._file_directories[index]]
+
+    def get_path_string(self, index: int) -> str:
+        return os.path.join(self.get_directory(index), self.get_name(index))
+
+    def iter_path_strings(self, start: int = 0) -> Iterator[str]:
+        # ディレクトリ名は区切り文字付きで一度だけ用意し、名前は順に切り出して連結する
+        prefixes = [os.path.join(d, '') if d else '' for d in self._directories]
+        file_directories = self._file_directories
+        name_ends = self._name_ends
+        names = self._names
+        name_start = name_ends[start - 1] if start > 0 else 0
+        for index in range(start, len(self)):
+            name_end = name_ends[index]
+            name = names[name_start:name_end].decode(FS_ENCODING, FS_ERRORS)
+            yield prefixes[file_directories[index]] + name
+            name_start = name_end
+
+    def append(self, path: PathLike, file_id: Optional[int] = None, sort_key: Optional[str] = None):
+        self.extend((path,), None if file_id is None else (file_id,),
+                    None if sort_key is None else (sort_key,))
+
+    def extend(self, paths: Iterable[PathLike], file_ids: Optional[Iterable[int]] = None,
+               sort_keys: Optional[Iterable[str]] = None):
+        # 並べ替えで入れ直すときは元のファイル番号を指定する
+        # 計算済みのキー（natural_path_sort_keyの値）があれば渡すと、そのまま使う
+        new_ids = itertools.count(self._next_file_id)
+        directory_ids = self._directory_ids
+        directory_keys = self._directory_keys
+        file_directories = self._file_directories
+        name_ends = self._name_ends
+        names = self._names
+        key_ends = self._key_ends
+        keys = self._keys
+        for path, file_id, sort_key in zip(paths, new_ids if file_ids is None else file_ids,
+                                           itertools.repeat(None) if sort_keys is None else sort_keys):
+            self._file_ids.append(file_id)
+            directory, name = os.path.split(os.fspath(path))
+            directory_id = directory_ids.get(directory)
+            if directory_id is None:
+                directory_id = self._add_directory(directory)
+            file_directories.append(directory_id)
+            names += name.encode(FS_ENCODING, FS_ERRORS)
+            name_ends.append(len(names))
+            if sort_key is None:
+                name_key = natural_sort_key_component(name)
+            else:
+                name_key = sort_key[len(directory_keys[directory_id]):]
+            keys += name_key.encode('utf-8', 'surrogatepass')
+            key_ends.append(len(keys))
+        if file_ids is None:
+            self._next_file_id = next(new_ids)
+
+    def truncate(self, length: int):
+        # length件目以降を削除する（ディレクトリ名の表は残す）
+        if length >= len(self):
+            return
+        names_end = self._name_ends[length - 1] if length > 0 else 0
+        keys_end = self._key_ends[length - 1] if length > 0 else 0
+        del self._file_ids[length:]
+        del self._file_directories[length:]
+        del self._name_ends[length:]
+        del self._names[names_end:]
+        del self._key_ends[length:]
+        del self._keys[keys_end:]
+
+    def get_memory_usage(self) -> int:
+        return (self._file_ids.itemsize * len(self._file_ids)
+                + self._file_directories.itemsize * len(self._file_directories)
+                + self._name_ends.itemsize * len(self._name_ends)
+                + len(self._names)
+                + self._key_ends.itemsize * len(self._key_ends)
+                + len(self._keys)
+                + sum(len(d) for d in self._directories)
+                + sum(len(k) for k in self._directory_keys))
+
+    def _add_directory(self, directory: str) -> int:
+        directory_id = len(self._directories)
+        self._directory_ids[directory] = directory_id
+        self._directories.append(directory)
+        self._directory_keys.append(natural_directory_sort_prefix(directory))
+        self._directory_paths.append(None)
+        return directory_id
+
+    def _get_directory_path(self, directory_id: int) -> Path:
+        directory_path = self._directory_paths[directory_id]
+        if directory_path is None:
+            directory_path = Path(self._directories[directory_id])
+            self._directory_paths[directory_id] = directory_path
+        return directory_path
+
+
+class ImageListView:
+    # 一覧をコピーせずに読み取り専用で参照する
+    def __init__(self, store: ImageListStore):
+        self._store = store
+
+    def __len__(self) -> int:
+        return len(self._store)
+
+    def __getitem__(self, index: int) -> Path:
+        return self._store[index]
+
+    def __iter__(self) -> Iterator[Path]:
+        return iter(self._store)
+
+    def iter_path_strings(self) -> Iterator[str]:
+        return self._store.iter_path_strings()
@@ -0,0 +1,67 @@
+import math
+from pathlib import Path
+from typing import Optional, Tuple
+
+from PyQt6.QtCore import Qt, QBuffer, QByteArray, QSize
+from PyQt6.QtGui import QImage, QImageReader
+
+from archive_reader import is_archive_member, read_image_bytes
+
+
+def reduced_decode_size(full_size: QSize, target_size: QSize) -> QSize:
+    fitted = full_size.scaled(target_size, Qt.AspectRatioMode.KeepAspectRatio)
+    if fitted.isEmpty():
+        return full_size
+
+    # 1/2, 1/4, 1/8...の縮小率はJPEGのDCTスケーリングでほぼ無償でデコードでき、
+    # リサイズ時の余裕にもなる
+    denominator = 1
+    while (full_size.width() // (denominator * 2) >= fitted.width()
+           and full_size.height() // (denominator * 2) >= fitted.height()):
+        denominator *= 2
+
+    if denominator == 1:
+        return full_size
+    return QSize(math.ceil(full_size.width() / denominator),
+                 math.ceil(full_size.height() / denominator))
+
+
+class _BufferedImageReader(QImageReader):
+    # メモリ上のデータから読むリーダー。バッファはリーダーと同じ期間だけ保持する
+    def __init__(self, data: bytes):
+        self._buffer = QBuffer()
+        self._buffer.setData(QByteArray(data))
+        self._buffer.open(QBuffer.OpenModeFlag.ReadOnly)
+        super().__init__(self._buffer)
+
+
+def open_image_reader(image_path: Path, data: Optional[bytes] = None) -> QImageReader:
+    # dataを渡すと、読み込み済みのファイル内容からデコードする（形式は内容から判定される）
+    # アーカイブ内の画像は、メンバーの内容を読み出してから渡す
+    if data is None and is_archive_member(image_path):
+        try:
+            data = read_image_bytes(image_path)
+        except OSError as e:
+            print(f"アーカイブの読み込みエラー: {e}")
+            data = b''
+    if data is not None:
+        return _BufferedImageReader(data)
+    return QImageReader(str(image_path))
+
+
+def decode_image(image_path: Path, target_size: Optional[QSize] = None,
+                 data: Optional[bytes] = None) -> Tuple[QImage, QSize]:
+    # QImageはGUIスレッド以外でも生成できるため、ワーカーからも呼び出される
+    reader = open_image_reader(image_path, data)
+
+    # ヘッダーから元のサイズを読み、表示サイズに近い解像度で直接デコードする
+    full_size = reader.size()
+    if target_size is not None and full_size.isValid() and not target_size.isEmpty():
+        decode_size = reduced_decode_size(full_size, target_size)
+        if decode_size != full_size:
+            reader.setScaledSize(decode_size)
+
+    image = reader.read()
+    if not full_size.isValid():
+        full_size = image.size()
+    return image, full_size
@@ -0,0 +1,159 @@
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, QSize, pyqtSignal
+from PyQt6.QtGui import QImage, QPixmap
+
+from archive_reader import read_image_bytes
+from image_cache import ImageCache, CacheKey
+from image_loader import decode_image
+
+
+@dataclass
+class DecodeTiming:
+    # 予約からワーカーが取りかかるまで・ファイルの読み込み・デコードそれぞれの時間(ms)
+    queued_ms: float = 0.0
+    io_ms: float = 0.0
+    decode_ms: float = 0.0
+    read_failed: bool = False
+
+
+class _DecodeJob(QRunnable):
+    def __init__(self, prefetcher: 'ImagePrefetcher', key: CacheKey, target_size: Optional[QSize]):
+        super().__init__()
+        self._prefetcher = prefetcher
+        self._key = key
+        self._target_size = target_size
+        self._scheduled_at = time.monotonic()
+
+    def run(self):
+        # 開始前にジャンプやリスト変更で不要になっていればデコードしない
+        if not self._prefetcher.is_wanted(self._key):
+            self._emit('job_skipped', self._key)
+            return
+
+        # 読み込みとデコードを分けて計り、スライドショーの遅延の原因を記録できるようにする
+        started_at = time.monotonic()
+        timing = DecodeTiming(queued_ms=(started_at - self._scheduled_at) * 1000)
+        image_path = Path(self._key[0])
+        try:
+            data = read_image_bytes(image_path)
+        except OSError:
+            data = b''
+            timing.read_failed = True
+        read_at = time.monotonic()
+        timing.io_ms = (read_at - started_at) * 1000
+
+        image, full_size = decode_image(image_path, self._target_size, data)
+        timing.decode_ms = (time.monotonic() - read_at) * 1000
+        self._emit('image_decoded', self._key, image, full_size, timing)
+
+    def _emit(self, signal_name: str, *args):
+        # シグナルの参照も破棄されたオブジェクトへのアクセスになるため、まとめて保護する
+        try:
+            getattr(self._prefetcher, signal_name).emit(*args)
+        except RuntimeError:
+            # 終了処理でプリフェッチャーが先に破棄された場合
+            pass
+
+
+class ImagePrefetcher(QObject):
+    # ワーカースレッドから発行され、GUIスレッドで受け取る
+    image_decoded = pyqtSignal(object, QImage, QSize, object)
+    job_skipped = pyqtSignal(object)
+    # キャッシュに入った・デコードに失敗した画像のキー（GUIスレッドで発行）
+    image_ready = pyqtSignal(object, object)
+    image_failed = pyqtSignal(object, object)
+    # 不要になってデコードしなかった・結果を捨てた画像のキー（GUIスレッドで発行）
+    image_dropped = pyqtSignal(object)
+
+    def __init__(self, image_cache: ImageCache, next_count: int = 2, prev_count: int = 1,
+                 max_threads: int = 2, parent=None):
+        super().__init__(parent)
+        self._image_cache = image_cache
+        self._next_count = next_count
+        self._prev_count = prev_count
+        self._wanted: FrozenSet[CacheKey] = frozenset()
+        self._in_flight: Set[CacheKey] = set()
+        self._stats: Dict[str, int] = {
+            'scheduled': 0,
+            'completed': 0,
+            'discarded': 0,
+            'failed': 0,
+        }
+
+        self._thread_pool = QThreadPool(self)
+        self._thread_pool.setMaxThreadCount(max_threads)
+
+        self.image_decoded.connect(self._on_image_decoded)
+        self.job_skipped.connect(self._on_job_skipped)
+
+    def is_wanted(self, key: CacheKey) -> bool:
+        # ワーカーからも参照されるため、集合は丸ごと置き換えて更新する
+        return key in self._wanted
+
+    def get_counts(self) -> Tuple[int, int]:
+        return self._next_count, self._prev_count
+
+    def set_counts(self, next_count: int, prev_count: int):
+        self._next_count = max(0, next_count)
+        self._prev_count = max(0, prev_count)
+
+    def prefetch(self, paths: List[Path], target_size: Optional[QSize] = None):
+        keys = []
+        for path in paths:
+            key = ImageCache.make_key(path)
+            if key is not None:
+                keys.append(key)
+        self._wanted = frozenset(keys)
+
+        for key in keys:
+            if self._image_cache.contains(key, target_size) or key in self._in_flight:
+                continue
+            self._in_flight.add(key)
+            self._stats['scheduled'] += 1
+            self._thread_pool.start(_DecodeJob(self, key, target_size))
+
+    def is_in_flight(self, key: CacheKey) -> bool:
+        return key in self._in_flight
+
+    def cancel(self):
+        self._wanted = frozenset()
+
+    def get_stats(self) -> Dict[str, int]:
+        stats = dict(self._stats)
+        cache_stats = self._image_cache.get_stats()
+        stats['hits'] = cache_stats['hits']
+        stats['misses'] = cache_stats['misses']
+        return stats
+
+    def shutdown(self):
+        self.cancel()
+        self._thread_pool.waitForDone()
+
+    def _on_image_decoded(self, key: CacheKey, image: QImage, full_size: QSize, timing: DecodeTiming):
+        self._in_flight.discard(key)
+        if image.isNull():
+            self._stats['failed'] += 1
+            self.image_failed.emit(key, timing)
+            return
+        if key not in self._wanted:
+            self._stats['discarded'] += 1
+            self.image_dropped.emit(key)
+            return
+        if self._image_cache.contains(key, image.size()):
+            self._stats['discarded'] += 1
+            self.image_ready.emit(key, timing)
+            return
+
+        # QPixmapはGUIスレッドでのみ生成できる
+        self._image_cache.put(key, QPixmap.fromImage(image), full_size)
+        self._stats['completed'] += 1
+        self.image_ready.emit(key, timing)
+
+    def _on_job_skipped(self, key: CacheKey):
+        self._in_flight.discard(key)
+        self._stats['discarded'] += 1
+        self.image_dropped.emit(key)
@@ -1,32 +1,74 @@
+# 起動時間の計測の起点にするため、最初に読み込む
+import startup_trace
+
 from pathlib import Path
+from typing import Optional
 import sys
 import argparse
 
-from PyQt6.QtCore import Qt, QSize
+from PyQt6.QtCore import Qt, QSize, QTimer
 from PyQt6.QtWidgets import (
-    QApplication, QMainWindow, QLabel, QSizePolicy,
+    QApplication, QMainWindow, QSizePolicy, QStackedWidget,
 )
-from PyQt6.QtGui import QKeyEvent, QIcon
+from PyQt6.QtGui import QKeyEvent, QIcon, QImage
 
+from directory_scanner import DirectoryScanner
+from directory_watcher import DirectoryWatcher
+from image_canvas import ImageCanvas
 from image_display_manager import ImageDisplayManager
 from image_list_manager import ImageListManager
+from image_prefetcher import ImagePrefetcher
 from settings_manager import SettingsManager
+from slideshow import Slideshow
+from thumbnail_cache import ThumbnailCache
+from metadata_index import MetadataScanner, SORT_BY_NAME, SORT_MODES
 from clipboard_manager import ClipboardManager
-from file_dialog_manager import FileDialogManager
 from ui_manager import UIManager
+import perf_trace
+
+# サムネイル一覧・拡大表示・ダイアログ・単一インスタンス・計測表示用のモジュールは、
+# 最初の画像の表示に必要ないため使うときに読み込む（特にQListViewの派生クラスの定義は重い）
+
+
+# キーリピート中は、この時間だけ入力が止まってから本来の画像を読み込む
+NAVIGATION_SETTLE_MS = 150
+# リサイズ中は粗い拡縮で追従し、止まってから高品質に描き直す
+RESIZE_SETTLE_MS = 150
+PREVIEW_LOOK_AHEAD = 3
 
 
 class ImageViewer(QMainWindow):
-    def __init__(self, image_files, recursive=False):
+    def __init__(self, image_files, recursive=False, directories=None,
+                 settings_manager: Optional[SettingsManager] = None):
         super().__init__()
         
         self._recursive = recursive
-        self._setup_window_icon()
-        self._initialize_managers()
+        self._scan_history_entry = None
+        self._scan_recursive = False
+        self.thumbnail_grid = None
+        self.zoom_view = None
+        self.perf_overlay = None
+        self._initialize_managers(settings_manager)
         self._setup_window()
-        self._load_initial_data(image_files)
+        startup_trace.mark('managers and settings')
+        self._load_initial_data(image_files, directories)
+        startup_trace.mark('initial list')
         self._setup_ui()
+        startup_trace.mark('widgets')
         self._show_current_image()
+        startup_trace.mark('first image decoded')
+        self._start_initial_scan(image_files, directories)
+
+        # アイコンなど表示に必要ない準備は、ウィンドウを表示した後に行う
+        QTimer.singleShot(0, self._finish_startup)
+
+    def _finish_startup(self):
+        startup_trace.mark('event loop started')
+        self._setup_window_icon()
+        startup_trace.mark('window icon')
+        self.thumbnail_cache.prune_disk_cache()
+        if self.image_list_manager.has_images() or not self.directory_scanner.is_scanning():
+            startup_trace.finish('startup finished')
 
     def _setup_window_icon(self):
         icon = QIcon()
@@ -49,17 +91,71 @@ class ImageViewer(QMainWindow):
         icon.addFile(str(icon_path / 'icon_256.png'), QSize(256, 256))
         self.setWindowIcon(icon)
 
-    def _initialize_managers(self):
-        self.settings_manager = SettingsManager()
+    def _initialize_managers(self, settings_manager: Optional[SettingsManager]):
+        # 起動時に読み込んだ設定があればそれを使い、設定ファイルを二度読まない
+        self.settings_manager = settings_manager or SettingsManager()
         self.image_list_manager = ImageListManager()
+        self.image_list_manager.set_sort_mode(self.settings_manager.get_sort_mode())
         
-        self.image_label = QLabel(self)
-        self.image_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-        self.image_label.setMinimumSize(0, 0)
+        self.image_canvas = ImageCanvas(self)
         
-        self.image_display_manager = ImageDisplayManager(self.image_label)
+        self.image_display_manager = ImageDisplayManager(
+            self.image_canvas,
+            self.settings_manager.get_image_cache_bytes()
+        )
+        self.image_prefetcher = ImagePrefetcher(
+            self.image_display_manager.get_image_cache(), parent=self
+        )
+        self.thumbnail_cache = ThumbnailCache(
+            self.settings_manager.cache_dir / 'thumbnails',
+            self.settings_manager.get_thumbnail_cache_bytes(),
+            disk_max_bytes=self.settings_manager.get_thumbnail_disk_cache_bytes(),
+            parent=self
+        )
+        self.clipboard_manager = ClipboardManager(
+            self.settings_manager.is_clipboard_encoded_data_enabled(),
+            parent=self
+        )
+        self.slideshow = Slideshow(
+            self.image_list_manager,
+            self.image_display_manager,
+            self.image_prefetcher,
+            self.settings_manager.get_slideshow_interval_ms(),
+            parent=self
+        )
+        self.slideshow.image_shown.connect(self._on_slideshow_image_shown)
+        self.slideshow.prefetch_requested.connect(self._prefetch_neighbors)
         self.ui_manager = UIManager(self)
 
+        self.thumbnail_cache.thumbnail_ready.connect(self._on_thumbnail_ready)
+
+        self._load_timer = QTimer(self)
+        self._load_timer.setSingleShot(True)
+        self._load_timer.timeout.connect(self._show_current_image)
+
+        self._resize_timer = QTimer(self)
+        self._resize_timer.setSingleShot(True)
+        self._resize_timer.setInterval(RESIZE_SETTLE_MS)
+        self._resize_timer.timeout.connect(self.image_display_manager.refresh_display)
+
+        self.directory_scanner = DirectoryScanner(
+            self.settings_manager.directory_index_file, parent=self
+        )
+        self.directory_scanner.batch_found.connect(self._on_scan_batch_found)
+        self.directory_scanner.progress_changed.connect(self._update_window_title)
+        self.directory_scanner.scan_finished.connect(self._on_scan_finished)
+
+        self.directory_watcher = DirectoryWatcher(
+            self.image_list_manager, self.settings_manager.directory_index_file, parent=self
+        )
+        self.directory_watcher.changes_found.connect(self._on_directory_changes)
+
+        self.metadata_scanner = MetadataScanner(
+            self.settings_manager.directory_index_file, parent=self
+        )
+        self.metadata_scanner.metadata_found.connect(self.image_list_manager.apply_metadata)
+        self.metadata_scanner.scan_finished.connect(self._on_metadata_scan_finished)
+
     def _setup_window(self):
         self.setWindowTitle('Image Viewer')
         self.setWindowFlags(self.windowFlags() | Qt.WindowType.WindowMaximizeButtonHint)
@@ -74,8 +170,11 @@ class ImageViewer(QMainWindow):
             window_geometry['height']
         )
 
-    def _load_initial_data(self, image_files):
-        if image_files:
+    def _load_initial_data(self, image_files, directories):
+        if directories:
+            self.image_list_manager.set_image_files(image_files, 0)
+            self._pending_directory_record = None
+        elif image_files:
             self.image_list_manager.set_image_files(image_files, 0)
             # コマンドライン引数からディレクトリが指定された場合の履歴記録
             # メニューバー作成後に更新するためフラグを設定
@@ -87,7 +186,9 @@ class ImageViewer(QMainWindow):
             self._pending_directory_record = None
 
     def _setup_ui(self):
-        self.setCentralWidget(self.image_label)
+        self.central_stack = QStackedWidget(self)
+        self.central_stack.addWidget(self.image_canvas)
+        self.setCentralWidget(self.central_stack)
         
         recent_directories = self.settings_manager.get_directory_history()
         self.ui_manager.create_menu_bar(
@@ -105,38 +206,198 @@ class ImageViewer(QMainWindow):
             self._pending_directory_record = None
 
     def _show_current_image(self):
+        self._load_timer.stop()
         current_path = self.image_list_manager.get_current_image_path()
         self.image_display_manager.load_and_display_image(current_path)
         self._update_window_title()
+        self._prefetch_neighbors()
+
+    def _prefetch_neighbors(self):
+        next_count, prev_count = self.image_prefetcher.get_counts()
+        neighbors = self.image_list_manager.get_neighbor_paths(next_count, prev_count)
+        # スライドショーが先読みの完了を待っている画像は、先読みの対象から外さない
+        pending_path = self.slideshow.get_pending_path()
+        if pending_path is not None:
+            neighbors.insert(0, pending_path)
+        self.image_prefetcher.prefetch(neighbors, self.image_display_manager.get_target_size())
 
     def _update_window_title(self):
         filename = self.image_display_manager.get_current_image_filename()
         if filename:
-            self.setWindowTitle(f'Image Viewer - {filename}')
+            title = f'Image Viewer - {filename}'
         else:
-            self.setWindowTitle('Image Viewer - No Image')
+            title = 'Image Viewer - No Image'
+
+        sort_mode = self.image_list_manager.get_sort_mode()
+        if sort_mode != SORT_BY_NAME:
+            title += f' [Sort: {sort_mode}]'
+
+        if self.slideshow.is_running():
+            title += ' [Slideshow]'
+
+        if self.directory_scanner.is_scanning():
+            found_count = self.directory_scanner.get_found_count()
+            title += f' [Scanning... {found_count} files]'
+        self.setWindowTitle(title)
+
+    def _start_initial_scan(self, image_files, directories):
+        if not directories:
+            # 一覧が大きいと要求の作成に時間がかかるため、画像を表示してから始める
+            QTimer.singleShot(0, self._start_metadata_scan)
+            return
+
+        # ディレクトリが1つだけ指定された場合は履歴に記録する
+        history_directory = directories[0] if len(directories) == 1 and not image_files else None
+        self._start_directory_scan(directories, self._recursive, history_directory)
+
+    def open_paths(self, image_files, directories, recursive: bool):
+        # 単一インスタンスで、後から起動されたときの引数を起動時と同じように開く
+        # 画像とディレクトリのインデックスはこのプロセスのキャッシュをそのまま使う
+        image_files = [Path(f) for f in image_files]
+        directories = [Path(d) for d in directories]
+        if image_files or directories:
+            if self.thumbnail_grid is not None and self.central_stack.currentWidget() is self.thumbnail_grid:
+                self._hide_thumbnail_grid()
+            elif self.zoom_view is not None and self.central_stack.currentWidget() is self.zoom_view:
+                self._hide_zoom_view()
+            self.slideshow.stop()
+            self.directory_scanner.cancel()
+            self.directory_watcher.stop()
+            self._recursive = recursive
+            self.image_list_manager.set_image_files(image_files, 0)
+            self._on_image_list_changed()
+            self._show_current_image()
+            if not directories:
+                self._record_directory_from_files(image_files)
+            self._start_initial_scan(image_files, directories)
+
+        if self.isMinimized():
+            self.showNormal()
+        self.raise_()
+        self.activateWindow()
+
+    def _open_directory(self, directory: Path, include_subdirs: bool):
+        self.image_list_manager.set_image_files([], 0)
+        self._on_image_list_changed()
+        self._show_current_image()
+        self._start_directory_scan([directory], include_subdirs, directory)
+
+    def _start_directory_scan(self, directories, include_subdirs: bool, history_directory=None):
+        if history_directory is not None:
+            self._scan_history_entry = (str(history_directory), include_subdirs)
+        else:
+            self._scan_history_entry = None
+        self._scan_recursive = include_subdirs
+        self.directory_watcher.stop()
+        self.directory_scanner.start(directories, include_subdirs)
+        self._update_window_title()
+
+    def _on_scan_batch_found(self, batch):
+        was_empty = not self.image_list_manager.has_images()
+        self.image_list_manager.add_scanned_files(batch)
+        self._on_image_list_changed()
+        if was_empty:
+            # 最初の画像が見つかった時点で表示する
+            self._show_current_image()
+            startup_trace.finish('first scanned image shown')
+        else:
+            self._prefetch_neighbors()
+
+    def _on_scan_finished(self, found_count: int):
+        startup_trace.finish('scan finished')
+        if self.image_list_manager.has_images() and self._scan_history_entry:
+            directory, include_subdirs = self._scan_history_entry
+            self.settings_manager.add_directory_to_history(directory, include_subdirs)
+            self._update_recent_directories_menu()
+        self._scan_history_entry = None
+        self._update_window_title()
+        # 読み込んだディレクトリの変更を監視し、増減したファイルだけを一覧に反映する
+        self.directory_watcher.start(self.directory_scanner.get_listed_directories(), self._scan_recursive)
+        self._start_metadata_scan()
+
+    def _on_directory_changes(self, changes):
+        current_path = self.image_list_manager.get_current_image_path()
+        removed = self.image_list_manager.remove_files(changes.removed, changes.removed_directories)
+        self.image_list_manager.rename_files(changes.renamed)
+        added = [path for path in changes.added + changes.modified
+                 if self.image_list_manager.find_image_index(path) is None]
+        self.image_list_manager.add_scanned_files(added)
+
+        # キャッシュは変わったファイルの分だけ破棄する
+        image_cache = self.image_display_manager.get_image_cache()
+        invalidated = removed + [old_path for old_path, _ in changes.renamed] + changes.modified
+        for path in invalidated:
+            image_cache.invalidate_path(path)
+            self.thumbnail_cache.invalidate(path)
+        if self.thumbnail_grid is not None:
+            self.thumbnail_grid.invalidate_thumbnails(invalidated)
+
+        self._on_image_list_changed()
+        if self.image_list_manager.get_current_image_path() != current_path:
+            self._show_current_image()
+            return
+        if current_path is not None and current_path in changes.modified:
+            self.image_display_manager.reload_image()
+        self._update_window_title()
+        self._prefetch_neighbors()
+        if added or changes.renamed:
+            self._start_metadata_scan()
+
+    def _start_metadata_scan(self):
+        # 並べ替え用のメタデータは、一覧が確定してから低い優先度で集める
+        self.metadata_scanner.start(
+            self.image_list_manager.get_generation(),
+            self.image_list_manager.get_metadata_requests()
+        )
+
+    def _on_metadata_scan_finished(self, generation: int):
+        if generation != self.image_list_manager.get_generation():
+            return
+        if self.image_list_manager.get_sort_mode() != SORT_BY_NAME:
+            self.image_list_manager.refresh_sort_order()
+            self._on_image_list_changed()
+            self._prefetch_neighbors()
+
+    def _set_sort_mode(self, sort_mode: str):
+        self.image_list_manager.set_sort_mode(sort_mode)
+        self.settings_manager.save_sort_mode(sort_mode)
+        self._on_image_list_changed()
+        self._update_window_title()
+        self._prefetch_neighbors()
+
+    def _cycle_sort_mode(self):
+        current = SORT_MODES.index(self.image_list_manager.get_sort_mode())
+        self._set_sort_mode(SORT_MODES[(current + 1) % len(SORT_MODES)])
 
     def _open_file_dialog(self):
+        from file_dialog_manager import FileDialogManager
+
         selected_files = FileDialogManager.select_files()
         if selected_files:
+            self.directory_scanner.cancel()
+            self.directory_watcher.stop()
             self.image_list_manager.set_image_files(selected_files, 0)
+            self._on_image_list_changed()
             self._show_current_image()
+            self._start_metadata_scan()
 
     def _open_directory_dialog(self):
+        from file_dialog_manager import FileDialogManager
+
         result = FileDialogManager.select_directory()
         if result:
             directory = Path(result.directory)
             if directory.is_dir():
-                files = FileDialogManager.get_directory_files(directory, result.include_subdirs)
-                self.image_list_manager.set_image_files(files, 0)
-                if self.image_list_manager.has_images():
-                    self.settings_manager.add_directory_to_history(str(directory), result.include_subdirs)
-                    self._update_recent_directories_menu()
-                self._show_current_image()
+                self._open_directory(directory, result.include_subdirs)
 
     def _copy_image_to_clipboard(self):
         current_path = self.image_list_manager.get_current_image_path()
-        ClipboardManager.copy_image_to_clipboard(current_path)
+        if current_path != self.image_display_manager.get_current_image_path():
+            return
+        self.clipboard_manager.copy_image_to_clipboard(
+            current_path,
+            self.image_display_manager.get_current_image_for_clipboard()
+        )
 
     def _copy_image_path(self):
         current_path = self.image_list_manager.get_current_image_path()
@@ -144,10 +405,86 @@ class ImageViewer(QMainWindow):
 
     def _toggle_h_flip(self):
         self.image_display_manager.toggle_h_flip()
+        if self.zoom_view is not None:
+            self.zoom_view.set_h_flip(self.image_display_manager.is_h_flip_enabled())
+
+    def _on_image_list_changed(self):
+        if self.thumbnail_grid is not None:
+            self.thumbnail_grid.reload()
+
+    def _toggle_thumbnail_grid(self):
+        if self.thumbnail_grid is not None and self.central_stack.currentWidget() is self.thumbnail_grid:
+            self._hide_thumbnail_grid()
+        else:
+            self._show_thumbnail_grid()
+
+    def _show_thumbnail_grid(self):
+        # グリッドは初めて使うときに作成する
+        if self.thumbnail_grid is None:
+            from thumbnail_grid import ThumbnailGridView
+
+            self.thumbnail_grid = ThumbnailGridView(self.image_list_manager, self.thumbnail_cache, self)
+            self.thumbnail_grid.image_activated.connect(self._on_grid_image_activated)
+            self.thumbnail_grid.close_requested.connect(self._hide_thumbnail_grid)
+            self.central_stack.addWidget(self.thumbnail_grid)
+
+        self.central_stack.setCurrentWidget(self.thumbnail_grid)
+        self.image_display_manager.stop_animation()
+        self.slideshow.stop()
+        self.thumbnail_grid.show_row(
+            self.image_list_manager.get_sorted_position(self.image_list_manager.get_current_index())
+        )
+        self.thumbnail_grid.setFocus()
+
+    def _hide_thumbnail_grid(self):
+        self.central_stack.setCurrentWidget(self.image_canvas)
+        self.setFocus()
         self.image_display_manager.refresh_display()
 
+    def _toggle_zoom_view(self):
+        if self.zoom_view is not None and self.central_stack.currentWidget() is self.zoom_view:
+            self._hide_zoom_view()
+        else:
+            self._show_zoom_view()
+
+    def _show_zoom_view(self):
+        current_path = self.image_list_manager.get_current_image_path()
+        if current_path is None:
+            return
+
+        if self.zoom_view is None:
+            from tiled_image_view import TiledImageView
+
+            self.zoom_view = TiledImageView(parent=self)
+            self.zoom_view.close_requested.connect(self._hide_zoom_view)
+            self.central_stack.addWidget(self.zoom_view)
+
+        # タイルが揃うまでは、表示中の縮小画像を拡大して代用する
+        self.central_stack.setCurrentWidget(self.zoom_view)
+        self.image_display_manager.stop_animation()
+        self.slideshow.stop()
+        self.zoom_view.set_image(
+            current_path,
+            self.image_display_manager.get_source_pixmap(),
+            self.image_display_manager.is_h_flip_enabled()
+        )
+        self.zoom_view.setFocus()
+
+    def _hide_zoom_view(self):
+        if self.zoom_view is not None:
+            self.zoom_view.release()
+        self.central_stack.setCurrentWidget(self.image_canvas)
+        self.setFocus()
+        self.image_display_manager.refresh_display()
+
+    def _on_grid_image_activated(self, row: int):
+        self.image_list_manager.set_current_image_index(self.image_list_manager.get_sorted_index(row))
+        self._hide_thumbnail_grid()
+        self._show_current_image()
+
     def _toggle_shuffle(self):
         self.image_list_manager.toggle_shuffle()
+        self._prefetch_neighbors()
 
     def _show_context_menu(self, position=None):
         context_menu = self.ui_manager.create_context_menu(
@@ -159,21 +496,72 @@ class ImageViewer(QMainWindow):
             self._toggle_shuffle,
             self.close,
             self.image_display_manager.is_h_flip_enabled(),
-            self.image_list_manager.is_shuffle_enabled()
+            self.image_list_manager.is_shuffle_enabled(),
+            self._toggle_thumbnail_grid,
+            self._toggle_zoom_view,
+            self.image_list_manager.get_sort_mode(),
+            self._set_sort_mode,
+            self._toggle_slideshow,
+            self.slideshow.is_running()
         )
         
         if position:
-            context_menu.exec(self.image_label.mapToGlobal(position))
+            context_menu.exec(self.image_canvas.mapToGlobal(position))
         else:
             context_menu.exec(self.mapToGlobal(self.rect().center()))
 
-    def _show_next_image(self):
+    def _toggle_slideshow(self):
+        self.slideshow.toggle()
+        self._update_window_title()
+
+    def _toggle_perf_overlay(self):
+        if self.perf_overlay is None:
+            from perf_overlay import PerfOverlay
+
+            self.perf_overlay = PerfOverlay(self.image_display_manager.get_image_cache(), self.image_canvas)
+        self.perf_overlay.toggle()
+
+    def _on_slideshow_image_shown(self):
+        # 次の切り替えに間に合うよう、表示した直後に先の画像を先読みする
+        self._update_window_title()
+        self._prefetch_neighbors()
+
+    def _show_next_image(self, auto_repeat: bool = False):
         self.image_list_manager.move_to_next()
-        self._show_current_image()
+        self._navigate(auto_repeat, forward=True)
 
-    def _show_prev_image(self):
+    def _show_prev_image(self, auto_repeat: bool = False):
         self.image_list_manager.move_to_previous()
-        self._show_current_image()
+        self._navigate(auto_repeat, forward=False)
+
+    def _navigate(self, auto_repeat: bool, forward: bool):
+        # インデックスはすぐに進め、重い読み込みは入力が落ち着くまで遅らせてまとめる
+        self.slideshow.restart_interval()
+        current_path = self.image_list_manager.get_current_image_path()
+        if current_path is None:
+            self._show_current_image()
+            return
+
+        if self.image_display_manager.display_cached_image(current_path):
+            self._update_window_title()
+        elif auto_repeat:
+            preview = self.thumbnail_cache.request_thumbnail(current_path, priority=2)
+            self.image_display_manager.display_preview(current_path, preview)
+            self._update_window_title()
+
+            if forward:
+                upcoming = self.image_list_manager.get_neighbor_paths(PREVIEW_LOOK_AHEAD, 0)
+            else:
+                upcoming = self.image_list_manager.get_neighbor_paths(0, PREVIEW_LOOK_AHEAD)
+            self.thumbnail_cache.request_thumbnails(upcoming, priority=1)
+
+        # 単発の入力では、キューに溜まった入力を処理した直後に読み込む
+        self._load_timer.start(NAVIGATION_SETTLE_MS if auto_repeat else 0)
+
+    def _on_thumbnail_ready(self, image_path: Path, image: QImage):
+        if (self.image_display_manager.is_preview()
+                and self.image_display_manager.get_current_image_path() == image_path):
+            self.image_display_manager.display_preview(image_path, image)
 
     def _resize_window(self, increase: bool):
         current_width = self.width()
@@ -199,16 +587,29 @@ class ImageViewer(QMainWindow):
         new_y = current_y - height_delta // 2
 
         self.setGeometry(new_x, new_y, new_width, new_height)
+        self._resize_timer.stop()
         self.image_display_manager.refresh_display()
 
     def resizeEvent(self, event):
         super().resizeEvent(event)
-        if self.image_label.pixmap():
-            self.image_display_manager.refresh_display()
+        if self.image_canvas.has_pixmap():
+            self.image_display_manager.refresh_display(fast=True)
+            self._resize_timer.start()
 
     def closeEvent(self, event):
+        self.slideshow.stop()
+        self.directory_scanner.shutdown()
+        self.directory_watcher.shutdown()
+        self.metadata_scanner.shutdown()
+        self.image_prefetcher.shutdown()
+        self.thumbnail_cache.shutdown()
+        self.clipboard_manager.shutdown()
+        self.image_display_manager.shutdown()
+        if self.zoom_view is not None:
+            self.zoom_view.shutdown()
+
         if self.image_list_manager.has_images():
-            files = self.image_list_manager.get_image_files()
+            files = self.image_list_manager.iter_image_path_strings()
             current_index = self.image_list_manager.get_current_index()
             self.settings_manager.save_recent_files(files, current_index)
         
@@ -221,9 +622,9 @@ class ImageViewer(QMainWindow):
         if event.key() == Qt.Key.Key_Q:
             self.close()
         elif event.key() == Qt.Key.Key_Right:
-            self._show_next_image()
+            self._show_next_image(event.isAutoRepeat())
         elif event.key() == Qt.Key.Key_Left:
-            self._show_prev_image()
+            self._show_prev_image(event.isAutoRepeat())
         elif event.key() == Qt.Key.Key_Plus or event.key() == Qt.Key.Key_Equal:
             self._resize_window(increase=True)
         elif event.key() == Qt.Key.Key_Minus:
@@ -232,6 +633,16 @@ class ImageViewer(QMainWindow):
             self._toggle_shuffle()
         elif event.key() == Qt.Key.Key_H:
             self._toggle_h_flip()
+        elif event.key() == Qt.Key.Key_G:
+            self._toggle_thumbnail_grid()
+        elif event.key() == Qt.Key.Key_Z:
+            self._toggle_zoom_view()
+        elif event.key() == Qt.Key.Key_S:
+            self._cycle_sort_mode()
+        elif event.key() == Qt.Key.Key_P:
+            self._toggle_slideshow()
+        elif event.key() == Qt.Key.Key_I:
+            self._toggle_perf_overlay()
         elif event.key() == Qt.Key.Key_Space:
             self._show_context_menu()
 
@@ -251,12 +662,7 @@ class ImageViewer(QMainWindow):
         
         directory = Path(directory_path)
         if directory.is_dir():
-            files = FileDialogManager.get_directory_files(directory, include_subdirs)
-            self.image_list_manager.set_image_files(files, 0)
-            if self.image_list_manager.has_images():
-                self.settings_manager.add_directory_to_history(str(directory), include_subdirs)
-                self._update_recent_directories_menu()
-            self._show_current_image()
+            self._open_directory(directory, include_subdirs)
 
     def _update_recent_directories_menu(self):
         recent_directories = self.settings_manager.get_directory_history()
@@ -283,27 +689,56 @@ def main():
     parser.add_argument('files', nargs='*', help='image files or directories.')
     parser.add_argument('-r', '--recursive', action='store_true', 
                        help='search subdirectories too.')
+    parser.add_argument('--single-instance', action='store_true',
+                       help='open the files in the running viewer if there is one.')
+    parser.add_argument('--startup-trace', action='store_true',
+                       help='print the time spent in each startup step.')
+    parser.add_argument('--perf-trace', metavar='FILE',
+                       help='record display and scan timings and write them to FILE on exit (.json or .csv).')
     args = parser.parse_args()
+    startup_trace.mark('modules imported')
+    if args.startup_trace:
+        startup_trace.enable()
+    if args.perf_trace:
+        perf_trace.enable(keep_events=True)
 
+    # ディレクトリの走査はウィンドウ表示後にバックグラウンドで行う
     image_files = []
+    directories = []
     for path in args.files:
         p = Path(path).resolve()
         if p.is_file():
             image_files.append(p)
         elif p.is_dir():
-            if args.recursive:
-                image_files.extend([f.resolve() for f in p.glob('**/*') if f.is_file()])
-            else:
-                image_files.extend([f.resolve() for f in p.glob('*') if f.is_file()])
+            directories.append(p)
+
+    settings_manager = SettingsManager()
+    single_instance = args.single_instance or settings_manager.is_single_instance_enabled()
+    if single_instance:
+        from single_instance import InstanceServer, send_to_running_instance
+
+        if send_to_running_instance(list(map(str, image_files)), list(map(str, directories)), args.recursive):
+            # 起動中のビューアーが開くため、ウィンドウは作らずに終了する
+            startup_trace.mark('handed over to running viewer')
+            return
 
     QApplication.setHighDpiScaleFactorRoundingPolicy(
         Qt.HighDpiScaleFactorRoundingPolicy.PassThrough
     )
     app = QApplication(sys.argv)
+    startup_trace.mark('QApplication')
 
-    viewer = ImageViewer(image_files, args.recursive)
+    viewer = ImageViewer(image_files, args.recursive, directories, settings_manager)
+    if single_instance:
+        instance_server = InstanceServer(parent=viewer)
+        instance_server.open_requested.connect(viewer.open_paths)
+        instance_server.listen()
     viewer.show()
-    sys.exit(app.exec())
+    startup_trace.mark('window shown')
+    exit_code = app.exec()
+    if args.perf_trace:
+        perf_trace.write(Path(args.perf_trace))
+    sys.exit(exit_code)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,308 @@
+import os
+import sqlite3
+import struct
+import time
+from array import array
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from PyQt6.QtCore import QObject, QThread, pyqtSignal
+
+from archive_reader import read_image_bytes, stat_image
+from directory_index import DirectoryIndex, ImageMetadata
+from image_loader import open_image_reader
+
+
+SORT_BY_NAME = 'name'
+SORT_BY_MTIME = 'mtime'
+SORT_BY_SIZE = 'size'
+SORT_BY_PIXELS = 'pixels'
+SORT_BY_CAPTURE_TIME = 'capture_time'
+SORT_MODES = [SORT_BY_NAME, SORT_BY_MTIME, SORT_BY_SIZE, SORT_BY_PIXELS, SORT_BY_CAPTURE_TIME]
+
+EXIF_SEARCH_BYTES = 128 * 1024
+METADATA_BATCH_INTERVAL = 0.2
+
+# (ファイル番号, ディレクトリ, ファイル名)
+MetadataRequest = Tuple[int, str, str]
+
+_EXIF_IFD_POINTER = 0x8769
+_DATE_TIME = 0x0132
+_DATE_TIME_ORIGINAL = 0x9003
+_DATE_TIME_DIGITIZED = 0x9004
+
+
+def _parse_exif_date(value: bytes) -> int:
+    # 'YYYY:MM:DD hh:mm:ss' -> YYYYMMDDhhmmss
+    digits = value[:19].replace(b':', b'').replace(b' ', b'')
+    if len(digits) != 14 or not digits.isdigit() or digits.startswith(b'0000'):
+        return 0
+    return int(digits)
+
+
+def _read_ifd(tiff: bytes, offset: int, byte_order: str) -> Dict[int, Tuple[int, int, int]]:
+    # タグ -> (型, 個数, 値またはオフセット)
+    entries = {}
+    if offset + 2 > len(tiff):
+        return entries
+    count = struct.unpack_from(byte_order + 'H', tiff, offset)[0]
+    for i in range(count):
+        entry_offset = offset + 2 + i * 12
+        if entry_offset + 12 > len(tiff):
+            break
+        tag, value_type, value_count, value = struct.unpack_from(byte_order + 'HHII', tiff, entry_offset)
+        entries[tag] = (value_type, value_count, value)
+    return entries
+
+
+def _read_ascii_tag(tiff: bytes, entry: Optional[Tuple[int, int, int]]) -> int:
+    if entry is None:
+        return 0
+    value_type, value_count, value_offset = entry
+    if value_type != 2 or value_count < 19 or value_offset + 19 > len(tiff):
+        return 0
+    return _parse_exif_date(tiff[value_offset:value_offset + value_count])
+
+
+def _parse_exif_capture_time(tiff: bytes) -> int:
+    if tiff[:2] == b'II':
+        byte_order = '<'
+    elif tiff[:2] == b'MM':
+        byte_order = '>'
+    else:
+        return 0
+    magic, ifd0_offset = struct.unpack_from(byte_order + 'HI', tiff, 2)
+    if magic != 42:
+        return 0
+
+    ifd0 = _read_ifd(tiff, ifd0_offset, byte_order)
+    exif_pointer = ifd0.get(_EXIF_IFD_POINTER)
+    if exif_pointer is not None:
+        exif_ifd = _read_ifd(tiff, exif_pointer[2], byte_order)
+        for tag in (_DATE_TIME_ORIGINAL, _DATE_TIME_DIGITIZED):
+            capture_time = _read_ascii_tag(tiff, exif_ifd.get(tag))
+            if capture_time:
+                return capture_time
+    return _read_ascii_tag(tiff, ifd0.get(_DATE_TIME))
+
+
+def read_exif_capture_time(image_path: str) -> int:
+    # JPEGの先頭にあるAPP1(Exif)セグメントだけを読み、画素はデコードしない
+    try:
+        data = read_image_bytes(image_path, EXIF_SEARCH_BYTES)
+    except OSError:
+        return 0
+    if not data.startswith(b'\xff\xd8'):
+        return 0
+
+    position = 2
+    while position + 4 <= len(data) and data[position] == 0xFF:
+        marker = data[position + 1]
+        if marker == 0xFF:
+            # マーカー前の埋め草
+            position += 1
+            continue
+        if marker == 0xD9 or marker == 0xDA:
+            break
+        length = struct.unpack_from('>H', data, position + 2)[0]
+        segment = data[position + 4:position + 2 + length]
+        if marker == 0xE1 and segment.startswith(b'Exif\0\0'):
+            try:
+                return _parse_exif_capture_time(segment[6:])
+            except struct.error:
+                return 0
+        position += 2 + length
+    return 0
+
+
+def read_image_metadata(image_path: str, size: int, mtime_ns: int) -> ImageMetadata:
+    # QImageReaderはヘッダーからサイズだけを読み、画素はデコードしない
+    reader = open_image_reader(Path(image_path))
+    image_size = reader.size()
+    width, height = (image_size.width(), image_size.height()) if image_size.isValid() else (0, 0)
+
+    capture_time = 0
+    if bytes(reader.format()).lower() in (b'jpeg', b'jpg'):
+        capture_time = read_exif_capture_time(image_path)
+    return ImageMetadata(size, mtime_ns, width, height, capture_time)
+
+
+def _local_time_value(mtime_ns: int) -> int:
+    return int(time.strftime('%Y%m%d%H%M%S', time.localtime(mtime_ns / 1e9)))
+
+
+class MetadataTable:
+    # ファイル番号ごとの並べ替え用の値を、種類ごとの配列で持つ
+    def __init__(self):
+        self._known = array('B')
+        self._columns: Dict[str, array] = {
+            SORT_BY_MTIME: array('q'),
+            SORT_BY_SIZE: array('q'),
+            SORT_BY_PIXELS: array('q'),
+            SORT_BY_CAPTURE_TIME: array('q'),
+        }
+
+    def has_metadata(self, file_id: int) -> bool:
+        return file_id < len(self._known) and self._known[file_id] != 0
+
+    def set_metadata(self, file_id: int, metadata: ImageMetadata):
+        self._ensure_size(file_id + 1)
+        self._known[file_id] = 1
+        self._columns[SORT_BY_MTIME][file_id] = metadata.mtime_ns
+        self._columns[SORT_BY_SIZE][file_id] = metadata.size
+        self._columns[SORT_BY_PIXELS][file_id] = metadata.width * metadata.height
+        # 撮影日時がない画像は更新日時で代用する
+        self._columns[SORT_BY_CAPTURE_TIME][file_id] = (
+            metadata.capture_time or _local_time_value(metadata.mtime_ns)
+        )
+
+    def get_column(self, sort_mode: str, size: int) -> array:
+        self._ensure_size(size)
+        return self._columns[sort_mode]
+
+    def _ensure_size(self, size: int):
+        missing = size - len(self._known)
+        if missing <= 0:
+            return
+        self._known.frombytes(bytes(missing))
+        for column in self._columns.values():
+            column.frombytes(bytes(missing * column.itemsize))
+
+
+class _MetadataThread(QThread):
+    metadata_found = pyqtSignal(list)
+
+    def __init__(self, requests: List[MetadataRequest], index_file: Optional[Path] = None, parent=None):
+        super().__init__(parent)
+        self._requests = requests
+        self._index_file = index_file
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def run(self):
+        # SQLiteの接続はスレッドをまたげないため、読み込むスレッドで開く
+        directory_index = None
+        if self._index_file is not None:
+            try:
+                directory_index = DirectoryIndex(self._index_file)
+            except sqlite3.Error as e:
+                print(f"ディレクトリインデックスのオープンエラー: {e}")
+
+        by_directory: Dict[str, List[Tuple[int, str]]] = defaultdict(list)
+        for file_id, directory, name in self._requests:
+            by_directory[directory].append((file_id, name))
+
+        batch: List[Tuple[int, ImageMetadata]] = []
+        last_emit = time.monotonic()
+        try:
+            for directory, items in by_directory.items():
+                if self._cancelled:
+                    return
+                batch.extend(self._read_directory(directory, items, directory_index))
+                if batch and time.monotonic() - last_emit >= METADATA_BATCH_INTERVAL:
+                    self.metadata_found.emit(batch)
+                    batch = []
+                    last_emit = time.monotonic()
+                    self._commit(directory_index)
+            if batch and not self._cancelled:
+                self.metadata_found.emit(batch)
+        finally:
+            if directory_index is not None:
+                try:
+                    directory_index.close()
+                except sqlite3.Error as e:
+                    print(f"ディレクトリインデックスの保存エラー: {e}")
+
+    def _commit(self, directory_index: Optional[DirectoryIndex]):
+        if directory_index is None:
+            return
+        try:
+            directory_index.commit()
+        except sqlite3.Error as e:
+            print(f"メタデータの保存エラー: {e}")
+
+    def _read_directory(self, directory: str, items: List[Tuple[int, str]],
+                        directory_index: Optional[DirectoryIndex]) -> List[Tuple[int, ImageMetadata]]:
+        # サイズと更新日時はファイルごとにstatし直し、変わっていないファイルはヘッダーも読まない
+        # （インデックスのディレクトリ一覧は、ファイルの中身だけ書き換えられても更新されないため使わない）
+        cached: Dict[str, ImageMetadata] = {}
+        if directory_index is not None:
+            try:
+                cached = directory_index.get_image_metadata(directory)
+            except sqlite3.Error as e:
+                print(f"メタデータの読み込みエラー: {e}")
+
+        results = []
+        updated = []
+        for file_id, name in items:
+            if self._cancelled:
+                break
+            image_path = os.path.join(directory, name)
+            stat = stat_image(image_path)
+            if stat is None:
+                continue
+
+            metadata = cached.get(name)
+            if metadata is None or (metadata.size, metadata.mtime_ns) != stat:
+                metadata = read_image_metadata(image_path, *stat)
+                updated.append((name, metadata))
+            results.append((file_id, metadata))
+
+        if updated and directory_index is not None:
+            try:
+                directory_index.store_image_metadata(directory, updated)
+            except sqlite3.Error as e:
+                print(f"メタデータの保存エラー: {e}")
+        return results
+
+
+class MetadataScanner(QObject):
+    metadata_found = pyqtSignal(int, list)
+    scan_finished = pyqtSignal(int)
+
+    def __init__(self, index_file: Optional[Path] = None, parent=None):
+        super().__init__(parent)
+        self._index_file = index_file
+        self._thread: Optional[_MetadataThread] = None
+        self._generation = 0
+
+    def start(self, generation: int, requests: List[MetadataRequest]):
+        # generationは一覧の世代で、結果と一緒に返して古い一覧への適用を防ぐ
+        self.cancel()
+        if not requests:
+            return
+
+        self._generation = generation
+        thread = _MetadataThread(requests, self._index_file, self)
+        thread.metadata_found.connect(lambda batch, t=thread: self._on_metadata_found(t, batch))
+        thread.finished.connect(lambda t=thread: self._on_thread_finished(t))
+        self._thread = thread
+        thread.start(QThread.Priority.LowPriority)
+
+    def cancel(self):
+        if self._thread is not None:
+            self._thread.cancel()
+            self._thread = None
+
+    def is_scanning(self) -> bool:
+        return self._thread is not None
+
+    def shutdown(self):
+        self.cancel()
+        for thread in self.findChildren(_MetadataThread):
+            thread.cancel()
+            thread.wait()
+
+    def _on_metadata_found(self, thread: _MetadataThread, batch: List[Tuple[int, ImageMetadata]]):
+        if thread is self._thread:
+            self.metadata_found.emit(self._generation, batch)
+
+    def _on_thread_finished(self, thread: _MetadataThread):
+        thread.deleteLater()
+        if thread is not self._thread:
+            return
+        self._thread = None
+        self.scan_finished.emit(self._generation)
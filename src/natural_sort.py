@@ -1,43 +1,79 @@
 import re
 import os
-from typing import List, Union
+from typing import Union
 
 
-def natural_sort_key_component(s: str) -> List[Union[str, int]]:
+_DIGITS_PATTERN = re.compile('[0-9]+')
+
+# キーの区切り文字。パスにはNUL文字が含まれないため、どの文字よりも前に並ぶ
+_TERMINATOR = '\x00'
+
+
+def _encode_number(match: 're.Match') -> str:
+    digits = match.group().lstrip('0')
+    # 桁数を先頭に置くと、文字列の比較がそのまま数値の大小比較になる
+    return _TERMINATOR + chr(len(digits) + 1) + digits
+
+
+def natural_sort_key_component(s: str) -> str:
     """
     文字列内の数値部分を考慮したソートのためのキー関数
-    例: 'file-1.jpg' -> ['file-', 1, '.jpg']
+    例: 'file-2.jpg' < 'file-10.jpg'
+
+    テキスト部分は小文字にし、数値部分は桁数付きの表現に置き換えた文字列を返します。
+    返されるキーは通常の文字列比較で自然順になり、リストやタプルのキーより小さく高速に比較できます。
 
     Args:
         s (str): ソート対象の文字列
 
     Returns:
-        List[Union[str, int]]: 文字列を数値とテキストに分割したリスト
+        str: 自然順で比較できるキー文字列
     """
-    return [int(text) if text.isdigit() else text.lower()
-            for text in re.split('([0-9]+)', s)]
+    return _DIGITS_PATTERN.sub(_encode_number, s.lower()) + _TERMINATOR
 
-def natural_path_sort_key(path: str) -> List[List[Union[str, int]]]:
+
+def natural_path_sort_key(path: Union[str, os.PathLike]) -> str:
     """
     ファイルパス全体に対して自然順ソートのためのキー関数を提供します。
     パスの各コンポーネント（ディレクトリ名、ファイル名）にnatural sortを適用します。
 
+    各コンポーネントのキーを区切り文字でつないだ1つの文字列を返すため、
+    一度計算して保持しておけば、bisectによる挿入位置の検索や
+    ソート済みリストのマージにそのまま使えます。
+
     Args:
-        path (str): ソート対象のファイルパス
+        path (Union[str, os.PathLike]): ソート対象のファイルパス
 
     Returns:
-        List[List[Union[str, int]]]: パスの各コンポーネントをnatural sortしたリストのリスト
+        str: 自然順で比較できるキー文字列
 
     Example:
-        '/path/dir-2/file-1.jpg' -> [
-            ['path'],
-            ['dir-', 2],
-            ['file-', 1, '.jpg']
-        ]
+        '/path/dir-2/file-1.jpg' < '/path/dir-2/file-10.jpg' < '/path/dir-10/file-1.jpg'
     """
-    # パスを正規化してコンポーネントに分割
-    normalized_path = os.path.normpath(path)
-    components = normalized_path.split(os.sep)
+    if isinstance(path, str):
+        # パスを正規化してコンポーネントに分割
+        path = os.path.normpath(path)
+    else:
+        # Pathオブジェクトの文字列表現は正規化済み
+        path = os.fspath(path)
 
-    # 各コンポーネントにnatural sort keyを適用
-    return [natural_sort_key_component(component) for component in components]
+    # コンポーネントの境界はテキストの終端より前に並べ、短いパスが先になるようにする
+    # 数値の桁数を表す文字が区切り文字と同じになることがあるため、区切り文字を先に置き換える
+    key = path.lower().replace(os.sep, _TERMINATOR + _TERMINATOR)
+    return _DIGITS_PATTERN.sub(_encode_number, key) + _TERMINATOR
+
+
+def natural_directory_sort_prefix(directory: Union[str, os.PathLike]) -> str:
+    """
+    ディレクトリ直下のファイルに共通する、natural_path_sort_keyのキーの先頭部分を返します。
+    natural_directory_sort_prefix(d) + natural_sort_key_component(name) は
+    natural_path_sort_key(os.path.join(d, name)) と等しくなります。
+
+    Args:
+        directory (Union[str, os.PathLike]): ディレクトリのパス（空文字列はカレントディレクトリ）
+
+    Returns:
+        str: キーの先頭部分
+    """
+    # 1文字のファイル名を付けたパスのキーから、その名前の部分を除く
+    return natural_path_sort_key(os.path.join(os.fspath(directory), '_'))[:-2]
@@ -0,0 +1,104 @@
+import os
+import sys
+from typing import List, Optional
+
+from PyQt6.QtCore import Qt, QTimer
+from PyQt6.QtGui import QFontDatabase
+from PyQt6.QtWidgets import QLabel, QWidget
+
+import perf_trace
+from image_cache import ImageCache
+
+
+OVERLAY_UPDATE_MS = 500
+# 直近の表示の内訳として並べる段階
+DISPLAY_STAGES = ('cache', 'read', 'decode', 'upload', 'paint')
+LOAD_STAGES = ('read', 'decode', 'upload')
+# 形式ごとの分布を表示する段階
+# （slideshowはスライドショーの切り替えが遅れた時間）
+HISTOGRAM_STAGES = ('decode', 'display', 'paint', 'slideshow')
+
+
+def get_process_memory_bytes() -> Optional[int]:
+    # 現在の常駐メモリ（Linux以外では最大値で代用し、取れなければNone）
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+class PerfOverlay(QLabel):
+    # 画像の上に重ねて、表示の各段階の処理時間とキャッシュ・メモリの状態を表示する
+    # 表示している間だけ計測を有効にし、定期的に内容を更新する
+    def __init__(self, image_cache: ImageCache, parent: QWidget):
+        super().__init__(parent)
+        self._image_cache = image_cache
+        self.setFont(QFontDatabase.systemFont(QFontDatabase.SystemFont.FixedFont))
+        self.setStyleSheet('background-color: rgba(0, 0, 0, 170); color: white; padding: 6px;')
+        self.setTextFormat(Qt.TextFormat.PlainText)
+        self.setAttribute(Qt.WidgetAttribute.WA_TransparentForMouseEvents)
+        self.move(8, 8)
+        self.hide()
+
+        self._update_timer = QTimer(self)
+        self._update_timer.setInterval(OVERLAY_UPDATE_MS)
+        self._update_timer.timeout.connect(self.update_text)
+
+    def toggle(self):
+        self.set_active(not self.isVisible())
+
+    def set_active(self, active: bool):
+        if active:
+            perf_trace.enable()
+            self.update_text()
+            self.show()
+            self.raise_()
+            self._update_timer.start()
+        else:
+            self._update_timer.stop()
+            self.hide()
+            perf_trace.disable()
+
+    def update_text(self):
+        lines: List[str] = []
+        total = perf_trace.get_last('display')
+        lines.append(f"display     {self._format_ms(total)}")
+        # キャッシュにあった場合、読み込みとデコードの値は以前の画像のものなので表示しない
+        cache_hit = perf_trace.get_last_detail('cache') == 'hit'
+        for stage in DISPLAY_STAGES:
+            if cache_hit and stage in LOAD_STAGES:
+                lines.append(f"  {stage:<10}{self._format_ms(None)}")
+                continue
+            detail = perf_trace.get_last_detail(stage)
+            lines.append(f"  {stage:<10}{self._format_ms(perf_trace.get_last(stage))}  {detail}".rstrip())
+
+        stats = self._image_cache.get_stats()
+        lines.append(f"image cache {stats['bytes'] / 2**20:7.1f} / {self._image_cache.get_max_bytes() / 2**20:.0f} MB"
+                     f"  {stats['entries']} images, {stats['hits']} hits, {stats['misses']} misses")
+        memory = get_process_memory_bytes()
+        if memory is not None:
+            lines.append(f"memory      {memory / 2**20:7.1f} MB")
+
+        histograms = perf_trace.get_histograms()
+        rows = sorted((stage, image_format) for stage, image_format in histograms
+                      if stage in HISTOGRAM_STAGES)
+        if rows:
+            lines.append('p50 / p95 (ms)')
+            for stage, image_format in rows:
+                histogram = histograms[(stage, image_format)]
+                lines.append(f"  {image_format or 'all':<5}{stage:<10}{histogram['p50_ms']:>8.1f}{histogram['p95_ms']:>8.1f}"
+                             f"  n={histogram['count']}")
+
+        self.setText('\n'.join(lines))
+        self.adjustSize()
+
+    @staticmethod
+    def _format_ms(value: Optional[float]) -> str:
+        return f"{value:7.2f} ms" if value is not None else '      -'
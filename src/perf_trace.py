@@ -0,0 +1,208 @@
+import csv
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+# 表示やスキャンの各段階の処理時間を記録し、形式ごとのヒストグラムにまとめる
+# 無効な間は計測用の関数が何もしないオブジェクトを返すだけで、時刻も読まない
+# ヒストグラムの区切り（ミリ秒、各区間の上限）
+BUCKET_BOUNDS_MS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, float('inf'))
+# トレースファイルに書き出すイベント数の上限（超えた分は集計だけ行う）
+MAX_TRACE_EVENTS = 1_000_000
+
+_origin = time.perf_counter()
+_enabled = False
+_lock = threading.Lock()
+_histograms: Dict[Tuple[str, str], '_Histogram'] = {}
+# 段階ごとの直近の値（オーバーレイの表示用）
+_last: Dict[str, float] = {}
+_last_details: Dict[str, str] = {}
+_events: Optional[List[Tuple[float, str, str, float, str]]] = None
+_dropped_events = 0
+
+
+class _Histogram:
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.min_ms = float('inf')
+        self.max_ms = 0.0
+        self.buckets = [0] * len(BUCKET_BOUNDS_MS)
+
+    def add(self, elapsed_ms: float):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.min_ms = min(self.min_ms, elapsed_ms)
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        for i, bound in enumerate(BUCKET_BOUNDS_MS):
+            if elapsed_ms <= bound:
+                self.buckets[i] += 1
+                break
+
+    def percentile(self, fraction: float) -> float:
+        # 該当する区間の中で線形に補間し、記録された最小値と最大値の範囲に収める
+        threshold = self.count * fraction
+        accumulated = 0
+        lower = 0.0
+        for bound, count in zip(BUCKET_BOUNDS_MS, self.buckets):
+            if count and accumulated + count >= threshold:
+                upper = min(bound, self.max_ms)
+                lower = max(lower, self.min_ms)
+                value = lower + (upper - lower) * (threshold - accumulated) / count
+                return max(self.min_ms, min(value, self.max_ms))
+            accumulated += count
+            lower = bound
+        return self.max_ms
+
+    def to_dict(self) -> Dict:
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total_ms / self.count, 3) if self.count else 0.0,
+            'min_ms': round(self.min_ms, 3) if self.count else 0.0,
+            'max_ms': round(self.max_ms, 3),
+            'p50_ms': round(self.percentile(0.5), 3),
+            'p95_ms': round(self.percentile(0.95), 3),
+            'buckets': {('inf' if bound == float('inf') else str(bound)): count
+                        for bound, count in zip(BUCKET_BOUNDS_MS, self.buckets)},
+        }
+
+
+class _Timer:
+    __slots__ = ('_stage', '_image_format', '_start', 'detail')
+
+    def __init__(self, stage: str, image_format: str):
+        self._stage = stage
+        self._image_format = image_format
+        self._start = 0.0
+        # 計測中に結果（キャッシュのヒットなど）を書き込むと、記録に添えられる
+        self.detail = ''
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self._stage, (time.perf_counter() - self._start) * 1000, self._image_format, self.detail)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def enable(keep_events: bool = False):
+    # keep_eventsを指定すると、個々の記録もトレースファイル用に保持する
+    global _enabled, _events
+    if keep_events and _events is None:
+        _events = []
+    _enabled = True
+
+
+def disable():
+    # トレースファイルに書き出す場合は、終了まで記録を続ける
+    global _enabled
+    if _events is None:
+        _enabled = False
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def image_format_of(path) -> str:
+    return os.path.splitext(path)[1][1:].lower() if path is not None else ''
+
+
+def measure(stage: str, image_format: str = ''):
+    if not _enabled:
+        return _NULL_TIMER
+    return _Timer(stage, image_format)
+
+
+def record(stage: str, elapsed_ms: float, image_format: str = '', detail: str = ''):
+    # バックグラウンドのスレッドからも呼ばれる
+    global _dropped_events
+    if not _enabled:
+        return
+    with _lock:
+        histogram = _histograms.get((stage, image_format))
+        if histogram is None:
+            histogram = _histograms[(stage, image_format)] = _Histogram()
+        histogram.add(elapsed_ms)
+        _last[stage] = elapsed_ms
+        if detail:
+            _last_details[stage] = detail
+        if _events is not None:
+            if len(_events) < MAX_TRACE_EVENTS:
+                _events.append((time.perf_counter() - _origin, stage, image_format, elapsed_ms, detail))
+            else:
+                _dropped_events += 1
+
+
+def get_last(stage: str) -> Optional[float]:
+    return _last.get(stage)
+
+
+def get_last_detail(stage: str) -> str:
+    return _last_details.get(stage, '')
+
+
+def get_histograms() -> Dict[Tuple[str, str], Dict]:
+    with _lock:
+        return {key: histogram.to_dict() for key, histogram in _histograms.items()}
+
+
+def reset():
+    global _dropped_events
+    with _lock:
+        _histograms.clear()
+        _last.clear()
+        _last_details.clear()
+        if _events is not None:
+            _events.clear()
+        _dropped_events = 0
+
+
+def write(trace_file: Path):
+    # 拡張子が.csvなら個々の記録を1行ずつ、それ以外は記録とヒストグラムをJSONで書き出す
+    with _lock:
+        events = list(_events or [])
+        histograms = {key: histogram.to_dict() for key, histogram in _histograms.items()}
+        dropped_events = _dropped_events
+
+    try:
+        if trace_file.suffix.lower() == '.csv':
+            with open(trace_file, 'w', encoding='utf-8', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['time_ms', 'stage', 'format', 'elapsed_ms', 'detail'])
+                for timestamp, stage, image_format, elapsed_ms, detail in events:
+                    writer.writerow([f'{timestamp * 1000:.3f}', stage, image_format, f'{elapsed_ms:.3f}', detail])
+        else:
+            data = {
+                'events': [{'time_ms': round(timestamp * 1000, 3), 'stage': stage, 'format': image_format,
+                            'elapsed_ms': round(elapsed_ms, 3), 'detail': detail}
+                           for timestamp, stage, image_format, elapsed_ms, detail in events],
+                'dropped_events': dropped_events,
+                'histograms': [dict(stage=stage, format=image_format, **histogram)
+                               for (stage, image_format), histogram in sorted(histograms.items())],
+            }
+            with open(trace_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=1)
+    except OSError as e:
+        print(f"パフォーマンストレースの保存エラー: {e}")
@@ -0,0 +1,304 @@
+import io
+import math
+import struct
+import threading
+import zlib
+from dataclasses import dataclass
+from typing import BinaryIO, List, Optional
+
+from PyQt6.QtCore import Qt, QRect, QSize
+from PyQt6.QtGui import QImage, QPainter
+
+
+# QtのPNGデコーダーは画像の一部だけを読めず、全体がメモリの上限を超える画像は読み込めない
+# ここではIDATを順に展開し、数百行ずつを小さなPNGに包み直してQtにデコードさせる
+# 行のフィルターは直前の行を参照するため、前の帯の最後の行を無圧縮の行として先頭に加える
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# 一度にデコードする行数（2のべき乗。幅が広い画像では、1回分のメモリがこの量に収まるよう減らす）
+MAX_STRIP_ROWS = 512
+MAX_STRIP_BYTES = 64 * 1024 * 1024
+# (色の種類, ビット深度) -> 1画素のバイト数。Qtのデコード結果から元の行を復元できるものだけ扱う
+_SUPPORTED_LAYOUTS = {
+    (0, 8): 1,
+    (2, 8): 3,
+    (3, 8): 1,
+    (4, 8): 2,
+    (6, 8): 4,
+}
+# 色の種類ごとに、Qtがデコード結果として返す形式
+_EXPECTED_FORMATS = {
+    0: (QImage.Format.Format_Grayscale8,),
+    2: (QImage.Format.Format_RGB32,),
+    3: (QImage.Format.Format_Indexed8,),
+    4: (QImage.Format.Format_ARGB32,),
+    6: (QImage.Format.Format_ARGB32,),
+}
+
+
+class PngStripError(Exception):
+    pass
+
+
+@dataclass
+class _Checkpoint:
+    # この行の直前まで展開した状態（展開器は使うたびに複製する）
+    row: int
+    chunk_offset: int
+    chunk_remaining: int
+    inflater: 'zlib._Decompress'
+    pending_input: bytes
+    leftover: bytes
+    previous_row: Optional[bytes]
+
+
+class PngStripReader:
+    def __init__(self, stream: BinaryIO, width: int, height: int, color_type: int,
+                 header_chunks: bytes, first_idat_offset: int):
+        self._stream = stream
+        self.size = QSize(width, height)
+        self._color_type = color_type
+        self._bytes_per_pixel = _SUPPORTED_LAYOUTS[(color_type, 8)]
+        self._row_bytes = width * self._bytes_per_pixel
+        self._stride = self._row_bytes + 1
+        # IHDR以外のIDAT前のチャンク（パレット・透過色・色空間など）はそのまま引き継ぐ
+        self._header_chunks = header_chunks
+        self._lock = threading.Lock()
+        self._cancelled = False
+        self._close_requested = False
+        self._checkpoints: List[_Checkpoint] = [
+            _Checkpoint(0, first_idat_offset, 0, zlib.decompressobj(), b'', b'', None)
+        ]
+        self.strip_rows = MAX_STRIP_ROWS
+        while self.strip_rows > 1 and self.strip_rows * width * 4 > MAX_STRIP_BYTES:
+            self.strip_rows //= 2
+
+    @classmethod
+    def open(cls, path: str, data: Optional[bytes] = None) -> Optional['PngStripReader']:
+        # 対応する形式のPNGでなければNoneを返す
+        try:
+            stream = io.BytesIO(data) if data is not None else open(path, 'rb')
+        except OSError:
+            return None
+        try:
+            reader = cls._open_stream(stream)
+        except (OSError, struct.error, PngStripError):
+            reader = None
+        if reader is None:
+            stream.close()
+        return reader
+
+    @classmethod
+    def _open_stream(cls, stream: BinaryIO) -> Optional['PngStripReader']:
+        if stream.read(8) != _PNG_SIGNATURE:
+            return None
+        header_chunks = []
+        ihdr = None
+        while True:
+            offset = stream.tell()
+            length, chunk_type = struct.unpack('>I4s', stream.read(8))
+            if chunk_type == b'IDAT':
+                break
+            if chunk_type == b'IEND':
+                return None
+            body = stream.read(length)
+            stream.read(4)
+            if chunk_type == b'IHDR':
+                ihdr = body
+            else:
+                header_chunks.append(_make_chunk(chunk_type, body))
+        if ihdr is None or len(ihdr) != 13:
+            return None
+
+        width, height, bit_depth, color_type, _, _, interlace = struct.unpack('>IIBBBBB', ihdr)
+        if interlace or (color_type, bit_depth) not in _SUPPORTED_LAYOUTS or width == 0 or height == 0:
+            return None
+        # 透過色を指定したグレー・RGBはQtがアルファ付きに変換し、元の画素値を取り出せない
+        if color_type in (0, 2) and any(chunk[4:8] == b'tRNS' for chunk in header_chunks):
+            return None
+        return cls(stream, width, height, color_type, b''.join(header_chunks), offset)
+
+    def cancel(self):
+        self._cancelled = True
+
+    def close(self):
+        # 読み込み中なら、その読み込みが中断して終わるときに閉じる（呼び出し側を待たせない）
+        self._cancelled = True
+        self._close_requested = True
+        if self._lock.acquire(blocking=False):
+            try:
+                self._close_stream()
+            finally:
+                self._lock.release()
+
+    def _close_stream(self):
+        self._stream.close()
+        self._checkpoints = []
+
+    def read_rows(self, first_row: int, row_count: int, factor: int = 1) -> QImage:
+        # 元の画像のfirst_rowからrow_count行を、幅・高さとも1/factorに縮小して返す
+        last_row = min(first_row + row_count, self.size.height())
+        output_width = math.ceil(self.size.width() / factor)
+        output_height = math.ceil((last_row - first_row) / factor)
+        output = QImage(output_width, max(1, output_height), QImage.Format.Format_ARGB32_Premultiplied)
+        output.fill(Qt.GlobalColor.transparent)
+        if output.isNull():
+            raise PngStripError('strip output too large')
+
+        # 帯の行数は2のべき乗のため、縮小率（2のべき乗）で割り切れ、帯の境目で縮小結果がずれない
+        painter = QPainter(output)
+        try:
+            with self._lock:
+                state = self._restore(first_row)
+                while state.row < last_row:
+                    if self._cancelled:
+                        raise PngStripError('cancelled')
+                    row = state.row
+                    # チェックポイントから目的の行までは、帯の区切りごとに読み進める
+                    end = min(row - row % self.strip_rows + self.strip_rows, last_row)
+                    if row < first_row:
+                        end = min(end, first_row)
+                    strip = self._decode_strip(state, end - row)
+                    self._add_checkpoint(state)
+                    if row < first_row:
+                        continue
+                    if factor == 1:
+                        painter.drawImage(0, row - first_row, strip)
+                    else:
+                        target = QRect(0, (row - first_row) // factor, output_width, math.ceil(strip.height() / factor))
+                        painter.drawImage(target, strip.scaled(
+                            target.size(), Qt.AspectRatioMode.IgnoreAspectRatio,
+                            Qt.TransformationMode.SmoothTransformation))
+        finally:
+            if self._close_requested and not self._stream.closed:
+                with self._lock:
+                    self._close_stream()
+            painter.end()
+        return output
+
+    def _restore(self, row: int) -> '_StreamState':
+        checkpoint = None
+        for candidate in self._checkpoints:
+            if candidate.row <= row and (checkpoint is None or candidate.row > checkpoint.row):
+                checkpoint = candidate
+        if checkpoint is None:
+            raise PngStripError('reader closed')
+        return _StreamState(self._stream, checkpoint)
+
+    def _add_checkpoint(self, state: '_StreamState'):
+        # 帯の区切りごとに状態を残し、次からはそこから読み始める
+        row = state.row
+        if row % self.strip_rows or row >= self.size.height():
+            return
+        if any(c.row == row for c in self._checkpoints):
+            return
+        self._checkpoints.append(state.checkpoint(row))
+
+    def _decode_strip(self, state: '_StreamState', row_count: int) -> QImage:
+        filtered = state.read(self._stride * row_count)
+        if len(filtered) != self._stride * row_count:
+            raise PngStripError('truncated image data')
+
+        # 直前の行があれば、フィルターなしの行として先頭に置く
+        if state.previous_row is not None:
+            filtered = b'\x00' + state.previous_row + filtered
+            rows = row_count + 1
+        else:
+            rows = row_count
+        ihdr = struct.pack('>IIBBBBB', self.size.width(), rows, 8, self._color_type, 0, 0, 0)
+        png = b''.join((
+            _PNG_SIGNATURE,
+            _make_chunk(b'IHDR', ihdr),
+            self._header_chunks,
+            _make_chunk(b'IDAT', zlib.compress(filtered, 0)),
+            _make_chunk(b'IEND', b''),
+        ))
+        image = QImage.fromData(png, 'PNG')
+        if image.isNull() or image.format() not in _EXPECTED_FORMATS[self._color_type]:
+            raise PngStripError('unexpected strip format')
+        if rows != row_count:
+            image = image.copy(0, 1, image.width(), row_count)
+        state.previous_row = self._raw_row(image, row_count - 1)
+        state.row += row_count
+        return image
+
+    def _raw_row(self, image: QImage, y: int) -> bytes:
+        # デコード結果の1行を、PNGのフィルター前の画素の並びに戻す
+        line = image.copy(0, y, image.width(), 1)
+        if self._color_type in (0, 3):
+            return _scan_line(line, self._row_bytes)
+        if self._color_type == 2:
+            return _scan_line(line.convertToFormat(QImage.Format.Format_RGB888), self._row_bytes)
+        rgba = _scan_line(line.convertToFormat(QImage.Format.Format_RGBA8888), image.width() * 4)
+        if self._color_type == 6:
+            return rgba
+        gray_alpha = bytearray(self._row_bytes)
+        gray_alpha[0::2] = rgba[0::4]
+        gray_alpha[1::2] = rgba[3::4]
+        return bytes(gray_alpha)
+
+
+class _StreamState:
+    def __init__(self, stream: BinaryIO, checkpoint: _Checkpoint):
+        self._stream = stream
+        self.row = checkpoint.row
+        self._chunk_offset = checkpoint.chunk_offset
+        self._chunk_remaining = checkpoint.chunk_remaining
+        self._inflater = checkpoint.inflater.copy()
+        self._pending_input = checkpoint.pending_input
+        self._leftover = checkpoint.leftover
+        self.previous_row = checkpoint.previous_row
+
+    def checkpoint(self, row: int) -> _Checkpoint:
+        return _Checkpoint(row, self._chunk_offset, self._chunk_remaining, self._inflater.copy(),
+                           self._pending_input, self._leftover, self.previous_row)
+
+    def read(self, size: int) -> bytes:
+        parts = [self._leftover]
+        available = len(self._leftover)
+        while available < size:
+            if not self._pending_input:
+                self._pending_input = self._read_idat()
+                if not self._pending_input:
+                    break
+            data = self._inflater.decompress(self._pending_input, size - available)
+            self._pending_input = self._inflater.unconsumed_tail
+            parts.append(data)
+            available += len(data)
+        buffer = b''.join(parts)
+        self._leftover = buffer[size:]
+        return buffer[:size]
+
+    def _read_idat(self) -> bytes:
+        # 次のIDATの内容を最大1MBずつ返す（IDAT以外のチャンクに達したら空）
+        self._stream.seek(self._chunk_offset)
+        if self._chunk_remaining == 0:
+            header = self._stream.read(8)
+            if len(header) != 8:
+                return b''
+            length, chunk_type = struct.unpack('>I4s', header)
+            if chunk_type != b'IDAT':
+                return b''
+            self._chunk_offset += 8
+            self._chunk_remaining = length
+            if length == 0:
+                self._chunk_offset += 4
+                return self._read_idat()
+        data = self._stream.read(min(self._chunk_remaining, 1024 * 1024))
+        if not data:
+            return b''
+        self._chunk_offset += len(data)
+        self._chunk_remaining -= len(data)
+        if self._chunk_remaining == 0:
+            self._chunk_offset += 4
+        return data
+
+
+def _make_chunk(chunk_type: bytes, body: bytes) -> bytes:
+    return struct.pack('>I', len(body)) + chunk_type + body + struct.pack('>I', zlib.crc32(chunk_type + body))
+
+
+def _scan_line(image: QImage, size: int) -> bytes:
+    pointer = image.constBits()
+    pointer.setsize(image.sizeInBytes())
+    return bytes(pointer)[:size]
+
@@ -0,0 +1,139 @@
+import os
+import struct
+import sys
+import tempfile
+import zlib
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+
+MAGIC = b'IVSESS1\n'
+HEADER = struct.Struct('<IIII')
+
+# os.fsencode/os.fsdecodeと同じ変換を、文字列全体に一度だけ適用する
+FS_ENCODING = sys.getfilesystemencoding()
+FS_ERRORS = sys.getfilesystemencodeerrors()
+
+
+def encode_session(files: Iterable[Union[str, Path]], current_index: int) -> bytes:
+    # ディレクトリ名は一度だけ保存し、各ファイルはディレクトリ番号とファイル名で表す
+    dir_ids: Dict[str, int] = {}
+    dir_table: List[str] = []
+    names: List[str] = []
+    file_dirs = array('I')
+
+    for f in files:
+        directory, name = os.path.split(os.fspath(f))
+        dir_id = dir_ids.get(directory)
+        if dir_id is None:
+            dir_id = len(dir_table)
+            dir_ids[directory] = dir_id
+            dir_table.append(directory)
+        file_dirs.append(dir_id)
+        names.append(name)
+
+    dir_blob = '\0'.join(dir_table).encode(FS_ENCODING, FS_ERRORS)
+    name_blob = '\0'.join(names).encode(FS_ENCODING, FS_ERRORS)
+    if sys.byteorder == 'big':
+        file_dirs.byteswap()
+
+    payload = b''.join([
+        struct.pack('<II', len(dir_blob), len(name_blob)),
+        dir_blob,
+        name_blob,
+        file_dirs.tobytes(),
+    ])
+    header = HEADER.pack(len(dir_table), len(names), current_index, zlib.crc32(payload))
+    return MAGIC + header + zlib.compress(payload, 1)
+
+
+def decode_session(data: bytes) -> Tuple[List[str], int]:
+    if not data.startswith(MAGIC):
+        raise ValueError('unknown session format')
+
+    offset = len(MAGIC)
+    dir_count, file_count, current_index, checksum = HEADER.unpack_from(data, offset)
+    payload = zlib.decompress(data[offset + HEADER.size:])
+    if zlib.crc32(payload) != checksum:
+        raise ValueError('session checksum mismatch')
+
+    dir_len, name_len = struct.unpack_from('<II', payload, 0)
+    position = 8
+    dir_blob = payload[position:position + dir_len]
+    position += dir_len
+    name_blob = payload[position:position + name_len]
+    position += name_len
+
+    file_dirs = array('I')
+    file_dirs.frombytes(payload[position:position + file_count * 4])
+    if sys.byteorder == 'big':
+        file_dirs.byteswap()
+
+    dir_names = dir_blob.decode(FS_ENCODING, FS_ERRORS).split('\0') if dir_count else []
+    names = name_blob.decode(FS_ENCODING, FS_ERRORS).split('\0') if file_count else []
+    if len(dir_names) != dir_count or len(names) != file_count or len(file_dirs) != file_count:
+        raise ValueError('session data is truncated')
+
+    # 大量のPathオブジェクトを作らないよう、パスは文字列のまま返す
+    files = [os.path.join(dir_names[dir_id], name) for dir_id, name in zip(file_dirs, names)]
+    return files, current_index
+
+
+class SessionStore:
+    def __init__(self, session_file: Path):
+        self.session_file = session_file
+        self._last_saved: Optional[bytes] = None
+
+    def load(self) -> Tuple[List[str], int]:
+        try:
+            if not self.session_file.exists():
+                return [], 0
+            data = self.session_file.read_bytes()
+            files, current_index = decode_session(data)
+            self._last_saved = data
+            return files, current_index
+        except (OSError, ValueError, zlib.error, struct.error) as e:
+            print(f"セッションファイルの読み込みエラー: {e}")
+            return [], 0
+
+    def save(self, files: Iterable[Union[str, Path]], current_index: int) -> bool:
+        data = encode_session(files, current_index)
+        # 内容が変わっていなければ書き込まない
+        # （読み込んでいないセッションでも、保存済みのファイルと同じなら書き込まない）
+        if self._last_saved is None:
+            try:
+                self._last_saved = self.session_file.read_bytes()
+            except OSError:
+                pass
+        if data == self._last_saved:
+            return False
+
+        try:
+            write_file_atomic(self.session_file, data)
+        except OSError as e:
+            print(f"セッションファイルの保存エラー: {e}")
+            return False
+        self._last_saved = data
+        return True
+
+
+def write_file_atomic(path: Path, data: bytes):
+    # 書き込み途中で終了しても元のファイルが壊れないよう、一時ファイルから置き換える
+    # 一時ファイルの名前は重ならないようにし、複数のビューアーが同時に保存しても混ざらないようにする
+    with tempfile.NamedTemporaryFile(dir=path.parent, prefix=path.name + '.', suffix='.tmp',
+                                     delete=False) as f:
+        temp_path = f.name
+        try:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        except OSError:
+            f.close()
+            os.unlink(temp_path)
+            raise
+    try:
+        os.replace(temp_path, path)
+    except OSError:
+        os.unlink(temp_path)
+        raise
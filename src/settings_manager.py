@@ -1,13 +1,19 @@
+import copy
 import json
 import sys
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import Iterable, List, Dict, Any, Optional, Tuple, Union
+
+from session_store import SessionStore, write_file_atomic
 
 
 class SettingsManager:
     def __init__(self):
         self.config_dir = self._get_config_dir()
+        self.cache_dir = self._get_cache_dir()
         self.config_file = self.config_dir / 'config.json'
+        self.directory_index_file = self.config_dir / 'directory_index.db'
+        self.session_store = SessionStore(self.config_dir / 'session.bin')
         self._default_settings = {
             'window': {
                 'x': 100,
@@ -15,10 +21,18 @@ class SettingsManager:
                 'width': 800,
                 'height': 600
             },
-            'recent_files': [],
-            'recent_index': 0,
             'directory_history': [],
+            'image_cache_mb': 512,
+            'thumbnail_cache_mb': 128,
+            'thumbnail_disk_cache_mb': 1024,
+            'clipboard_encoded_data': True,
+            'sort_mode': 'name',
+            'slideshow_interval_ms': 3000,
+            'single_instance': False,
         }
+        self._settings: Optional[Dict[str, Any]] = None
+        self._saved_text: Optional[str] = None
+        self._session: Optional[Tuple[List[str], int]] = None
 
     def _get_config_dir(self) -> Path:
         if sys.platform == 'win32':
@@ -32,21 +46,47 @@ class SettingsManager:
         config_dir.mkdir(parents=True, exist_ok=True)
         return config_dir
 
+    def _get_cache_dir(self) -> Path:
+        if sys.platform == 'win32':
+            cache_base = Path.home() / 'AppData' / 'Local'
+        elif sys.platform == 'darwin':
+            cache_base = Path.home() / 'Library' / 'Caches'
+        else:
+            cache_base = Path.home() / '.cache'
+
+        cache_dir = cache_base / 'ImageViewer'
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        return cache_dir
+
     def load_settings(self) -> Dict[str, Any]:
+        # 設定ファイルは最初の一度だけ読み込み、以降はメモリ上の値を使う
+        if self._settings is None:
+            self._settings = self._read_settings_file()
+        return self._settings
+
+    def _read_settings_file(self) -> Dict[str, Any]:
         try:
             if self.config_file.exists():
                 with open(self.config_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                    text = f.read()
+                settings = json.loads(text)
+                self._saved_text = text
+                return settings
             else:
-                return self._default_settings.copy()
-        except (json.JSONDecodeError, KeyError, TypeError) as e:
+                return copy.deepcopy(self._default_settings)
+        except (OSError, json.JSONDecodeError, KeyError, TypeError) as e:
             print(f"設定ファイルの読み込みエラー: {e}")
-            return self._default_settings.copy()
+            return copy.deepcopy(self._default_settings)
 
     def save_settings(self, settings: Dict[str, Any]):
+        self._settings = settings
         try:
-            with open(self.config_file, 'w', encoding='utf-8') as f:
-                json.dump(settings, f, indent=4, ensure_ascii=False)
+            text = json.dumps(settings, indent=4, ensure_ascii=False)
+            # 内容が変わっていなければ書き込まない
+            if text == self._saved_text:
+                return
+            write_file_atomic(self.config_file, text.encode('utf-8'))
+            self._saved_text = text
         except Exception as e:
             print(f"設定ファイルの保存エラー: {e}")
 
@@ -64,24 +104,73 @@ class SettingsManager:
         }
         self.save_settings(settings)
 
-    def get_recent_files(self) -> List[Path]:
+    def get_image_cache_bytes(self) -> int:
+        return self._get_megabytes('image_cache_mb')
+
+    def get_thumbnail_cache_bytes(self) -> int:
+        return self._get_megabytes('thumbnail_cache_mb')
+
+    def get_thumbnail_disk_cache_bytes(self) -> int:
+        return self._get_megabytes('thumbnail_disk_cache_mb')
+
+    def is_clipboard_encoded_data_enabled(self) -> bool:
         settings = self.load_settings()
-        recent_files_str = settings.get('recent_files', [])
-        return [Path(f) for f in recent_files_str]
+        return bool(settings.get('clipboard_encoded_data', self._default_settings['clipboard_encoded_data']))
 
-    def get_recent_index(self) -> int:
+    def get_sort_mode(self) -> str:
         settings = self.load_settings()
-        return int(settings.get('recent_index', 0))
+        return settings.get('sort_mode', self._default_settings['sort_mode'])
 
-    def save_recent_files(self, files: List[Path], current_index: int):
-        if not files:
-            return
-            
+    def save_sort_mode(self, sort_mode: str):
         settings = self.load_settings()
-        settings['recent_files'] = [str(f.resolve()) for f in files]
-        settings['recent_index'] = str(current_index)
+        settings['sort_mode'] = sort_mode
         self.save_settings(settings)
 
+    def is_single_instance_enabled(self) -> bool:
+        settings = self.load_settings()
+        return bool(settings.get('single_instance', self._default_settings['single_instance']))
+
+    def get_slideshow_interval_ms(self) -> int:
+        settings = self.load_settings()
+        value = settings.get('slideshow_interval_ms', self._default_settings['slideshow_interval_ms'])
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return self._default_settings['slideshow_interval_ms']
+
+    def _get_megabytes(self, key: str) -> int:
+        settings = self.load_settings()
+        value = settings.get(key, self._default_settings[key])
+        try:
+            return max(0, int(value)) * 1024 * 1024
+        except (TypeError, ValueError):
+            return self._default_settings[key] * 1024 * 1024
+
+    def _load_session(self) -> Tuple[List[str], int]:
+        if self._session is None:
+            settings = self.load_settings()
+            if 'recent_files' in settings:
+                # 旧形式（config.json内のリスト）からセッションファイルへ移行する
+                files = [str(f) for f in settings.pop('recent_files')]
+                current_index = int(settings.pop('recent_index', 0))
+                self.session_store.save(files, current_index)
+                self.save_settings(settings)
+                self._session = (files, current_index)
+            else:
+                self._session = self.session_store.load()
+        return self._session
+
+    def get_recent_files(self) -> List[str]:
+        return list(self._load_session()[0])
+
+    def get_recent_index(self) -> int:
+        return self._load_session()[1]
+
+    def save_recent_files(self, files: Iterable[Union[str, Path]], current_index: int):
+        # 一覧のパスは読み込み時点で絶対パスのため、resolve()は行わない
+        self.session_store.save(files, current_index)
+        self._session = None
+
     def get_directory_history(self) -> List[Dict[str, Any]]:
         settings = self.load_settings()
         history = settings.get('directory_history', [])
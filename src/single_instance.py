@@ -0,0 +1,98 @@
+import getpass
+import json
+from typing import Dict, List, Optional
+
+from PyQt6.QtCore import QObject, pyqtSignal
+from PyQt6.QtNetwork import QLocalServer, QLocalSocket
+
+
+SERVER_NAME_PREFIX = 'ImageViewer'
+CONNECT_TIMEOUT_MS = 500
+# 受け取った側が読み込みを終えるのは待たず、引数が届いたことだけを確認する
+REPLY_TIMEOUT_MS = 2000
+_ACK = b'ok\n'
+
+
+def get_server_name() -> str:
+    # ユーザーごとに別の名前にして、他のユーザーの起動中のビューアーには渡さない
+    try:
+        user = getpass.getuser()
+    except (KeyError, OSError):
+        user = 'default'
+    return f'{SERVER_NAME_PREFIX}-{user}'
+
+
+def send_to_running_instance(files: List[str], directories: List[str], recursive: bool,
+                             server_name: Optional[str] = None) -> bool:
+    # 起動中のビューアーに引数を渡せたらTrueを返す（起動していなければFalse）
+    socket = QLocalSocket()
+    socket.connectToServer(server_name or get_server_name())
+    if not socket.waitForConnected(CONNECT_TIMEOUT_MS):
+        return False
+
+    message = {'files': files, 'directories': directories, 'recursive': recursive}
+    socket.write(json.dumps(message).encode('utf-8') + b'\n')
+    socket.waitForBytesWritten(REPLY_TIMEOUT_MS)
+    reply = b''
+    while not reply.endswith(b'\n') and socket.waitForReadyRead(REPLY_TIMEOUT_MS):
+        reply += bytes(socket.readAll())
+    socket.disconnectFromServer()
+    return reply == _ACK
+
+
+class InstanceServer(QObject):
+    # (画像ファイル, ディレクトリ, サブディレクトリも探すか)
+    open_requested = pyqtSignal(list, list, bool)
+
+    def __init__(self, server_name: Optional[str] = None, parent=None):
+        super().__init__(parent)
+        self._server_name = server_name or get_server_name()
+        self._server = QLocalServer(self)
+        self._server.setSocketOptions(QLocalServer.SocketOption.UserAccessOption)
+        self._server.newConnection.connect(self._on_new_connection)
+        self._buffers: Dict[QLocalSocket, bytes] = {}
+
+    def listen(self) -> bool:
+        if self._server.listen(self._server_name):
+            return True
+        if self._server.serverError() == QLocalSocket.LocalSocketError.AddressInUseError:
+            # 異常終了したビューアーのソケットが残っている場合は削除してやり直す
+            QLocalServer.removeServer(self._server_name)
+            if self._server.listen(self._server_name):
+                return True
+        print(f"単一インスタンス用サーバーの起動エラー: {self._server.errorString()}")
+        return False
+
+    def close(self):
+        self._server.close()
+
+    def _on_new_connection(self):
+        while self._server.hasPendingConnections():
+            socket = self._server.nextPendingConnection()
+            self._buffers[socket] = b''
+            socket.readyRead.connect(lambda s=socket: self._on_ready_read(s))
+            socket.disconnected.connect(lambda s=socket: self._on_disconnected(s))
+
+    def _on_ready_read(self, socket: QLocalSocket):
+        data = self._buffers.get(socket, b'') + bytes(socket.readAll())
+        self._buffers[socket] = data
+        if not data.endswith(b'\n'):
+            return
+
+        try:
+            message = json.loads(data.decode('utf-8'))
+            files = [str(f) for f in message.get('files', [])]
+            directories = [str(d) for d in message.get('directories', [])]
+            recursive = bool(message.get('recursive', False))
+        except (UnicodeDecodeError, ValueError, AttributeError, TypeError) as e:
+            print(f"受け取った引数の読み込みエラー: {e}")
+            socket.disconnectFromServer()
+            return
+
+        socket.write(_ACK)
+        socket.flush()
+        self.open_requested.emit(files, directories, recursive)
+
+    def _on_disconnected(self, socket: QLocalSocket):
+        self._buffers.pop(socket, None)
+        socket.deleteLater()
@@ -0,0 +1,207 @@
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from PyQt6.QtCore import Qt, QObject, QTimer, pyqtSignal
+
+import perf_trace
+from image_cache import ImageCache, CacheKey
+from image_display_manager import ImageDisplayManager
+from image_list_manager import ImageListManager
+from image_prefetcher import ImagePrefetcher, DecodeTiming
+
+
+DEFAULT_SLIDESHOW_INTERVAL_MS = 3000
+MIN_SLIDESHOW_INTERVAL_MS = 200
+# この時間を超えて切り替えが遅れたら記録する
+DEADLINE_TOLERANCE_MS = 50
+# 先読みの完了をこれ以上待たず、先読み済みの先の画像に進む
+PENDING_TIMEOUT_MS = 5000
+
+
+class Slideshow(QObject):
+    image_shown = pyqtSignal()
+    # 表示する画像が先読みされていないときに発行し、待っている画像と周辺の先読みを求める
+    prefetch_requested = pyqtSignal()
+
+    def __init__(self, image_list_manager: ImageListManager, image_display_manager: ImageDisplayManager,
+                 image_prefetcher: ImagePrefetcher, interval_ms: int = DEFAULT_SLIDESHOW_INTERVAL_MS,
+                 parent=None):
+        super().__init__(parent)
+        self._image_list_manager = image_list_manager
+        self._image_display_manager = image_display_manager
+        self._image_prefetcher = image_prefetcher
+        self._interval_ms = max(MIN_SLIDESHOW_INTERVAL_MS, interval_ms)
+        self._running = False
+        self._deadline = 0.0
+        self._fired_at = 0.0
+        # 期限までに先読みが終わらなかった画像（キー, パス）
+        self._pending: Optional[Tuple[CacheKey, Path]] = None
+        self._stats: Dict[str, int] = {'shown': 0, 'missed': 0, 'skipped': 0}
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setTimerType(Qt.TimerType.PreciseTimer)
+        self._timer.timeout.connect(self._on_deadline)
+
+        # 先読みの結果が届かない場合でも止まらないようにする
+        self._pending_timer = QTimer(self)
+        self._pending_timer.setSingleShot(True)
+        self._pending_timer.setInterval(PENDING_TIMEOUT_MS)
+        self._pending_timer.timeout.connect(self._on_pending_timeout)
+
+        self._image_prefetcher.image_ready.connect(self._on_image_ready)
+        self._image_prefetcher.image_failed.connect(self._on_image_failed)
+        self._image_prefetcher.image_dropped.connect(self._on_image_dropped)
+
+    def start(self):
+        if self._running or not self._image_list_manager.has_images():
+            return
+        self._running = True
+        self._schedule(time.monotonic() + self._interval_ms / 1000)
+
+    def stop(self):
+        self._running = False
+        self._clear_pending()
+        self._timer.stop()
+
+    def toggle(self):
+        if self._running:
+            self.stop()
+        else:
+            self.start()
+
+    def is_running(self) -> bool:
+        return self._running
+
+    def get_pending_path(self) -> Optional[Path]:
+        # 先読みの完了を待っている画像（なければNone）
+        return self._pending[1] if self._pending is not None else None
+
+    def get_interval_ms(self) -> int:
+        return self._interval_ms
+
+    def restart_interval(self):
+        # 手動で移動したときは、その時点から間隔を数え直す
+        if self._running:
+            self._clear_pending()
+            self._schedule(time.monotonic() + self._interval_ms / 1000)
+
+    def get_stats(self) -> Dict[str, int]:
+        return dict(self._stats)
+
+    def _schedule(self, deadline: float):
+        self._deadline = deadline
+        self._timer.start(max(0, int((deadline - time.monotonic()) * 1000)))
+
+    def _on_deadline(self):
+        self._fired_at = time.monotonic()
+        self._image_list_manager.move_to_next()
+        image_path = self._image_list_manager.get_current_image_path()
+        if image_path is None:
+            self.stop()
+            return
+
+        key = ImageCache.make_key(image_path)
+        if key is None:
+            self._skip(image_path, 'I/O')
+            return
+
+        target_size = self._image_display_manager.get_target_size()
+        if self._image_display_manager.get_image_cache().contains(key, target_size):
+            self._present(image_path)
+            return
+
+        # 先読みが間に合わなかった場合も、GUIスレッドでは読み込まずにワーカーの完了を待つ
+        # 先読みの対象は周辺の画像ごと入れ替え、次の画像の先読みを止めない
+        self._pending = (key, image_path)
+        self._pending_timer.start()
+        self.prefetch_requested.emit()
+
+    def _on_image_ready(self, key: CacheKey, timing: DecodeTiming):
+        if self._pending is None or self._pending[0] != key:
+            return
+        image_path = self._pending[1]
+        self._clear_pending()
+        self._present(image_path, timing=timing)
+
+    def _on_image_failed(self, key: CacheKey, timing: DecodeTiming):
+        if self._pending is None or self._pending[0] != key:
+            return
+        image_path = self._pending[1]
+        self._clear_pending()
+        self._skip(image_path, 'I/O' if timing.read_failed else 'decode', timing)
+
+    def _on_image_dropped(self, key: CacheKey):
+        # 先読みの対象が入れ替わって捨てられた場合は、もう一度要求して待ち続ける
+        if self._pending is not None and self._pending[0] == key:
+            self.prefetch_requested.emit()
+
+    def _on_pending_timeout(self):
+        if self._pending is None:
+            return
+        image_path = self._pending[1]
+        self._clear_pending()
+        self._skip(image_path, 'queue')
+
+    def _clear_pending(self):
+        self._pending = None
+        self._pending_timer.stop()
+
+    def _skip(self, image_path: Path, reason: str, timing: Optional[DecodeTiming] = None):
+        # 表示できない画像はGUIスレッドで読み込まず、先読み済みの先の画像に進む
+        next_count, _ = self._image_prefetcher.get_counts()
+        target_size = self._image_display_manager.get_target_size()
+        image_cache = self._image_display_manager.get_image_cache()
+        for steps, path in enumerate(self._image_list_manager.get_neighbor_paths(next_count, 0), 1):
+            key = ImageCache.make_key(path)
+            if key is not None and image_cache.contains(key, target_size):
+                for _ in range(steps):
+                    self._image_list_manager.move_to_next()
+                self._stats['skipped'] += steps
+                self._present(path, reason, timing)
+                return
+
+        # 先の画像もまだなければ、表示中の画像のまま次の切り替えを待つ
+        self._stats['skipped'] += 1
+        self._record_missed_deadline(image_path, (time.monotonic() - self._deadline) * 1000, reason)
+        self.prefetch_requested.emit()
+        if self._running:
+            self._schedule(time.monotonic() + self._interval_ms / 1000)
+
+    def _present(self, image_path: Path, reason: Optional[str] = None,
+                 timing: Optional[DecodeTiming] = None):
+        # 呼び出し元でキャッシュにあることを確かめた画像だけを表示する
+        render_started = time.monotonic()
+        self._image_display_manager.display_cached_image(image_path)
+        shown_at = time.monotonic()
+        render_ms = (shown_at - render_started) * 1000
+        late_ms = (shown_at - self._deadline) * 1000
+
+        self._stats['shown'] += 1
+        if late_ms > DEADLINE_TOLERANCE_MS:
+            if reason is None:
+                reason = self._slowest_step(render_ms, (self._fired_at - self._deadline) * 1000, timing)
+            self._record_missed_deadline(image_path, late_ms, reason)
+
+        self.image_shown.emit()
+        if self._running:
+            # 遅れた場合は、表示した時点から一枚分の時間を確保する
+            next_deadline = self._deadline + self._interval_ms / 1000
+            if late_ms > DEADLINE_TOLERANCE_MS:
+                next_deadline = shown_at + self._interval_ms / 1000
+            self._schedule(next_deadline)
+
+    @staticmethod
+    def _slowest_step(render_ms: float, timer_late_ms: float, timing: Optional[DecodeTiming]) -> str:
+        # 最も時間のかかった段階を遅延の原因とする
+        # （event loopはGUIスレッドが塞がっていてタイマーの発火自体が遅れた場合）
+        steps = {'scale': render_ms, 'event loop': timer_late_ms}
+        if timing is not None:
+            steps.update({'queue': timing.queued_ms, 'I/O': timing.io_ms, 'decode': timing.decode_ms})
+        return max(steps, key=steps.get)
+
+    def _record_missed_deadline(self, image_path: Path, late_ms: float, reason: str):
+        # 遅れはパフォーマンス表示とトレースに記録する（計測が無効なら件数だけ数える）
+        self._stats['missed'] += 1
+        perf_trace.record('slideshow', late_ms, perf_trace.image_format_of(image_path), reason)
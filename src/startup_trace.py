@@ -0,0 +1,45 @@
+import time
+from typing import List, Tuple
+
+
+# 起動の各段階の時刻を記録し、--startup-traceを指定したときに経過時間を出力する
+# オプションを読む前の記録は溜めておき、有効にした時点でまとめて出力する
+_origin = time.perf_counter()
+_marks: List[Tuple[str, float]] = []
+_enabled = False
+_finished = False
+
+
+def enable():
+    global _enabled
+    _enabled = True
+    previous = _origin
+    for label, timestamp in _marks:
+        _print_mark(label, timestamp, previous)
+        previous = timestamp
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def mark(label: str):
+    if _finished:
+        return
+    timestamp = time.perf_counter()
+    previous = _marks[-1][1] if _marks else _origin
+    _marks.append((label, timestamp))
+    if _enabled:
+        _print_mark(label, timestamp, previous)
+
+
+def finish(label: str):
+    # 最初の画像を表示した時点で記録を終える（以降の画像の表示は記録しない）
+    global _finished
+    mark(label)
+    _finished = True
+
+
+def _print_mark(label: str, timestamp: float, previous: float):
+    print(f"[startup] {(timestamp - _origin) * 1000:8.1f} ms (+{(timestamp - previous) * 1000:6.1f} ms) {label}",
+          flush=True)
@@ -0,0 +1,300 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from PyQt6.QtCore import Qt, QObject, QRunnable, QSize, QThreadPool, pyqtSignal
+from PyQt6.QtGui import QImage
+
+from image_cache import ImageCache, CacheKey
+from image_loader import decode_image
+
+
+THUMBNAIL_SIZE = 256
+DEFAULT_THUMBNAIL_CACHE_BYTES = 128 * 1024 * 1024
+DEFAULT_THUMBNAIL_DISK_CACHE_BYTES = 1024 * 1024 * 1024
+# ファイル名は内容から決まるため、元の画像が変更・削除されたサムネイルは使われないまま残る
+# 使われるたびに更新日時を更新し、古いものから上限まで削除する
+THUMBNAIL_MAX_AGE_SECONDS = 90 * 24 * 60 * 60
+# 上限を超えたときは、この割合まで減らして削除の頻度を抑える
+PRUNE_TARGET_RATIO = 0.8
+# 削除はサムネイルの要求がないときに行う
+PRUNE_PRIORITY = -1
+# 書き込み途中で異常終了した一時ファイルは、この時間が経ってから削除する
+STALE_TEMP_SECONDS = 60 * 60
+
+
+def thumbnail_file_name(key: CacheKey) -> str:
+    # パス・mtime・サイズから名前を決めるため、ファイルが変われば別のサムネイルになる
+    path, mtime_ns, size = key
+    digest = hashlib.sha1(
+        f'{path}\0{mtime_ns}\0{size}'.encode('utf-8', 'surrogateescape')
+    ).hexdigest()
+    return os.path.join(digest[:2], digest + '.png')
+
+
+def generate_thumbnail(image_path: Path, thumbnail_size: int) -> QImage:
+    target_size = QSize(thumbnail_size, thumbnail_size)
+    image, _ = decode_image(image_path, target_size)
+    if image.isNull():
+        return image
+    if image.width() > thumbnail_size or image.height() > thumbnail_size:
+        image = image.scaled(
+            target_size,
+            Qt.AspectRatioMode.KeepAspectRatio,
+            Qt.TransformationMode.SmoothTransformation
+        )
+    return image
+
+
+class _ThumbnailJob(QRunnable):
+    def __init__(self, thumbnail_cache: 'ThumbnailCache', image_path: Path, owner: str):
+        super().__init__()
+        self._thumbnail_cache = thumbnail_cache
+        self._image_path = image_path
+        self._cache_dir = thumbnail_cache.get_cache_dir()
+        self._thumbnail_size = thumbnail_cache.get_thumbnail_size()
+        self.owner = owner
+        # 取り消しと開始が同時に起きても、どちらか一方だけが成立するようにする
+        self._lock = threading.Lock()
+        self._started = False
+        self._cancelled = False
+
+    def try_cancel(self) -> bool:
+        # まだ開始していなければ取り消してTrueを返す（実行中のものは最後まで処理させる）
+        with self._lock:
+            if not self._started:
+                self._cancelled = True
+            return self._cancelled
+
+    def run(self):
+        with self._lock:
+            if self._cancelled:
+                return
+            self._started = True
+        try:
+            image = self._load_or_generate()
+            self._thumbnail_cache.thumbnail_loaded.emit(self._image_path, image)
+        except RuntimeError:
+            # 終了処理でキャッシュが先に破棄された場合
+            pass
+
+    def _load_or_generate(self) -> QImage:
+        key = ImageCache.make_key(self._image_path)
+        if key is None:
+            return QImage()
+
+        thumbnail_file = self._cache_dir / thumbnail_file_name(key)
+        image = QImage()
+        if image.load(str(thumbnail_file)):
+            try:
+                os.utime(thumbnail_file)
+            except OSError:
+                pass
+            return image
+
+        image = generate_thumbnail(self._image_path, self._thumbnail_size)
+        if image.isNull():
+            return image
+
+        # 他のスレッドやプロセスと競合しても壊れたファイルが残らないよう置き換えで保存する
+        try:
+            thumbnail_file.parent.mkdir(parents=True, exist_ok=True)
+            temp_file = thumbnail_file.with_name(f'{thumbnail_file.stem}.{os.getpid()}.{id(self)}.tmp')
+            if image.save(str(temp_file), 'PNG'):
+                os.replace(temp_file, thumbnail_file)
+        except OSError as e:
+            print(f"サムネイルの保存エラー: {e}")
+        return image
+
+
+class _PruneJob(QRunnable):
+    def __init__(self, cache_dir: Path, max_bytes: int):
+        super().__init__()
+        self.setAutoDelete(False)
+        self._cache_dir = cache_dir
+        self._max_bytes = max_bytes
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def run(self):
+        now = time.time()
+        entries: List[Tuple[float, int, str]] = []
+        total_bytes = 0
+        try:
+            subdirectories = [e.path for e in os.scandir(self._cache_dir) if e.is_dir(follow_symlinks=False)]
+        except OSError:
+            return
+
+        for subdirectory in subdirectories:
+            if self._cancelled:
+                return
+            try:
+                with os.scandir(subdirectory) as it:
+                    for entry in it:
+                        try:
+                            stat = entry.stat(follow_symlinks=False)
+                        except OSError:
+                            continue
+                        if entry.name.endswith('.tmp'):
+                            if now - stat.st_mtime > STALE_TEMP_SECONDS:
+                                self._remove(entry.path)
+                        elif entry.name.endswith('.png'):
+                            if now - stat.st_mtime > THUMBNAIL_MAX_AGE_SECONDS:
+                                self._remove(entry.path)
+                            else:
+                                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                                total_bytes += stat.st_size
+            except OSError:
+                continue
+
+        if total_bytes <= self._max_bytes:
+            return
+        # 最近使われていないものから削除する
+        entries.sort()
+        target_bytes = self._max_bytes * PRUNE_TARGET_RATIO
+        for _, size, path in entries:
+            if total_bytes <= target_bytes or self._cancelled:
+                break
+            if self._remove(path):
+                total_bytes -= size
+
+    @staticmethod
+    def _remove(path: str) -> bool:
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+
+class ThumbnailCache(QObject):
+    thumbnail_ready = pyqtSignal(object, QImage)
+
+    # ワーカースレッドから発行され、GUIスレッドで受け取る
+    thumbnail_loaded = pyqtSignal(object, QImage)
+
+    def __init__(self, cache_dir: Path, max_bytes: int = DEFAULT_THUMBNAIL_CACHE_BYTES,
+                 thumbnail_size: int = THUMBNAIL_SIZE,
+                 disk_max_bytes: int = DEFAULT_THUMBNAIL_DISK_CACHE_BYTES, parent=None):
+        super().__init__(parent)
+        self._cache_dir = cache_dir
+        self._disk_max_bytes = disk_max_bytes
+        self._prune_job: Optional[_PruneJob] = None
+        self._thumbnail_size = thumbnail_size
+        self._max_bytes = max_bytes
+        self._total_bytes = 0
+        self._images: 'OrderedDict[str, QImage]' = OrderedDict()
+        # 待機中と実行中の要求（実行中のものは取り消さず、同じパスを重ねて要求しない）
+        self._pending: Dict[str, _ThumbnailJob] = {}
+        self._failed: Set[str] = set()
+        self._stats: Dict[str, int] = {
+            'memory_hits': 0,
+            'requested': 0,
+            'loaded': 0,
+            'failed': 0,
+        }
+
+        # 縮小デコードとPNGの読み書きはGILを解放するため、全コアで並列に処理できる
+        self._thread_pool = QThreadPool(self)
+        self._thread_pool.setMaxThreadCount(QThreadPool.globalInstance().maxThreadCount())
+
+        self.thumbnail_loaded.connect(self._on_thumbnail_loaded)
+
+    def get_cache_dir(self) -> Path:
+        return self._cache_dir
+
+    def get_thumbnail_size(self) -> int:
+        return self._thumbnail_size
+
+    def get_thumbnail(self, image_path: Path) -> Optional[QImage]:
+        image = self._images.get(str(image_path))
+        if image is not None:
+            self._images.move_to_end(str(image_path))
+            self._stats['memory_hits'] += 1
+        return image
+
+    def request_thumbnail(self, image_path: Path, priority: int = 0, owner: str = '') -> Optional[QImage]:
+        # メモリ上にあればすぐに返し、なければ読み込み後にthumbnail_readyで通知する
+        # ownerを指定した要求は、cancel_pendingで同じownerを指定してまとめて取り消せる
+        image = self.get_thumbnail(image_path)
+        if image is not None:
+            return image
+
+        path_key = str(image_path)
+        if path_key in self._pending or path_key in self._failed:
+            return None
+
+        job = _ThumbnailJob(self, image_path, owner)
+        self._pending[path_key] = job
+        self._stats['requested'] += 1
+        self._thread_pool.start(job, priority)
+        return None
+
+    def request_thumbnails(self, image_paths: Iterable[Path], priority: int = 0, owner: str = ''):
+        for image_path in image_paths:
+            self.request_thumbnail(image_path, priority, owner)
+
+    def cancel_pending(self, owner: Optional[str] = None):
+        # まだ開始していない要求を破棄する（ownerを指定するとその要求だけ）
+        # 取り消した要求はスレッドプールの待ち行列に残るが、開始してもすぐに終わる
+        cancelled = [path_key for path_key, job in self._pending.items()
+                     if (owner is None or job.owner == owner) and job.try_cancel()]
+        for path_key in cancelled:
+            del self._pending[path_key]
+
+    def invalidate(self, image_path: Path):
+        path_key = str(image_path)
+        image = self._images.pop(path_key, None)
+        if image is not None:
+            self._total_bytes -= image.sizeInBytes()
+        self._failed.discard(path_key)
+
+    def prune_disk_cache(self):
+        # ディスク上のサムネイルを上限まで減らす（他の要求より後に、バックグラウンドで行う）
+        if self._prune_job is not None:
+            return
+        self._prune_job = _PruneJob(self._cache_dir, self._disk_max_bytes)
+        self._thread_pool.start(self._prune_job, PRUNE_PRIORITY)
+
+    def get_stats(self) -> Dict[str, int]:
+        stats = dict(self._stats)
+        stats['entries'] = len(self._images)
+        stats['bytes'] = self._total_bytes
+        stats['pending'] = len(self._pending)
+        return stats
+
+    def shutdown(self):
+        if self._prune_job is not None:
+            self._prune_job.cancel()
+        self.cancel_pending()
+        self._thread_pool.clear()
+        self._thread_pool.waitForDone()
+
+    def _on_thumbnail_loaded(self, image_path: Path, image: QImage):
+        path_key = str(image_path)
+        self._pending.pop(path_key, None)
+        if image.isNull():
+            self._failed.add(path_key)
+            self._stats['failed'] += 1
+            return
+
+        self._stats['loaded'] += 1
+        self._store(path_key, image)
+        self.thumbnail_ready.emit(image_path, image)
+
+    def _store(self, path_key: str, image: QImage):
+        old_image = self._images.pop(path_key, None)
+        if old_image is not None:
+            self._total_bytes -= old_image.sizeInBytes()
+
+        self._images[path_key] = image
+        self._total_bytes += image.sizeInBytes()
+        while self._total_bytes > self._max_bytes and len(self._images) > 1:
+            _, evicted = self._images.popitem(last=False)
+            self._total_bytes -= evicted.sizeInBytes()
@@ -0,0 +1,198 @@
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+from PyQt6.QtCore import Qt, QAbstractListModel, QModelIndex, QSize, QTimer, pyqtSignal
+from PyQt6.QtWidgets import QListView, QAbstractItemView
+from PyQt6.QtGui import QImage, QPixmap, QPixmapCache, QKeyEvent
+
+from image_list_manager import ImageListManager
+from thumbnail_cache import ThumbnailCache
+
+
+GRID_ICON_SIZE = 160
+LOOK_AHEAD_ROWS = 2
+# スクロール時に一覧の要求だけを取り消すための識別名
+GRID_REQUEST_OWNER = 'grid'
+
+
+class ThumbnailListModel(QAbstractListModel):
+    def __init__(self, image_list_manager: ImageListManager, thumbnail_cache: ThumbnailCache,
+                 icon_size: int = GRID_ICON_SIZE, parent=None):
+        super().__init__(parent)
+        self._image_list_manager = image_list_manager
+        self._thumbnail_cache = thumbnail_cache
+        self._icon_size = icon_size
+        self._row_count = image_list_manager.get_image_count()
+        self._requested_rows: Dict[str, int] = {}
+
+        # 表示中のセル分のQPixmapはQPixmapCacheに任せ、毎回の変換を避ける
+        QPixmapCache.setCacheLimit(max(QPixmapCache.cacheLimit(), 64 * 1024))
+        self._placeholder = QPixmap(icon_size, icon_size)
+        self._placeholder.fill(Qt.GlobalColor.darkGray)
+
+        thumbnail_cache.thumbnail_ready.connect(self._on_thumbnail_ready)
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        if parent.isValid():
+            return 0
+        return self._row_count
+
+    def data(self, index: QModelIndex, role: int = Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or index.row() >= self._row_count:
+            return None
+
+        image_path = self.get_path(index.row())
+        if image_path is None:
+            return None
+
+        if role == Qt.ItemDataRole.DecorationRole:
+            return self._get_icon(index.row(), image_path)
+        elif role == Qt.ItemDataRole.DisplayRole:
+            return image_path.name
+        elif role == Qt.ItemDataRole.ToolTipRole:
+            return str(image_path)
+        return None
+
+    def get_path(self, row: int) -> Optional[Path]:
+        # 行は現在の並び順に従う
+        return self._image_list_manager.get_image_path(self._image_list_manager.get_sorted_index(row))
+
+    def reload(self):
+        self.beginResetModel()
+        self._row_count = self._image_list_manager.get_image_count()
+        self._requested_rows.clear()
+        self.endResetModel()
+
+    def request_rows(self, first_row: int, last_row: int, priority: int = 0):
+        for row in range(max(0, first_row), min(last_row, self._row_count - 1) + 1):
+            image_path = self.get_path(row)
+            if image_path is not None and self._thumbnail_cache.get_thumbnail(image_path) is None:
+                self._requested_rows[str(image_path)] = row
+                self._thumbnail_cache.request_thumbnail(image_path, priority, GRID_REQUEST_OWNER)
+
+    def invalidate_paths(self, paths: Iterable[Path]):
+        # 中身が変わったファイルのアイコンを捨て、一覧にあれば描画し直す
+        for image_path in paths:
+            QPixmapCache.remove(self._pixmap_key(image_path))
+            index = self._image_list_manager.find_image_index(image_path)
+            if index is None:
+                continue
+            row = self._image_list_manager.get_sorted_position(index)
+            if row < self._row_count and self.get_path(row) == image_path:
+                model_index = self.index(row)
+                self.dataChanged.emit(model_index, model_index, [Qt.ItemDataRole.DecorationRole])
+
+    def _pixmap_key(self, image_path: Path) -> str:
+        return f'grid:{self._icon_size}:{image_path}'
+
+    def _get_icon(self, row: int, image_path: Path) -> QPixmap:
+        pixmap_key = self._pixmap_key(image_path)
+        pixmap = QPixmapCache.find(pixmap_key)
+        if pixmap is not None:
+            return pixmap
+
+        image = self._thumbnail_cache.get_thumbnail(image_path)
+        if image is None:
+            # 表示されたセルだけがサムネイルを要求する
+            self._requested_rows[str(image_path)] = row
+            self._thumbnail_cache.request_thumbnail(image_path, priority=1, owner=GRID_REQUEST_OWNER)
+            return self._placeholder
+
+        pixmap = self._to_icon_pixmap(image)
+        QPixmapCache.insert(pixmap_key, pixmap)
+        return pixmap
+
+    def _to_icon_pixmap(self, image: QImage) -> QPixmap:
+        if image.width() > self._icon_size or image.height() > self._icon_size:
+            image = image.scaled(
+                QSize(self._icon_size, self._icon_size),
+                Qt.AspectRatioMode.KeepAspectRatio,
+                Qt.TransformationMode.SmoothTransformation
+            )
+        return QPixmap.fromImage(image)
+
+    def _on_thumbnail_ready(self, image_path: Path, image: QImage):
+        row = self._requested_rows.pop(str(image_path), None)
+        if row is None or self.get_path(row) != image_path:
+            return
+        index = self.index(row)
+        self.dataChanged.emit(index, index, [Qt.ItemDataRole.DecorationRole])
+
+
+class ThumbnailGridView(QListView):
+    image_activated = pyqtSignal(int)
+    close_requested = pyqtSignal()
+
+    def __init__(self, image_list_manager: ImageListManager, thumbnail_cache: ThumbnailCache, parent=None):
+        super().__init__(parent)
+        self._thumbnail_cache = thumbnail_cache
+        self._model = ThumbnailListModel(image_list_manager, thumbnail_cache, parent=self)
+        self._dirty = False
+        self.setModel(self._model)
+
+        # 均一サイズ・バッチレイアウトにして、表示中のセルだけを扱う
+        self.setViewMode(QListView.ViewMode.IconMode)
+        self.setMovement(QListView.Movement.Static)
+        self.setResizeMode(QListView.ResizeMode.Adjust)
+        self.setLayoutMode(QListView.LayoutMode.Batched)
+        self.setBatchSize(500)
+        self.setUniformItemSizes(True)
+        self.setWrapping(True)
+        self.setIconSize(QSize(GRID_ICON_SIZE, GRID_ICON_SIZE))
+        self.setGridSize(QSize(GRID_ICON_SIZE + 16, GRID_ICON_SIZE + 32))
+        self.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
+        self.setVerticalScrollMode(QAbstractItemView.ScrollMode.ScrollPerPixel)
+        self.setStyleSheet('QListView { background-color: black; color: white; }')
+
+        self._look_ahead_timer = QTimer(self)
+        self._look_ahead_timer.setSingleShot(True)
+        self._look_ahead_timer.setInterval(50)
+        self._look_ahead_timer.timeout.connect(self._request_look_ahead)
+        self.verticalScrollBar().valueChanged.connect(self._on_scrolled)
+
+        self.clicked.connect(lambda index: self.image_activated.emit(index.row()))
+
+    def reload(self):
+        # 非表示の間はリストの変更を記録するだけにする
+        if self.isVisible():
+            self._model.reload()
+            self._dirty = False
+        else:
+            self._dirty = True
+
+    def invalidate_thumbnails(self, paths: Iterable[Path]):
+        self._model.invalidate_paths(paths)
+
+    def show_row(self, row: int):
+        if self._dirty:
+            self._model.reload()
+            self._dirty = False
+        if 0 <= row < self._model.rowCount():
+            index = self._model.index(row)
+            self.setCurrentIndex(index)
+            self.scrollTo(index, QAbstractItemView.ScrollHint.PositionAtCenter)
+        self._look_ahead_timer.start()
+
+    def keyPressEvent(self, event: QKeyEvent):
+        if event.key() in (Qt.Key.Key_Escape, Qt.Key.Key_G):
+            self.close_requested.emit()
+            return
+        if event.key() in (Qt.Key.Key_Return, Qt.Key.Key_Enter) and self.currentIndex().isValid():
+            self.image_activated.emit(self.currentIndex().row())
+            return
+        super().keyPressEvent(event)
+
+    def _on_scrolled(self):
+        # スクロールで見えなくなったセルの要求は破棄し、見えている範囲を優先する
+        self._thumbnail_cache.cancel_pending(GRID_REQUEST_OWNER)
+        self._look_ahead_timer.start()
+
+    def _request_look_ahead(self):
+        grid_size = self.gridSize()
+        columns = max(1, self.viewport().width() // grid_size.width())
+        top = self.verticalScrollBar().value()
+        first_row = (top // grid_size.height()) * columns
+        last_row = ((top + self.viewport().height()) // grid_size.height() + 1) * columns - 1
+
+        self._model.request_rows(first_row, last_row, priority=1)
+        self._model.request_rows(last_row + 1, last_row + columns * LOOK_AHEAD_ROWS, priority=0)
@@ -0,0 +1,476 @@
+import math
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, FrozenSet, Optional, Tuple
+
+from PyQt6.QtCore import (
+    Qt, QPointF, QRect, QRectF, QRunnable, QSize, QThreadPool, pyqtSignal,
+)
+from PyQt6.QtWidgets import QWidget
+from PyQt6.QtGui import (
+    QImage, QImageIOHandler, QKeyEvent, QPainter, QPixmap, QWheelEvent,
+)
+
+from archive_reader import is_archive_member, read_image_bytes
+from image_loader import open_image_reader
+from png_strip_reader import PngStripError, PngStripReader
+
+
+TILE_SIZE = 512
+DEFAULT_TILE_CACHE_BYTES = 256 * 1024 * 1024
+MAX_SCALE = 16.0
+WHEEL_ZOOM_STEP = 1.25
+# 部分デコードできない形式で、粗いレベルの切り出し元として保持する画像の最大辺
+BASE_IMAGE_MAX_SIDE = 4096
+MAX_CACHED_BANDS = 2
+
+# (画像の世代, ピラミッドのレベル, タイルX, タイルY)
+TileKey = Tuple[int, int, int, int]
+
+
+class TiledImageSource:
+    def __init__(self, image_path: Path):
+        # アーカイブ内の画像は、タイルごとに取り出さないよう内容を一度だけ読んでおく
+        self._data: Optional[bytes] = None
+        if is_archive_member(image_path):
+            try:
+                self._data = read_image_bytes(image_path)
+            except OSError as e:
+                print(f"アーカイブの読み込みエラー: {e}")
+                self._data = b''
+        reader = open_image_reader(image_path, self._data)
+        self.image_path = image_path
+        self.full_size = reader.size()
+        self.supports_clip = reader.supportsOption(QImageIOHandler.ImageOption.ScaledClipRect)
+
+        # 部分デコードできない形式は、縮小した基準画像を一度だけ作り、粗いレベルはそこから切り出す
+        # 細かいレベルは、PNGなら帯単位で読み、それ以外は全体を一度だけデコードして保持する
+        self._png: Optional[PngStripReader] = None
+        if not self.supports_clip:
+            self._png = PngStripReader.open(str(image_path), self._data)
+        self._base_level = 0
+        while self._base_level < self.max_level() and max(
+                self.level_size(self._base_level).width(), self.level_size(self._base_level).height()) > BASE_IMAGE_MAX_SIDE:
+            self._base_level += 1
+        self._base_image: Optional[QImage] = None
+        self._full_image: Optional[QImage] = None
+        # (レベル, 帯の番号) -> 帯の画像
+        self._bands: 'OrderedDict[Tuple[int, int], QImage]' = OrderedDict()
+        self._released = False
+        self._lock = threading.Lock()
+
+    def is_valid(self) -> bool:
+        return self.full_size.isValid() and not self.full_size.isEmpty()
+
+    def level_size(self, level: int) -> QSize:
+        factor = 1 << level
+        return QSize(math.ceil(self.full_size.width() / factor),
+                     math.ceil(self.full_size.height() / factor))
+
+    def max_level(self) -> int:
+        level = 0
+        while (self.full_size.width() >> level) > TILE_SIZE or (self.full_size.height() >> level) > TILE_SIZE:
+            level += 1
+        return level
+
+    def tile_rect(self, level: int, tile_x: int, tile_y: int) -> QRect:
+        size = self.level_size(level)
+        rect = QRect(tile_x * TILE_SIZE, tile_y * TILE_SIZE, TILE_SIZE, TILE_SIZE)
+        return rect.intersected(QRect(0, 0, size.width(), size.height()))
+
+    def decode_tile(self, level: int, tile_x: int, tile_y: int) -> QImage:
+        # ワーカースレッドから呼び出される
+        rect = self.tile_rect(level, tile_x, tile_y)
+        if rect.isEmpty():
+            return QImage()
+
+        if self.supports_clip:
+            reader = open_image_reader(self.image_path, self._data)
+            if level > 0:
+                reader.setScaledSize(self.level_size(level))
+                reader.setScaledClipRect(rect)
+            else:
+                reader.setClipRect(rect)
+            return reader.read()
+
+        # 読み込みは1枚ずつ行い、同じ帯や画像を複数のワーカーが重ねてデコードしないようにする
+        with self._lock:
+            if self._released:
+                return QImage()
+            if level >= self._base_level:
+                base = self._get_base_image()
+                return self._cut_scaled(base, rect, 1 << (level - self._base_level))
+            if self._png is not None:
+                band = self._get_band(level, tile_y)
+                if band is not None:
+                    return band.copy(rect.x(), 0, rect.width(), rect.height())
+                if self._released:
+                    return QImage()
+            return self._cut_scaled(self._get_full_image(), rect, 1 << level)
+
+    def _get_base_image(self) -> QImage:
+        if self._base_image is not None:
+            return self._base_image
+        factor = 1 << self._base_level
+        image = QImage()
+        if self._png is not None:
+            # 先頭から最後まで一度読むことで、以降の帯の読み込み位置も記録される
+            try:
+                image = self._png.read_rows(0, self.full_size.height(), factor)
+            except PngStripError as e:
+                self._on_png_error(e)
+        if image.isNull() and not self._released:
+            full = self._get_full_image()
+            if not full.isNull():
+                image = full.scaled(self.level_size(self._base_level), Qt.AspectRatioMode.IgnoreAspectRatio,
+                                    Qt.TransformationMode.SmoothTransformation)
+        if image.isNull() and not self._released:
+            # 全体をデコードできない大きさでも、縮小して読めれば粗いレベルだけは表示する
+            reader = open_image_reader(self.image_path, self._data)
+            reader.setScaledSize(self.level_size(self._base_level))
+            image = reader.read()
+        if not self._released:
+            self._base_image = image
+        return image
+
+    def _get_band(self, level: int, tile_y: int) -> Optional[QImage]:
+        # レベルのタイル1行分を、元の画像の対応する行から縮小して作る
+        key = (level, tile_y)
+        band = self._bands.get(key)
+        if band is not None:
+            self._bands.move_to_end(key)
+            return band
+        factor = 1 << level
+        try:
+            band = self._png.read_rows(tile_y * TILE_SIZE * factor, TILE_SIZE * factor, factor)
+        except PngStripError as e:
+            self._on_png_error(e)
+            return None
+        self._bands[key] = band
+        while len(self._bands) > MAX_CACHED_BANDS:
+            self._bands.popitem(last=False)
+        return band
+
+    def _get_full_image(self) -> QImage:
+        if self._full_image is None:
+            image = open_image_reader(self.image_path, self._data).read()
+            if image.isNull():
+                # Qtのメモリ上限を超える画像などは、以降は粗いレベルの表示だけにする
+                print(f"タイル表示用の画像デコードエラー: {self.image_path}")
+            self._full_image = image
+        return self._full_image
+
+    def _on_png_error(self, e: PngStripError):
+        # 中断以外のエラーでは帯の読み込みをやめ、全体のデコードに切り替える
+        if self._released:
+            return
+        print(f"PNGの部分読み込みエラー: {e}")
+        self._png.close()
+        self._png = None
+        self._bands.clear()
+
+    @staticmethod
+    def _cut_scaled(image: QImage, rect: QRect, factor: int) -> QImage:
+        # imageを1/factorにしたときのrectの部分を切り出す
+        if image.isNull():
+            return QImage()
+        source = QRect(rect.x() * factor, rect.y() * factor, rect.width() * factor, rect.height() * factor)
+        source = source.intersected(image.rect())
+        if factor == 1:
+            return image.copy(source)
+        return image.copy(source).scaled(rect.size(), Qt.AspectRatioMode.IgnoreAspectRatio,
+                                          Qt.TransformationMode.SmoothTransformation)
+
+    def release(self):
+        # GUIスレッドから呼ばれるため、デコード中のワーカーを待たずに中断させる
+        self._released = True
+        png = self._png
+        if png is not None:
+            png.close()
+        self._bands = OrderedDict()
+        self._base_image = None
+        self._full_image = None
+
+
+class _TileJob(QRunnable):
+    def __init__(self, view: 'TiledImageView', source: TiledImageSource, key: TileKey):
+        super().__init__()
+        self._view = view
+        self._source = source
+        self._key = key
+
+    def run(self):
+        try:
+            if not self._view.is_tile_wanted(self._key):
+                self._view.tile_decoded.emit(self._key, QImage())
+                return
+            _, level, tile_x, tile_y = self._key
+            image = self._source.decode_tile(level, tile_x, tile_y)
+            self._view.tile_decoded.emit(self._key, image)
+        except RuntimeError:
+            # 終了処理でビューが先に破棄された場合
+            pass
+
+
+class TiledImageView(QWidget):
+    close_requested = pyqtSignal()
+
+    # ワーカースレッドから発行され、GUIスレッドで受け取る
+    tile_decoded = pyqtSignal(object, QImage)
+
+    def __init__(self, max_cache_bytes: int = DEFAULT_TILE_CACHE_BYTES, parent=None):
+        super().__init__(parent)
+        self.setFocusPolicy(Qt.FocusPolicy.StrongFocus)
+
+        self._source: Optional[TiledImageSource] = None
+        self._base_pixmap: Optional[QPixmap] = None
+        self._generation = 0
+        self._h_flip = False
+        self._scale = 1.0
+        self._center = QPointF()
+        self._drag_origin: Optional[QPointF] = None
+
+        self._tiles: 'OrderedDict[TileKey, QPixmap]' = OrderedDict()
+        self._tile_bytes = 0
+        self._max_cache_bytes = max_cache_bytes
+        self._pending: Dict[TileKey, bool] = {}
+        self._wanted: FrozenSet[TileKey] = frozenset()
+
+        self._thread_pool = QThreadPool(self)
+        self._thread_pool.setMaxThreadCount(max(2, QThreadPool.globalInstance().maxThreadCount()))
+        self.tile_decoded.connect(self._on_tile_decoded)
+
+    def set_image(self, image_path: Optional[Path], base_pixmap: Optional[QPixmap] = None,
+                  h_flip: bool = False):
+        self.release()
+        self._base_pixmap = base_pixmap
+        self._h_flip = h_flip
+
+        if image_path is not None:
+            source = TiledImageSource(image_path)
+            if source.is_valid():
+                self._source = source
+                self._center = QPointF(source.full_size.width() / 2, source.full_size.height() / 2)
+        self.zoom_actual_size()
+
+    def set_h_flip(self, enabled: bool):
+        self._h_flip = enabled
+        self.update()
+
+    def release(self):
+        # 表示をやめた画像のタイルとデコード済みレベル画像を解放する
+        # 世代を進めて、実行中のデコード結果も捨てる
+        self._generation += 1
+        self._wanted = frozenset()
+        self._thread_pool.clear()
+        self._pending.clear()
+        self._tiles.clear()
+        self._tile_bytes = 0
+        if self._source is not None:
+            self._source.release()
+        self._source = None
+        self._base_pixmap = None
+
+    def shutdown(self):
+        self.release()
+        self._thread_pool.waitForDone()
+
+    def is_tile_wanted(self, key: TileKey) -> bool:
+        # ワーカーからも参照されるため、集合は丸ごと置き換えて更新する
+        return key in self._wanted
+
+    def zoom_actual_size(self):
+        # 画像の1ピクセルを画面の1デバイスピクセルに合わせる
+        self._set_scale(1.0 / self.devicePixelRatioF())
+
+    def zoom_to_fit(self):
+        if self._source is None or self.width() <= 0 or self.height() <= 0:
+            return
+        size = self._source.full_size
+        self._center = QPointF(size.width() / 2, size.height() / 2)
+        self._set_scale(min(self.width() / size.width(), self.height() / size.height()))
+
+    def zoom_by(self, factor: float, anchor: Optional[QPointF] = None):
+        if anchor is None:
+            anchor = QPointF(self.width() / 2, self.height() / 2)
+        # 拡大縮小の前後でアンカー位置の画像座標が変わらないようにする
+        image_point = self._to_image(anchor)
+        self._set_scale(self._scale * factor)
+        offset = self._to_image(anchor) - image_point
+        self._center -= offset
+        self.update()
+
+    def pan_by(self, dx: float, dy: float):
+        if self._h_flip:
+            dx = -dx
+        self._center -= QPointF(dx / self._scale, dy / self._scale)
+        self.update()
+
+    def _set_scale(self, scale: float):
+        min_scale = 1.0
+        if self._source is not None and self.width() > 0 and self.height() > 0:
+            size = self._source.full_size
+            min_scale = min(1.0, self.width() / size.width(), self.height() / size.height())
+        self._scale = max(min_scale, min(scale, MAX_SCALE))
+        self.update()
+
+    def _to_image(self, point: QPointF) -> QPointF:
+        dx = (point.x() - self.width() / 2) / self._scale
+        dy = (point.y() - self.height() / 2) / self._scale
+        if self._h_flip:
+            dx = -dx
+        return QPointF(self._center.x() + dx, self._center.y() + dy)
+
+    def _current_level(self) -> int:
+        device_scale = self._scale * self.devicePixelRatioF()
+        if device_scale >= 1.0:
+            return 0
+        level = int(math.floor(math.log2(1.0 / device_scale)))
+        return max(0, min(level, self._source.max_level()))
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), Qt.GlobalColor.black)
+        if self._source is None:
+            return
+
+        painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
+        painter.translate(self.width() / 2, self.height() / 2)
+        painter.scale(-self._scale if self._h_flip else self._scale, self._scale)
+        painter.translate(-self._center.x(), -self._center.y())
+
+        level = self._current_level()
+        factor = 1 << level
+        corners = [self._to_image(QPointF(x, y)) for x in (0, self.width()) for y in (0, self.height())]
+        left = max(0.0, min(p.x() for p in corners))
+        top = max(0.0, min(p.y() for p in corners))
+        right = min(float(self._source.full_size.width()), max(p.x() for p in corners))
+        bottom = min(float(self._source.full_size.height()), max(p.y() for p in corners))
+        if right <= left or bottom <= top:
+            return
+
+        first_x = int(left / factor) // TILE_SIZE
+        last_x = int((right - 1) / factor) // TILE_SIZE
+        first_y = int(top / factor) // TILE_SIZE
+        last_y = int((bottom - 1) / factor) // TILE_SIZE
+
+        # 見えているタイルだけを描画・要求し、未取得の部分は粗いレベルで代用する
+        wanted = []
+        for tile_y in range(first_y, last_y + 1):
+            for tile_x in range(first_x, last_x + 1):
+                key = (self._generation, level, tile_x, tile_y)
+                pixmap = self._tiles.get(key)
+                if pixmap is not None:
+                    self._tiles.move_to_end(key)
+                    self._draw_tile(painter, level, tile_x, tile_y, pixmap)
+                else:
+                    self._draw_fallback(painter, level, tile_x, tile_y)
+                    wanted.append(key)
+        painter.end()
+
+        self._request_tiles(wanted)
+
+    def _draw_tile(self, painter: QPainter, level: int, tile_x: int, tile_y: int, pixmap: QPixmap):
+        factor = 1 << level
+        rect = self._source.tile_rect(level, tile_x, tile_y)
+        target = QRectF(rect.x() * factor, rect.y() * factor, rect.width() * factor, rect.height() * factor)
+        painter.drawPixmap(target, pixmap, QRectF(pixmap.rect()))
+
+    def _draw_fallback(self, painter: QPainter, level: int, tile_x: int, tile_y: int):
+        factor = 1 << level
+        rect = self._source.tile_rect(level, tile_x, tile_y)
+        target = QRectF(rect.x() * factor, rect.y() * factor, rect.width() * factor, rect.height() * factor)
+
+        for coarse_level in range(level + 1, self._source.max_level() + 1):
+            shift = coarse_level - level
+            key = (self._generation, coarse_level, tile_x >> shift, tile_y >> shift)
+            pixmap = self._tiles.get(key)
+            if pixmap is None:
+                continue
+            coarse_factor = 1 << coarse_level
+            coarse_rect = self._source.tile_rect(coarse_level, key[2], key[3])
+            source = QRectF(
+                target.x() / coarse_factor - coarse_rect.x(),
+                target.y() / coarse_factor - coarse_rect.y(),
+                target.width() / coarse_factor,
+                target.height() / coarse_factor,
+            )
+            painter.drawPixmap(target, pixmap, source)
+            return
+
+        if self._base_pixmap is not None and not self._base_pixmap.isNull():
+            ratio_x = self._base_pixmap.width() / self._source.full_size.width()
+            ratio_y = self._base_pixmap.height() / self._source.full_size.height()
+            source = QRectF(target.x() * ratio_x, target.y() * ratio_y,
+                            target.width() * ratio_x, target.height() * ratio_y)
+            painter.drawPixmap(target, self._base_pixmap, source)
+
+    def _request_tiles(self, keys):
+        self._wanted = frozenset(keys)
+        for key in keys:
+            if key in self._pending:
+                continue
+            self._pending[key] = True
+            self._thread_pool.start(_TileJob(self, self._source, key))
+
+    def _on_tile_decoded(self, key: TileKey, image: QImage):
+        self._pending.pop(key, None)
+        if key[0] != self._generation or image.isNull():
+            return
+
+        pixmap = QPixmap.fromImage(image)
+        self._tiles[key] = pixmap
+        self._tile_bytes += pixmap.width() * pixmap.height() * max(pixmap.depth(), 8) // 8
+        while self._tile_bytes > self._max_cache_bytes and len(self._tiles) > 1:
+            _, evicted = self._tiles.popitem(last=False)
+            self._tile_bytes -= evicted.width() * evicted.height() * max(evicted.depth(), 8) // 8
+        self.update()
+
+    def keyPressEvent(self, event: QKeyEvent):
+        step = 0.25
+        if event.key() in (Qt.Key.Key_Escape, Qt.Key.Key_Z):
+            self.close_requested.emit()
+        elif event.key() == Qt.Key.Key_1:
+            self.zoom_actual_size()
+        elif event.key() == Qt.Key.Key_0:
+            self.zoom_to_fit()
+        elif event.key() in (Qt.Key.Key_Plus, Qt.Key.Key_Equal):
+            self.zoom_by(WHEEL_ZOOM_STEP)
+        elif event.key() == Qt.Key.Key_Minus:
+            self.zoom_by(1 / WHEEL_ZOOM_STEP)
+        elif event.key() == Qt.Key.Key_Left:
+            self.pan_by(self.width() * step, 0)
+        elif event.key() == Qt.Key.Key_Right:
+            self.pan_by(-self.width() * step, 0)
+        elif event.key() == Qt.Key.Key_Up:
+            self.pan_by(0, self.height() * step)
+        elif event.key() == Qt.Key.Key_Down:
+            self.pan_by(0, -self.height() * step)
+        else:
+            super().keyPressEvent(event)
+
+    def wheelEvent(self, event: QWheelEvent):
+        steps = event.angleDelta().y() / 120
+        if steps:
+            self.zoom_by(WHEEL_ZOOM_STEP ** steps, event.position())
+        event.accept()
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.MouseButton.LeftButton:
+            self._drag_origin = event.position()
+            self.setCursor(Qt.CursorShape.ClosedHandCursor)
+            event.accept()
+        else:
+            event.ignore()
+
+    def mouseMoveEvent(self, event):
+        if self._drag_origin is not None:
+            delta = event.position() - self._drag_origin
+            self._drag_origin = event.position()
+            self.pan_by(delta.x(), delta.y())
+
+    def mouseReleaseEvent(self, event):
+        if event.button() == Qt.MouseButton.LeftButton:
+            self._drag_origin = None
+            self.unsetCursor()
@@ -3,10 +3,24 @@ from typing import Callable, List, Dict, Any
 from PyQt6.QtWidgets import QMenuBar, QMenu, QMainWindow
 from PyQt6.QtGui import QAction, QKeySequence
 
+from metadata_index import (
+    SORT_BY_NAME, SORT_BY_MTIME, SORT_BY_SIZE, SORT_BY_PIXELS, SORT_BY_CAPTURE_TIME,
+)
+
+
+SORT_MODE_LABELS = {
+    SORT_BY_NAME: "Name",
+    SORT_BY_MTIME: "Modified Time",
+    SORT_BY_SIZE: "File Size",
+    SORT_BY_PIXELS: "Pixel Count",
+    SORT_BY_CAPTURE_TIME: "Capture Date",
+}
+
 
 class UIManager:
     def __init__(self, main_window: QMainWindow):
         self.main_window = main_window
+        self._recent_directories: List[Dict[str, Any]] = []
 
     def create_menu_bar(self, 
                        on_open_files: Callable,
@@ -15,7 +29,18 @@ class UIManager:
                        recent_directories: List[Dict[str, Any]] = None) -> QMenuBar:
         menubar = self.main_window.menuBar()
 
+        # メニューバーの項目だけを先に作り、中身は初めて開いたときに作る
         file_menu = menubar.addMenu("File")
+        self._recent_directories = recent_directories or []
+        file_menu.aboutToShow.connect(
+            lambda: self._build_file_menu(file_menu, on_open_files, on_open_directory, on_recent_directory)
+        )
+        return menubar
+
+    def _build_file_menu(self, file_menu: QMenu, on_open_files: Callable, on_open_directory: Callable,
+                         on_recent_directory: Callable = None):
+        if file_menu.actions():
+            return
 
         open_files_action = QAction("Open Files", self.main_window)
         open_files_action.triggered.connect(on_open_files)
@@ -29,9 +54,7 @@ class UIManager:
         if on_recent_directory:
             file_menu.addSeparator()
             recent_menu = file_menu.addMenu("Recent Directories")
-            self._populate_recent_menu(recent_menu, recent_directories or [], on_recent_directory)
-
-        return menubar
+            self._populate_recent_menu(recent_menu, self._recent_directories, on_recent_directory)
 
     def create_context_menu(self,
                           on_open_files: Callable,
@@ -42,7 +65,13 @@ class UIManager:
                           on_toggle_shuffle: Callable,
                           on_quit: Callable,
                           h_flip_enabled: bool,
-                          shuffle_enabled: bool) -> QMenu:
+                          shuffle_enabled: bool,
+                          on_toggle_grid: Callable = None,
+                          on_toggle_zoom: Callable = None,
+                          sort_mode: str = None,
+                          on_set_sort_mode: Callable = None,
+                          on_toggle_slideshow: Callable = None,
+                          slideshow_running: bool = False) -> QMenu:
         context_menu = QMenu(self.main_window)
         context_menu.setStyleSheet('QMenu { font-size: 12pt; }')
 
@@ -72,6 +101,31 @@ class UIManager:
         shuffle_action.triggered.connect(on_toggle_shuffle)
         context_menu.addAction(shuffle_action)
 
+        if on_set_sort_mode:
+            sort_menu = context_menu.addMenu("Sort")
+            for mode, label in SORT_MODE_LABELS.items():
+                sort_action = QAction(label, self.main_window)
+                sort_action.setCheckable(True)
+                sort_action.setChecked(mode == sort_mode)
+                sort_action.triggered.connect(lambda checked, m=mode: on_set_sort_mode(m))
+                sort_menu.addAction(sort_action)
+
+        if on_toggle_grid:
+            grid_action = QAction("Thumbnail Grid", self.main_window)
+            grid_action.triggered.connect(on_toggle_grid)
+            context_menu.addAction(grid_action)
+
+        if on_toggle_zoom:
+            zoom_action = QAction("Zoom 1:1", self.main_window)
+            zoom_action.triggered.connect(on_toggle_zoom)
+            context_menu.addAction(zoom_action)
+
+        if on_toggle_slideshow:
+            slideshow_text = "Slideshow OFF" if slideshow_running else "Slideshow ON"
+            slideshow_action = QAction(slideshow_text, self.main_window)
+            slideshow_action.triggered.connect(on_toggle_slideshow)
+            context_menu.addAction(slideshow_action)
+
         context_menu.addSeparator()
 
         quit_action = QAction("Quit", self.main_window)
@@ -107,10 +161,11 @@ class UIManager:
                 menu.addAction(action)
 
     def update_recent_directories_menu(self, recent_directories: List[Dict[str, Any]], on_recent_directory: Callable):
+        self._recent_directories = recent_directories
         menubar = self.main_window.menuBar()
         file_menu = menubar.actions()[0].menu()
         
-        # Recent Directoriesメニューを探す
+        # Recent Directoriesメニューを探す（まだ作っていなければ、開いたときに最新の一覧で作られる）
         for action in file_menu.actions():
             if action.menu() and action.text() == "Recent Directories":
                 self._populate_recent_menu(action.menu(), recent_directories, on_recent_directory)